@@ -0,0 +1,256 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import bcrypt
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(BCRYPT_PREFIXES)
+
+
+class PasswordHasher:
+    """bcrypt hashing and verification in a bounded thread pool.
+
+    bcrypt releases the GIL while it works, so a small pool keeps the
+    50-300 ms of KDF work per login off the event loop. Successful
+    verifications are remembered for ``cache_ttl`` seconds under an HMAC
+    of (username, stored hash, password) with a per-process key, so repeat
+    logins skip the KDF; a password change alters the stored hash and
+    therefore the key. Stored plaintext passwords (pre-bcrypt accounts)
+    still verify and are reported as needing a rehash. Logins for unknown
+    usernames check the password against a dummy hash of the same cost, so
+    response time does not reveal which usernames exist.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4,
+                 cache_size: int = 1024, cache_ttl: int = 300):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self._cache = LRUCache(maxsize=cache_size)
+        self._cache_key = os.urandom(32)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dummy_hash: Optional[str] = None
+
+    def _run(self, func, *args):
+        if self.max_workers <= 0:
+            # Inline mode, only useful to benchmark the blocking behaviour
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(func(*args))
+            return future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)).decode("ascii")
+
+    @staticmethod
+    def _check_sync(password: str, stored: str) -> bool:
+        return bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii"))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash_sync, password)
+
+    def _fingerprint(self, username: str, password: str, stored: str) -> bytes:
+        message = b"\0".join(part.encode("utf-8") for part in (username, stored, password))
+        return hmac.new(self._cache_key, message, hashlib.sha256).digest()
+
+    async def verify(self, username: str, password: str, stored: str) -> Tuple[bool, bool]:
+        """Returns (valid, needs_rehash)"""
+        if not is_hashed(stored):
+            return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+
+        fingerprint = self._fingerprint(username, password, stored)
+        verified_at = self._cache.get(fingerprint)
+        if verified_at is not None and time.monotonic() - verified_at < self.cache_ttl:
+            return True, False
+
+        valid = await self._run(self._check_sync, password, stored)
+        if valid:
+            self._cache.set(fingerprint, time.monotonic())
+        return valid, False
+
+    async def verify_unknown(self, password: str) -> bool:
+        """Spend the same bcrypt work as ``verify`` for a user that does not exist; always False"""
+        if self._dummy_hash is None:
+            self._dummy_hash = await self.hash(os.urandom(16).hex())
+        await self._run(self._check_sync, password, self._dummy_hash)
+        return False
+
+    def stats(self):
+        return self._cache.stats()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+class TokenSigner:
+    """Stateless HMAC-SHA256 session tokens: ``<payload>.<signature>``.
+
+    The payload carries the username (sub), expiry (exp) and a token id
+    (jti) for revocation, so verifying a token is pure CPU work.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 12 * 3600):
+        self.secret = secret
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> "TokenSigner":
+        secret = os.environ.get('SESSION_SECRET')
+        if not secret:
+            logger.warning("SESSION_SECRET not set; using a random key, sessions end on restart "
+                           "and are not shared between workers")
+            return cls(os.urandom(32), int(os.environ.get('SESSION_TTL', str(12 * 3600))))
+        return cls(secret.encode("utf-8"), int(os.environ.get('SESSION_TTL', str(12 * 3600))))
+
+    def _sign(self, payload: str) -> str:
+        return _b64url(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, username: str) -> Tuple[str, Dict]:
+        now = int(time.time())
+        claims = {"sub": username, "iat": now, "exp": now + self.ttl, "jti": uuid.uuid4().hex}
+        payload = _b64url(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}", claims
+
+    def verify(self, token: str) -> Dict:
+        try:
+            payload, signature = token.split(".")
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        # Headers can carry any latin-1 text; signing and compare_digest need ASCII
+        if not token.isascii():
+            raise InvalidToken("Malformed token")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidToken("Bad signature")
+        try:
+            claims = json.loads(_b64url_decode(payload))
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        if not isinstance(claims, dict):
+            raise InvalidToken("Malformed token")
+        if claims.get("exp", 0) < time.time():
+            raise InvalidToken("Token expired")
+        return claims
+
+
+class RevocationList:
+    """In-memory set of revoked token ids, synced incrementally from Mongo.
+
+    Revoked ids are stored with the token expiry as a BSON date; a TTL index
+    removes them once the token would have expired anyway, and the local
+    copy prunes the same way, so the list stays small.
+
+    If the first sync fails (Mongo unreachable at boot), the sync loop still
+    starts and retries it with backoff from ``retry_delay`` up to
+    ``sync_interval`` seconds.
+    """
+
+    def __init__(self, collection, sync_interval: int = 30, retry_delay: float = 1):
+        self.collection = collection
+        self.sync_interval = sync_interval
+        self.retry_delay = retry_delay
+        self._revoked: Dict[str, float] = {}
+        self._synced_until: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("jti", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("revoked_at")
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    async def revoke(self, claims: Dict) -> None:
+        self._revoked[claims["jti"]] = claims["exp"]
+        await self.collection.update_one(
+            {"jti": claims["jti"]},
+            {"$setOnInsert": {
+                "jti": claims["jti"],
+                "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc),
+                "revoked_at": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+
+    async def sync(self) -> None:
+        query = {}
+        if self._synced_until is not None:
+            query["revoked_at"] = {"$gte": self._synced_until}
+        synced_until = datetime.now(timezone.utc)
+        async for doc in self.collection.find(query, {"_id": 0, "jti": 1, "expires_at": 1}):
+            expires_at = doc["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._revoked[doc["jti"]] = expires_at.timestamp()
+        self._synced_until = synced_until
+        now = time.time()
+        for jti in [jti for jti, exp in self._revoked.items() if exp < now]:
+            del self._revoked[jti]
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def synced(self) -> bool:
+        return self._synced_until is not None
+
+    async def start(self) -> None:
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.warning(f"Error loading revoked sessions, retrying: {e}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        retry_delay = self.retry_delay
+        while True:
+            await asyncio.sleep(self.sync_interval if self.synced else retry_delay)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Error syncing revoked sessions: {e}")
+                if not self.synced:
+                    retry_delay = min(retry_delay * 2, self.sync_interval)
@@ -0,0 +1,114 @@
+"""
+Batched admin writes.
+
+A batch is a list of create, update and delete operations on one collection,
+written with a single ``bulk_write``. Every operation gets its own result:
+
+* ``created`` / ``updated`` / ``deleted``;
+* ``invalid``: the data failed validation against the create model;
+* ``not_found``: no document with that id (checked with one ``find`` before
+  the write, only when the batch updates or deletes);
+* ``failed``: the database rejected the write;
+* ``skipped``: an ordered batch stopped at an earlier failure.
+
+Ordered batches stop at the first failure, like an ordered ``bulk_write``;
+unordered ones apply everything that can be applied. Updates replace the
+fields of the create model, like the single-item PUT endpoints.
+"""
+from typing import Callable, Dict, List, Literal, Optional, Type
+
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+MAX_OPERATIONS = 1000
+
+
+class Operation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None
+    data: Optional[Dict] = None
+
+
+class BatchRequest(BaseModel):
+    operations: List[Operation] = Field(max_length=MAX_OPERATIONS)
+    ordered: bool = True
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'data'}: {e['msg']}" for e in error.errors())
+
+
+async def apply(collection, batch: BatchRequest, model: Type[BaseModel],
+                new_document: Callable[[BaseModel], Dict],
+                on_applied: Optional[Callable[[str, str, Optional[Dict]], None]] = None) -> Dict:
+    """Validate and write ``batch``; ``new_document`` builds a stored document from a validated create.
+
+    ``on_applied(op, id, document)`` is called for every operation written,
+    with the stored fields for creates and updates and None for deletes.
+    """
+    results: List[Dict] = [{"index": i, "op": op.op, "id": op.id} for i, op in enumerate(batch.operations)]
+    targets = {op.id for op in batch.operations if op.op != "create" and op.id}
+    existing = set()
+    if targets:
+        existing = {doc["id"] async for doc in collection.find({"id": {"$in": list(targets)}}, {"_id": 0, "id": 1})}
+
+    requests, planned = [], []
+    for result, op in zip(results, batch.operations):
+        document = None
+        try:
+            if op.op != "create" and not op.id:
+                raise ValueError("id is required")
+            if op.op != "delete":
+                document = model.model_validate(op.data or {})
+        except ValidationError as e:
+            result.update(status="invalid", error=_describe(e))
+        except ValueError as e:
+            result.update(status="invalid", error=str(e))
+        else:
+            if op.op == "create":
+                document = new_document(document)
+                result["id"] = document["id"]
+                requests.append(InsertOne(document))
+            elif op.id not in existing:
+                result["status"] = "not_found"
+            elif op.op == "update":
+                document = document.model_dump()
+                requests.append(UpdateOne({"id": op.id}, {"$set": document}))
+            else:
+                # Later operations in the batch no longer find it
+                existing.discard(op.id)
+                requests.append(DeleteOne({"id": op.id}))
+            if "status" not in result:
+                planned.append((result, document))
+        if "status" in result and batch.ordered:
+            break
+
+    errors = {}
+    if requests:
+        try:
+            await collection.bulk_write(requests, ordered=batch.ordered)
+        except BulkWriteError as e:
+            errors = {error["index"]: error.get("errmsg", "write failed") for error in e.details.get("writeErrors", [])}
+
+    stopped = False
+    for index, (result, document) in enumerate(planned):
+        if stopped:
+            result["status"] = "skipped"
+        elif index in errors:
+            result.update(status="failed", error=errors[index])
+            stopped = batch.ordered
+        else:
+            result["status"] = {"create": "created", "update": "updated", "delete": "deleted"}[result["op"]]
+            if on_applied is not None:
+                on_applied(result["op"], result["id"], document if result["op"] != "delete" else None)
+    for result in results:
+        result.setdefault("status", "skipped")
+
+    applied = sum(result["status"] in ("created", "updated", "deleted") for result in results)
+    return {
+        "ordered": batch.ordered,
+        "applied": applied,
+        "failed": len(results) - applied,
+        "results": results,
+    }
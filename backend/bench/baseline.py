@@ -0,0 +1,236 @@
+"""
+Benchmark baselines and regression checks.
+
+``record`` runs bench.run several times (each trial in a fresh process) and
+saves the reports as bench/baselines/<name>.json. ``compare`` runs new trials,
+or loads a second saved baseline, and compares every scenario and endpoint
+with the baseline:
+
+* endpoint latency (``--metric``, p95 by default) regresses when its median
+  across trials is more than ``--threshold`` percent higher;
+* scenario throughput regresses when it is that much lower;
+* a one-sided permutation test over the trials must also give p < ``--alpha``
+  (skipped when there are too few trials for any p to fall below alpha: the
+  smallest possible p is 1 / C(m + n, n), so 3 + 3 trials can never go
+  below 0.05 and 4 + 4 can);
+* errors appearing where the baseline had none always count.
+
+Exits with status 1 if anything regressed. Arguments after ``--`` go to
+bench.run, and should match those the baseline was recorded with.
+
+    cd backend && python -m bench.baseline record main --trials 5 -- --mongomock
+    cd backend && python -m bench.baseline compare main --trials 5 -- --mongomock
+    cd backend && python -m bench.baseline compare main --candidate my-branch
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(BACKEND_DIR, "bench", "baselines")
+MAX_EXACT_PERMUTATIONS = 20000
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_trials(trials: int, run_args: List[str]) -> List[Dict]:
+    reports = []
+    for trial in range(trials):
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            output = f.name
+        try:
+            subprocess.run([sys.executable, "-m", "bench.run", *run_args, "--output", output],
+                           cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, check=False)
+            with open(output) as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError):
+            raise SystemExit(f"bench.run trial {trial + 1} produced no report")
+        finally:
+            os.unlink(output)
+        print(f"trial {trial + 1}/{trials} done", file=sys.stderr)
+    return reports
+
+
+def smallest_p_value(m: int, n: int) -> float:
+    """The lowest p-value a permutation test of m against n distinct values can give"""
+    return 1 / math.comb(m + n, n)
+
+
+def permutation_p_value(baseline: List[float], candidate: List[float], alpha: float) -> Optional[float]:
+    """One-sided p-value that candidate values are larger than baseline values.
+
+    None when there are too few trials for the p-value ever to be below ``alpha``.
+    """
+    if not baseline or not candidate or smallest_p_value(len(baseline), len(candidate)) >= alpha:
+        return None
+    pooled = baseline + candidate
+    observed = statistics.mean(candidate) - statistics.mean(baseline)
+    n = len(candidate)
+    total = sum(pooled)
+
+    def difference(indices):
+        picked = sum(pooled[i] for i in indices)
+        return picked / n - (total - picked) / len(baseline)
+
+    if math.comb(len(pooled), n) <= MAX_EXACT_PERMUTATIONS:
+        samples = itertools.combinations(range(len(pooled)), n)
+    else:
+        rng = random.Random(0)
+        samples = [rng.sample(range(len(pooled)), n) for _ in range(MAX_EXACT_PERMUTATIONS)]
+    extreme = total_samples = 0
+    for indices in samples:
+        total_samples += 1
+        extreme += difference(indices) >= observed - 1e-12
+    return extreme / total_samples
+
+
+def _change(baseline: float, candidate: float) -> float:
+    if baseline == 0:
+        return 0.0 if candidate == 0 else float("inf")
+    return (candidate - baseline) / baseline * 100
+
+
+def compare(baseline: Dict, candidate: Dict, metric: str, threshold: float, alpha: float) -> Dict:
+    rows = []
+    for scenario, base_run in baseline["trials"][0]["scenarios"].items():
+        base_trials = [trial["scenarios"].get(scenario) for trial in baseline["trials"]]
+        cand_trials = [trial["scenarios"].get(scenario) for trial in candidate["trials"]]
+        if not all(cand_trials):
+            rows.append({"scenario": scenario, "endpoint": None, "regressed": False, "note": "not in candidate"})
+            continue
+
+        base_rps = [run["throughput_rps"] for run in base_trials]
+        cand_rps = [run["throughput_rps"] for run in cand_trials]
+        change = _change(statistics.median(base_rps), statistics.median(cand_rps))
+        # Lower throughput is worse: test the negated values for "larger"
+        p_value = permutation_p_value([-v for v in base_rps], [-v for v in cand_rps], alpha)
+        rows.append({
+            "scenario": scenario, "endpoint": None, "metric": "throughput_rps",
+            "baseline": statistics.median(base_rps), "candidate": statistics.median(cand_rps),
+            "change_pct": round(change, 1), "p_value": p_value,
+            "regressed": -change > threshold and (p_value is None or p_value < alpha),
+        })
+
+        for endpoint in base_run["endpoints"]:
+            base_series = [run["endpoints"].get(endpoint) for run in base_trials]
+            cand_series = [run["endpoints"].get(endpoint) for run in cand_trials]
+            if not all(cand_series):
+                rows.append({"scenario": scenario, "endpoint": endpoint, "regressed": False, "note": "not in candidate"})
+                continue
+            base_values = [series["latency_ms"][metric] for series in base_series if series]
+            cand_values = [series["latency_ms"][metric] for series in cand_series]
+            base_median = statistics.median(base_values)
+            cand_median = statistics.median(cand_values)
+            change = _change(base_median, cand_median)
+            p_value = permutation_p_value(base_values, cand_values, alpha)
+            new_errors = sum(s["errors"] for s in base_series if s) == 0 and sum(s["errors"] for s in cand_series) > 0
+            rows.append({
+                "scenario": scenario, "endpoint": endpoint, "metric": metric,
+                "baseline": round(base_median, 3), "candidate": round(cand_median, 3),
+                "change_pct": round(change, 1), "p_value": p_value, "new_errors": new_errors,
+                "regressed": new_errors or (change > threshold and (p_value is None or p_value < alpha)),
+            })
+    return {
+        "baseline": {key: baseline.get(key) for key in ("name", "git_commit", "created_at")},
+        "candidate": {key: candidate.get(key) for key in ("name", "git_commit", "created_at")},
+        "threshold_pct": threshold,
+        "alpha": alpha,
+        "regressions": [row for row in rows if row["regressed"]],
+        "results": rows,
+    }
+
+
+def record(args, run_args) -> None:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {
+        "name": args.name,
+        "git_commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "run_args": run_args,
+        "trials": run_trials(args.trials, run_args),
+    }
+    with open(baseline_path(args.name), "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    print(json.dumps({"saved": baseline_path(args.name), "trials": args.trials}, indent=2))
+
+
+def load(name: str) -> Dict:
+    path = name if name.endswith(".json") else baseline_path(name)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f"No baseline at {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Run trials and save them as a baseline")
+    record_parser.add_argument("name")
+    record_parser.add_argument("--trials", type=int, default=5)
+
+    compare_parser = commands.add_parser("compare", help="Compare new trials or a saved run with a baseline")
+    compare_parser.add_argument("name", help="Baseline name or path")
+    compare_parser.add_argument("--candidate", help="Saved baseline to compare instead of running new trials")
+    compare_parser.add_argument("--trials", type=int, default=5)
+    compare_parser.add_argument("--metric", choices=["mean", "p50", "p95", "p99"], default="p95")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="Allowed slowdown in percent")
+    compare_parser.add_argument("--alpha", type=float, default=0.05)
+
+    commands.add_parser("list", help="List saved baselines")
+
+    argv = sys.argv[1:]
+    run_args = []
+    if "--" in argv:
+        run_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        names = sorted(f[:-5] for f in os.listdir(BASELINE_DIR) if f.endswith(".json")) if os.path.isdir(BASELINE_DIR) else []
+        print(json.dumps([{key: load(name).get(key) for key in ("name", "git_commit", "created_at", "run_args")}
+                          for name in names], indent=2))
+        return
+    if args.command == "record":
+        record(args, run_args)
+        return
+
+    baseline = load(args.name)
+    if args.candidate:
+        candidate = load(args.candidate)
+    else:
+        candidate = {
+            "name": "working tree",
+            "git_commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "trials": run_trials(args.trials, run_args or baseline.get("run_args", [])),
+        }
+    result = compare(baseline, candidate, args.metric, args.threshold, args.alpha)
+    print(json.dumps(result, indent=2))
+    raise SystemExit(1 if result["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
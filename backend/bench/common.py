@@ -0,0 +1,103 @@
+import os
+import time
+import uuid
+from collections import Counter, defaultdict
+
+# One signing key for the bench process and any server it starts (in-process
+# or a uvicorn child, which inherits the environment), so admin_headers()
+# can mint session tokens without going through /api/auth/setup
+os.environ.setdefault('SESSION_SECRET', uuid.uuid4().hex)
+
+
+def load_server(mongomock: bool, connect: bool = True):
+    """Import server.py, optionally against an in-memory mongomock-motor database.
+
+    Load scripts use server.db without running the lifespan, so the database
+    is connected here unless ``connect`` is False.
+    """
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', f"bench_{uuid.uuid4().hex[:8]}")
+    # Load scripts drive hundreds of checkouts from one address
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    if mongomock:
+        import mongomock_motor
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    import server
+    if connect:
+        server.connect_database()
+    return server
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {"mean": 0, "p50": 0, "p95": 0, "p99": 0}
+    return {
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+    }
+
+
+def admin_headers():
+    """Authorization header with a session token signed with the shared SESSION_SECRET"""
+    import auth
+    token, _ = auth.TokenSigner.from_env().issue("bench")
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def seed_product(client, stock=1_000_000, price=99.9):
+    """Create a product to check out against and return its id"""
+    response = await client.post("/api/products", json={
+        "name": "Bench wetsuit", "description": "Benchmark product", "price": price,
+        "category": "bench", "stock": stock,
+    }, headers=admin_headers())
+    return response.json()["id"]
+
+
+class Recorder:
+    """Per-endpoint latency and error counts for a scenario run"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    async def request(self, client, method, url, label=None, expect=(200,), **kwargs):
+        label = label or f"{method} {url.split('?')[0]}"
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            response = None
+        self.latencies[label].append((time.perf_counter() - started) * 1000)
+        if response is None or response.status_code not in expect:
+            self.errors[label] += 1
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {
+            label: {
+                "requests": len(latencies),
+                "errors": self.errors[label],
+                "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+                "latency_ms": latency_summary(latencies),
+            }
+            for label, latencies in sorted(self.latencies.items())
+        }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,122 @@
+"""
+Response compression: CPU against bandwidth per endpoint.
+
+Seeds products, gallery images and completed rentals, points weather, tides
+and news at bench.fake_upstreams, and runs the app in-process. For each
+endpoint it reports:
+
+* ``identity_bytes`` and, per codec and level, the compressed size and the
+  microseconds one compression takes (median over ``--repeat``);
+* end-to-end latency (p50/p95) and bytes on the wire when the client asks
+  for identity, gzip and (if installed) Brotli, so the middleware's work and
+  the precompressed cached bodies (products, settings) show up as served.
+
+    cd backend && python -m bench.compression --mongomock
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from bench.common import admin_headers, latency_summary, load_server
+from bench.fake_upstreams import FakeUpstreams
+from bench.scenarios import HOMEPAGE_ENDPOINTS
+
+CODECS = (("gzip", 1), ("gzip", 6), ("gzip", 9), ("br", 4), ("br", 9), ("br", 11))
+
+
+def codec_costs(body: bytes, repeat: int):
+    import compression
+
+    costs = {}
+    for encoding, level in CODECS:
+        if encoding not in compression.ENCODINGS:
+            continue
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            compressed = compression.compress(body, encoding, level)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        costs[f"{encoding}-{level}"] = {
+            "bytes": len(compressed),
+            "ratio": round(len(compressed) / len(body), 3) if body else 1.0,
+            "compress_us": round(statistics.median(timings), 1),
+        }
+    return costs
+
+
+async def served(client, path, headers, accept_encoding, requests):
+    latencies, wire_bytes, content_encoding = [], 0, None
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with client.stream("GET", path, headers={**headers, "Accept-Encoding": accept_encoding}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        latencies.append((time.perf_counter() - started) * 1000)
+        wire_bytes = len(raw)
+        content_encoding = response.headers.get("content-encoding", "identity")
+    return {"content_encoding": content_encoding, "bytes": wire_bytes, "latency_ms": latency_summary(latencies)}
+
+
+async def run(args):
+    import httpx
+    import compression
+    from bench.scenarios import _seed_products
+
+    upstreams = FakeUpstreams(latency=0).start()
+    os.environ.update(upstreams.environ())
+    server = load_server(args.mongomock, connect=False)
+    endpoints = {}
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                admin = admin_headers()
+                await _seed_products(client, admin, args.products)
+                for i in range(8):
+                    await client.post("/api/gallery", json={"image_url": f"/uploads/bench_{i}.jpg", "order": i}, headers=admin)
+                board_id = (await client.post("/api/surfboards", json={"name": "Bench board", "hourly_rate": 30.0},
+                                              headers=admin)).json()["id"]
+                for i in range(args.rentals):
+                    rental_id = (await client.post("/api/rentals/start", json={
+                        "surfboard_id": board_id, "renter_name": f"Surfista {i}", "estimated_time": 60,
+                    }, headers=admin)).json()["id"]
+                    await client.put(f"/api/rentals/{rental_id}", json={"action": "complete", "final_amount": 30.0},
+                                     headers=admin)
+
+                paths = [(path, {}) for path in HOMEPAGE_ENDPOINTS] + [("/api/rentals/history", admin)]
+                for path, headers in paths:
+                    body = (await client.get(path, headers={**headers, "Accept-Encoding": "identity"})).content
+                    endpoints[path] = {
+                        "identity_bytes": len(body),
+                        "codecs": codec_costs(body, args.repeat),
+                        "served": {
+                            accept: await served(client, path, headers, accept, args.requests)
+                            for accept in ("identity", *compression.ENCODINGS)
+                        },
+                    }
+    finally:
+        upstreams.stop()
+
+    return {
+        "scenario": "compression",
+        "minimum_size": server.COMPRESSION_MIN_SIZE,
+        "encodings": list(compression.ENCODINGS),
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--rentals", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=50, help="Compressions timed per codec and level")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and Accept-Encoding")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import uuid
+from collections import Counter
+from typing import Dict
+
+from pydantic import BaseModel
+from emergentintegrations.payments.stripe.checkout import CheckoutSessionResponse, CheckoutStatusResponse
+
+
+class FakeWebhookResponse(BaseModel):
+    event_type: str
+    event_id: str
+    session_id: str
+    payment_status: str
+    metadata: Dict = {}
+
+
+class FakeStripeCheckout:
+    """Local stand-in for StripeCheckout with a configurable API latency.
+
+    Sessions report ``unpaid`` until they have been polled ``polls_until_paid``
+    times. Webhook bodies are plain JSON with the fields of the webhook
+    response, and the signature is ignored.
+    """
+
+    calls: Counter = Counter()
+    latency = 0.05
+    polls_until_paid = 3
+
+    def __init__(self, api_key: str = None, webhook_url: str = None):
+        self.api_key = api_key
+        self.webhook_url = webhook_url
+        self.sessions: Dict[str, Dict] = {}
+
+    async def create_checkout_session(self, request) -> CheckoutSessionResponse:
+        FakeStripeCheckout.calls["create_checkout_session"] += 1
+        await asyncio.sleep(self.latency)
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        self.sessions[session_id] = {"amount": request.amount, "currency": request.currency,
+                                     "metadata": request.metadata or {}, "polls": 0}
+        return CheckoutSessionResponse(url=f"https://checkout.stripe.test/{session_id}", session_id=session_id)
+
+    async def get_checkout_status(self, session_id: str) -> CheckoutStatusResponse:
+        FakeStripeCheckout.calls["get_checkout_status"] += 1
+        await asyncio.sleep(self.latency)
+        session = self.sessions.setdefault(session_id, {"amount": 0, "currency": "brl", "metadata": {}, "polls": 0})
+        session["polls"] += 1
+        paid = session["polls"] >= self.polls_until_paid
+        return CheckoutStatusResponse(
+            status="complete" if paid else "open",
+            payment_status="paid" if paid else "unpaid",
+            amount_total=int(round(session["amount"] * 100)),
+            currency=session["currency"],
+            metadata=session["metadata"],
+        )
+
+    async def handle_webhook(self, body: bytes, signature: str) -> FakeWebhookResponse:
+        FakeStripeCheckout.calls["handle_webhook"] += 1
+        return FakeWebhookResponse(**json.loads(body))
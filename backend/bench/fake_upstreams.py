@@ -0,0 +1,107 @@
+"""
+Local HTTP stand-ins for OpenWeatherMap, the tide table and the RSS feeds.
+
+Served by uvicorn on a background thread, so blocking clients such as
+feedparser can reach them from the event loop under test. Every response
+waits ``latency`` seconds first.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from collections import Counter
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+RSS_ITEM = """<item>
+<title>Swell report {feed} #{index}</title>
+<link>http://upstream.local/{feed}/{index}</link>
+<description>&lt;p&gt;Condições de {feed} para o fim de semana, boletim {index}.&lt;/p&gt;</description>
+<pubDate>Sat, 18 Oct 2026 08:00:00 +0000</pubDate>
+</item>"""
+
+
+def build_app(latency: float, calls: Counter) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/weather")
+    async def weather():
+        calls["weather"] += 1
+        await asyncio.sleep(latency)
+        return {
+            "main": {"temp": 27.5, "feels_like": 29.1, "temp_min": 26.0, "temp_max": 29.0, "humidity": 74, "pressure": 1012},
+            "weather": [{"description": "poucas nuvens"}],
+            "wind": {"speed": 4.2, "deg": 110},
+        }
+
+    @app.get("/tides")
+    async def tides():
+        calls["tides"] += 1
+        await asyncio.sleep(latency)
+        return {
+            "location": "Tabatinga, PB",
+            "tides": [
+                {"type": "alta", "time": "05:52", "height": "2.4m"},
+                {"type": "baixa", "time": "12:04", "height": "0.3m"},
+                {"type": "alta", "time": "18:15", "height": "2.2m"},
+            ],
+            "source": "bench",
+        }
+
+    @app.get("/rss/{feed}")
+    async def rss(feed: str):
+        calls["rss"] += 1
+        await asyncio.sleep(latency)
+        items = "\n".join(RSS_ITEM.format(feed=feed, index=i) for i in range(10))
+        body = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>{feed}</title>{items}</channel></rss>'
+        return Response(body, media_type="application/rss+xml")
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeUpstreams:
+    def __init__(self, latency: float = 0.05, feeds: int = 7):
+        import uvicorn
+
+        self.calls: Counter = Counter()
+        self.port = free_port()
+        self.feeds = feeds
+        self._server = uvicorn.Server(uvicorn.Config(
+            build_app(latency, self.calls), host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def environ(self) -> dict:
+        """Settings that point server.py at these stand-ins"""
+        return {
+            "OPENWEATHER_URL": f"{self.base_url}/weather",
+            "OPENWEATHER_API_KEY": "bench",
+            "TIDES_URL": f"{self.base_url}/tides",
+            "NEWS_FEEDS": json.dumps([
+                {"url": f"{self.base_url}/rss/feed{i}", "category": "Surf"} for i in range(self.feeds)
+            ]),
+        }
+
+    def start(self) -> "FakeUpstreams":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake upstreams did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
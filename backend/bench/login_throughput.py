@@ -0,0 +1,94 @@
+"""
+Login throughput under concurrency.
+
+Runs --logins concurrent /api/auth/login requests while a probe keeps
+hitting a cheap endpoint (/api/waves) every 10 ms, and reports login
+throughput plus how late each probe ran, i.e. how much the KDF blocked
+the event loop.
+--inline hashes on the event loop thread for comparison; --no-cache
+disables the verification cache so every login pays the full KDF.
+
+    cd backend && python -m bench.login_throughput --logins 200 --mongomock
+    cd backend && python -m bench.login_throughput --logins 200 --mongomock --inline
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import admin_headers, latency_summary, load_server
+
+
+async def run(args):
+    import httpx
+    import auth
+
+    server = load_server(args.mongomock)
+    server.password_hasher = auth.PasswordHasher(
+        rounds=args.rounds,
+        max_workers=0 if args.inline else args.workers,
+        cache_size=0 if args.no_cache else 1024,
+    )
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"username": "bench_admin", "password": "s3cret-bench"}
+        await client.post("/api/auth/setup", json=credentials, headers=admin_headers())
+
+        login_latencies = []
+        probe_latencies = []
+        done = asyncio.Event()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/auth/login", json=credentials)
+                login_latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200
+
+        async def probe():
+            interval = 0.01
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(interval)
+                await client.get("/api/waves")
+                # Time beyond the sleep is spent waiting for a blocked loop or on the request itself
+                probe_latencies.append((time.perf_counter() - started - interval) * 1000)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    server.password_hasher.shutdown()
+    return {
+        "scenario": "login_throughput",
+        "mode": "inline" if args.inline else f"pool({args.workers})",
+        "verification_cache": not args.no_cache,
+        "bcrypt_rounds": args.rounds,
+        "logins": args.logins,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(args.logins / elapsed, 1) if elapsed else 0,
+        "login_latency_ms": latency_summary(login_latencies),
+        "probe_latency_ms": latency_summary(probe_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--inline", action="store_true", help="Hash on the event loop thread")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the verification cache")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Load test for /api/payments/status against the local Stripe stand-in.
+
+Simulates SuccessPage polling for many checkout sessions while the webhook
+confirms half of them, and reports latency and how many polls reached Stripe.
+
+    cd backend && python -m bench.payment_status_load --sessions 100 --mongomock
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from bench.common import latency_summary, load_server, seed_product
+
+
+async def run(args):
+    import httpx
+    import payments
+    from bench.fake_stripe import FakeStripeCheckout
+
+    server = load_server(args.mongomock)
+    FakeStripeCheckout.latency = args.stripe_latency
+    FakeStripeCheckout.polls_until_paid = args.polls_until_paid
+    FakeStripeCheckout.calls.clear()
+    payments.set_checkout_factory(FakeStripeCheckout)
+    await server.ensure_indexes()
+    await server.webhook_inbox.start()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        product_id = await seed_product(client)
+        sessions = []
+        for _ in range(args.sessions):
+            response = await client.post("/api/payments/checkout", json={
+                "items": [{"product_id": product_id, "quantity": 1}], "origin_url": "http://bench"
+            })
+            sessions.append(response.json()["session_id"])
+
+        latencies = []
+
+        async def poll(index, session_id):
+            for attempt in range(args.polls):
+                if attempt == args.webhook_after and index % 2 == 0:
+                    await client.post("/api/webhook/stripe", content=json.dumps({
+                        "event_type": "checkout.session.completed",
+                        "event_id": f"evt_{uuid.uuid4().hex}",
+                        "session_id": session_id,
+                        "payment_status": "paid",
+                    }))
+                started = time.perf_counter()
+                response = await client.get(f"/api/payments/status/{session_id}")
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.json()["payment_status"] == "paid" and not args.keep_polling:
+                    return
+                await asyncio.sleep(args.interval)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(poll(i, sid) for i, sid in enumerate(sessions)))
+        elapsed = time.perf_counter() - started
+    await server.webhook_inbox.stop()
+
+    return {
+        "scenario": "payment_status_polling",
+        "sessions": args.sessions,
+        "status_requests": len(latencies),
+        "stripe_status_calls": FakeStripeCheckout.calls["get_checkout_status"],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "latency_ms": latency_summary(latencies),
+        "cache": server.payment_status_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--webhook-after", type=int, default=1)
+    parser.add_argument("--polls-until-paid", type=int, default=4)
+    parser.add_argument("--stripe-latency", type=float, default=0.05)
+    parser.add_argument("--keep-polling", action="store_true", help="Keep polling after the payment is confirmed")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cost of the rate limiter.
+
+Times RateLimiter.check for many distinct client addresses (the worst case
+for the bucket dict), then drives /api/push/subscribe through the app from
+one address until it is throttled and checks the 429 carries Retry-After.
+
+    cd backend && python -m bench.ratelimit_overhead --clients 10000 --mongomock
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench.common import admin_headers, latency_summary, load_server
+
+
+async def run(args):
+    import httpx
+    import ratelimit
+
+    os.environ['RATE_LIMIT_ENABLED'] = '1'
+    server = load_server(args.mongomock)
+
+    limiter = ratelimit.RateLimiter([ratelimit.Rule("POST", "/api/auth/login", capacity=5, rate=5 / 60)])
+    latencies = []
+    for i in range(args.clients):
+        started = time.perf_counter()
+        await limiter.check("POST", "/api/auth/login", f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    unmatched_started = time.perf_counter()
+    for _ in range(args.clients):
+        await limiter.check("GET", "/api/products", "10.0.0.1")
+    unmatched_us = (time.perf_counter() - unmatched_started) / args.clients * 1_000_000
+
+    transport = httpx.ASGITransport(app=server.app)
+    statuses = []
+    retry_after = None
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=admin_headers()) as client:
+        for i in range(args.requests):
+            response = await client.post("/api/push/subscribe", json={
+                "endpoint": f"https://push.example/{i}", "keys": {"p256dh": "x", "auth": "y"}
+            })
+            statuses.append(response.status_code)
+            if response.status_code == 429:
+                retry_after = response.headers.get("retry-after")
+
+    return {
+        "scenario": "rate_limit_overhead",
+        "check_latency_ms": latency_summary(latencies),
+        "unmatched_route_us": round(unmatched_us, 3),
+        "buckets": len(limiter._buckets),
+        "app": {
+            "requests": len(statuses),
+            "allowed": statuses.count(200),
+            "throttled": statuses.count(429),
+            "retry_after": retry_after,
+            "limiter": server.rate_limiter.summary(),
+        },
+        "ok": statuses.count(429) > 0 and retry_after is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    raise SystemExit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Scenario benchmarks against local stand-ins.
+
+Runs server.py in-process (httpx ASGITransport) or under uvicorn in a child
+process, against MONGO_URL or mongomock-motor. OpenWeatherMap, the tide table
+and the RSS feeds are served by bench.fake_upstreams and Stripe is replaced
+by bench.fake_stripe. Prints throughput and p50/p95/p99 per endpoint as JSON.
+
+    cd backend && python -m bench.run --mongomock
+    cd backend && python -m bench.run --scenario checkout_burst --uvicorn --mongomock --output /tmp/run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from bench.common import Recorder, admin_headers, load_server
+from bench.fake_upstreams import FakeUpstreams, free_port
+from bench.scenarios import SCENARIOS
+
+
+@asynccontextmanager
+async def in_process(args):
+    import httpx
+    import payments
+    from bench.fake_stripe import FakeStripeCheckout
+
+    server = load_server(args.mongomock, connect=False)
+    FakeStripeCheckout.latency = args.stripe_latency
+    payments.set_checkout_factory(FakeStripeCheckout)
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+@asynccontextmanager
+async def under_uvicorn(args):
+    import httpx
+
+    port = free_port()
+    command = [sys.executable, "-m", "bench.serve", "--port", str(port), "--stripe-latency", str(args.stripe_latency)]
+    if args.mongomock:
+        command.append("--mongomock")
+    env = {**os.environ, "RATE_LIMIT_ENABLED": os.environ.get("RATE_LIMIT_ENABLED", "0")}
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/api/waves")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("bench.serve did not start")
+                await asyncio.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+async def run(args):
+    upstreams = FakeUpstreams(latency=args.upstream_latency).start()
+    os.environ.update(upstreams.environ())
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = {}
+    try:
+        async with (under_uvicorn(args) if args.uvicorn else in_process(args)) as client:
+            admin = admin_headers()
+            for name in names:
+                upstreams.calls.clear()
+                recorder = Recorder()
+                started = time.perf_counter()
+                await SCENARIOS[name](client, recorder, admin, args)
+                results[name] = {
+                    **recorder.summary(time.perf_counter() - started),
+                    "upstream_calls": dict(upstreams.calls),
+                }
+    finally:
+        upstreams.stop()
+
+    return {
+        "mode": "uvicorn" if args.uvicorn else "in-process",
+        "database": "mongomock" if args.mongomock else "mongodb",
+        "seed": args.seed,
+        "scenarios": results,
+        "ok": all(result["errors"] == 0 for result in results.values()),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--uvicorn", action="store_true", help="Serve the app from a uvicorn child process")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--stripe-latency", type=float, default=0.05)
+    parser.add_argument("--duration", type=float, default=5, help="Seconds a Saturday morning is compressed into")
+    parser.add_argument("--boards", type=int, default=15)
+    parser.add_argument("--rentals", type=int, default=40)
+    parser.add_argument("--dashboards", type=int, default=2)
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--visitors", type=int, default=100)
+    parser.add_argument("--spike-window", type=float, default=1.0)
+    parser.add_argument("--buyers", type=int, default=50)
+    parser.add_argument("--polls", type=int, default=6)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    raise SystemExit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Scripted traffic for bench.run. Each scenario seeds what it needs with plain
+client calls, then drives the API through a Recorder so only the traffic under
+test is measured. Timings are compressed: a morning of rentals plays out in
+``duration`` seconds.
+"""
+import asyncio
+import json
+import random
+import uuid
+
+
+async def _seed_products(client, admin, count):
+    ids = []
+    for i in range(count):
+        response = await client.post("/api/products", json={
+            "name": f"Bench product {i}", "description": "Parafina, leash e acessórios", "price": 49.9 + i,
+            "category": "bench", "stock": 1_000_000,
+        }, headers=admin)
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def saturday_rentals(client, recorder, admin, options):
+    """Staff start, pause and close rentals while dashboard tablets poll"""
+    rng = random.Random(options.seed)
+    boards = asyncio.Queue()
+    for i in range(options.boards):
+        response = await client.post("/api/surfboards", json={"name": f"Bench board {i}", "hourly_rate": 30.0}, headers=admin)
+        boards.put_nowait(response.json()["id"])
+    done = asyncio.Event()
+
+    async def dashboard():
+        while not done.is_set():
+            await recorder.request(client, "GET", "/api/rentals/active", headers=admin)
+            await recorder.request(client, "GET", "/api/rentals/check-alerts", headers=admin)
+            await asyncio.sleep(options.poll_interval)
+
+    async def rental(index):
+        await asyncio.sleep(rng.uniform(0, options.duration * 0.6))
+        board_id = await boards.get()
+        try:
+            response = await recorder.request(client, "POST", "/api/rentals/start", json={
+                "surfboard_id": board_id, "renter_name": f"Surfista {index}", "estimated_time": 60,
+            }, headers=admin)
+            if response is None or response.status_code != 200:
+                return
+            rental_id = response.json()["id"]
+            session = options.duration * rng.uniform(0.1, 0.3)
+            await asyncio.sleep(session / 2)
+            if index % 4 == 0:
+                await recorder.request(client, "PUT", f"/api/rentals/{rental_id}", label="PUT /api/rentals/{rental_id}",
+                                       json={"action": "pause"}, headers=admin)
+                await recorder.request(client, "PUT", f"/api/rentals/{rental_id}", label="PUT /api/rentals/{rental_id}",
+                                       json={"action": "resume"}, headers=admin)
+            await asyncio.sleep(session / 2)
+            await recorder.request(client, "PUT", f"/api/rentals/{rental_id}", label="PUT /api/rentals/{rental_id}",
+                                   json={"action": "complete", "final_amount": 30.0}, headers=admin)
+            await recorder.request(client, "GET", f"/api/rentals/{rental_id}/receipt",
+                                   label="GET /api/rentals/{rental_id}/receipt", headers=admin)
+        finally:
+            boards.put_nowait(board_id)
+
+    dashboards = [asyncio.create_task(dashboard()) for _ in range(options.dashboards)]
+    await asyncio.gather(*(rental(i) for i in range(options.rentals)))
+    await recorder.request(client, "GET", "/api/rentals/history", headers=admin)
+    done.set()
+    await asyncio.gather(*dashboards)
+
+
+HOMEPAGE_ENDPOINTS = ("/api/weather", "/api/waves", "/api/tides", "/api/news",
+                      "/api/products", "/api/surfboards", "/api/gallery", "/api/settings")
+
+
+async def homepage_spike(client, recorder, admin, options):
+    """A burst of visitors loading the homepage widgets at once"""
+    rng = random.Random(options.seed)
+    product_ids = await _seed_products(client, admin, 12)
+    for i in range(8):
+        await client.post("/api/gallery", json={"image_url": f"/uploads/bench_{i}.jpg", "order": i}, headers=admin)
+
+    async def visitor():
+        await asyncio.sleep(rng.uniform(0, options.spike_window))
+        await asyncio.gather(*(recorder.request(client, "GET", path) for path in HOMEPAGE_ENDPOINTS))
+        if rng.random() < 0.3:
+            await recorder.request(client, "GET", f"/api/products/{rng.choice(product_ids)}",
+                                   label="GET /api/products/{product_id}")
+
+    await asyncio.gather(*(visitor() for _ in range(options.visitors)))
+
+
+async def checkout_burst(client, recorder, admin, options):
+    """Many buyers check out at once, then poll for the result while webhooks arrive"""
+    rng = random.Random(options.seed)
+    product_ids = await _seed_products(client, admin, 4)
+
+    async def buyer(index):
+        cart = {"items": [{"product_id": rng.choice(product_ids), "quantity": rng.randint(1, 3)}],
+                "origin_url": "http://bench"}
+        await recorder.request(client, "POST", "/api/cart/quote", json=cart)
+        response = await recorder.request(client, "POST", "/api/payments/checkout", json=cart)
+        if response is None or response.status_code != 200:
+            return
+        session_id = response.json()["session_id"]
+        for attempt in range(options.polls):
+            if attempt == 1 and index % 2 == 0:
+                await recorder.request(client, "POST", "/api/webhook/stripe", content=json.dumps({
+                    "event_type": "checkout.session.completed",
+                    "event_id": f"evt_{uuid.uuid4().hex}",
+                    "session_id": session_id,
+                    "payment_status": "paid",
+                }))
+            status = await recorder.request(client, "GET", f"/api/payments/status/{session_id}",
+                                            label="GET /api/payments/status/{session_id}")
+            if status is not None and status.status_code == 200 and status.json().get("payment_status") == "paid":
+                return
+            await asyncio.sleep(options.poll_interval)
+
+    await asyncio.gather(*(buyer(i) for i in range(options.buyers)))
+
+
+SCENARIOS = {
+    "saturday_rentals": saturday_rentals,
+    "homepage_spike": homepage_spike,
+    "checkout_burst": checkout_burst,
+}
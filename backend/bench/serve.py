@@ -0,0 +1,30 @@
+"""
+Serve server.py under uvicorn with the Stripe stand-in installed, for
+``bench.run --uvicorn``. Upstream URLs come from the environment.
+
+    cd backend && python -m bench.serve --port 8765 --mongomock
+"""
+import argparse
+
+from bench.common import load_server
+
+
+def main():
+    import uvicorn
+    import payments
+    from bench.fake_stripe import FakeStripeCheckout
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stripe-latency", type=float, default=0.05)
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+
+    server = load_server(args.mongomock, connect=False)
+    FakeStripeCheckout.latency = args.stripe_latency
+    payments.set_checkout_factory(FakeStripeCheckout)
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
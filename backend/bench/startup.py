@@ -0,0 +1,100 @@
+"""
+Cold start breakdown.
+
+Each run starts a fresh interpreter with ``-X importtime``, imports server.py,
+runs its lifespan startup and shutdown, and reports the time to import the
+module (with the slowest top-level imports) and each startup step recorded in
+``server.startup_timings``. Prints medians over ``--runs`` as JSON.
+
+    cd backend && python -m bench.startup --mongomock
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from bench.common import load_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(mongomock: bool) -> None:
+    started = time.perf_counter()
+    server = load_server(mongomock, connect=False)
+    imported = time.perf_counter()
+
+    async def lifespan():
+        async with server.app.router.lifespan_context(server.app):
+            return dict(server.startup_timings)
+
+    timings = asyncio.run(lifespan())
+    print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": timings}))
+
+
+def server_imports(importtime: str):
+    """Cumulative milliseconds of each module server.py imports directly.
+
+    ``-X importtime`` lists a module after its imports, each nested level
+    indented by two more spaces.
+    """
+    rows = []
+    for line in importtime.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                rows.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+    end = next((i for i, row in enumerate(rows) if row[1] == "server"), None)
+    if end is None:
+        return {}
+    depth = rows[end][0]
+    children = {}
+    for indent, name, ms in reversed(rows[:end]):
+        if indent <= depth:
+            break
+        if indent == depth + 2:
+            children[name] = ms
+    return children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.mongomock)
+        return
+
+    import_ms, steps, imports = [], defaultdict(list), defaultdict(list)
+    for _ in range(args.runs):
+        command = [sys.executable, "-X", "importtime", "-m", "bench.startup", "--child"]
+        if args.mongomock:
+            command.append("--mongomock")
+        result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SystemExit(result.stderr)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        import_ms.append(report["import_ms"])
+        for name, ms in report["startup_ms"].items():
+            steps[name].append(ms)
+        for name, ms in server_imports(result.stderr).items():
+            imports[name].append(ms)
+
+    slowest = sorted(((name, statistics.median(ms)) for name, ms in imports.items()), key=lambda row: row[1], reverse=True)
+    print(json.dumps({
+        "runs": args.runs,
+        "import_ms": round(statistics.median(import_ms), 1),
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest[:args.top]},
+        "startup_ms": {name: round(statistics.median(ms), 1) for name, ms in steps.items()},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
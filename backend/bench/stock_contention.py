@@ -0,0 +1,91 @@
+"""
+Contention benchmark for stock reservations.
+
+Fires --buyers concurrent checkouts at a product with only --stock units
+left (each cart also holds a plentiful second product, so rejected carts
+exercise the rollback) and verifies nothing is oversold. The in-memory
+price book is made stale first, as it would be in the other workers of a
+multi-worker deployment, so every cart reaches the Mongo reservation.
+
+    cd backend && python -m bench.stock_contention --buyers 100 --stock 10 --mongomock
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import latency_summary, load_server, seed_product
+
+
+async def run(args):
+    import httpx
+    import payments
+    from bench.fake_stripe import FakeStripeCheckout
+
+    server = load_server(args.mongomock)
+    FakeStripeCheckout.latency = args.stripe_latency
+    payments.set_checkout_factory(FakeStripeCheckout)
+    await server.ensure_indexes()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        scarce_id = await seed_product(client, stock=args.stock)
+        plenty_id = await seed_product(client, stock=args.buyers * 10)
+        await server.price_book.load(server.db.products)
+        server.price_book.adjust_stock(scarce_id, args.buyers)
+        cart = {"items": [
+            {"product_id": scarce_id, "quantity": 1},
+            {"product_id": plenty_id, "quantity": 1},
+        ], "origin_url": "http://bench"}
+
+        latencies = []
+        statuses = []
+
+        async def buy():
+            started = time.perf_counter()
+            response = await client.post("/api/payments/checkout", json=cart)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(buy() for _ in range(args.buyers)))
+        elapsed = time.perf_counter() - started
+
+    scarce = await server.db.products.find_one({"id": scarce_id})
+    plenty = await server.db.products.find_one({"id": plenty_id})
+    sold = statuses.count(200)
+    ok = (
+        sold == min(args.buyers, args.stock)
+        and scarce["stock"] == args.stock - sold
+        and plenty["stock"] == args.buyers * 10 - sold
+        and len(plenty.get("reservations", [])) == sold
+    )
+    return {
+        "scenario": "stock_contention",
+        "buyers": args.buyers,
+        "initial_stock": args.stock,
+        "checkouts_accepted": sold,
+        "checkouts_rejected": statuses.count(409),
+        "other_statuses": sorted(set(statuses) - {200, 409}),
+        "final_stock": scarce["stock"],
+        "elapsed_s": round(elapsed, 3),
+        "latency_ms": latency_summary(latencies),
+        "stock_stats": server.stock_reservations.stats,
+        "ok": ok,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=100)
+    parser.add_argument("--stock", type=int, default=10)
+    parser.add_argument("--stripe-latency", type=float, default=0.02)
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    raise SystemExit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
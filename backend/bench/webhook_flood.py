@@ -0,0 +1,101 @@
+"""
+Flood /api/webhook/stripe with redelivered events.
+
+Sends every event --copies times, shuffled and concurrent, the way Stripe
+retries look under load, then waits for the inbox worker to drain and checks
+that each event was stored and applied exactly once.
+
+    cd backend && python -m bench.webhook_flood --events 500 --copies 5 --mongomock
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from bench.common import latency_summary, load_server, seed_product
+
+
+async def run(args):
+    import httpx
+    import payments
+    from bench.fake_stripe import FakeStripeCheckout
+
+    server = load_server(args.mongomock)
+    FakeStripeCheckout.latency = 0
+    payments.set_checkout_factory(FakeStripeCheckout)
+    await server.ensure_indexes()
+    await server.webhook_inbox.start()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        product_id = await seed_product(client)
+        events = []
+        for _ in range(args.events):
+            response = await client.post("/api/payments/checkout", json={
+                "items": [{"product_id": product_id, "quantity": 1}], "origin_url": "http://bench"
+            })
+            events.append(json.dumps({
+                "event_type": "checkout.session.completed",
+                "event_id": f"evt_{uuid.uuid4().hex}",
+                "session_id": response.json()["session_id"],
+                "payment_status": "paid",
+            }))
+
+        deliveries = events * args.copies
+        random.shuffle(deliveries)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        duplicates = 0
+
+        async def deliver(body):
+            nonlocal duplicates
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/webhook/stripe", content=body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                duplicates += response.json().get("duplicate", False)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(body) for body in deliveries))
+        ack_elapsed = time.perf_counter() - started
+
+        while await server.db.stripe_events.count_documents({"processed": False}):
+            await asyncio.sleep(0.05)
+        drain_elapsed = time.perf_counter() - started
+
+    await server.webhook_inbox.stop()
+    stored = await server.db.stripe_events.count_documents({})
+    paid = await server.db.payment_transactions.count_documents({"payment_status": "paid"})
+
+    return {
+        "scenario": "webhook_flood",
+        "deliveries": len(deliveries),
+        "unique_events": args.events,
+        "duplicates_acknowledged": duplicates,
+        "events_stored": stored,
+        "transactions_paid": paid,
+        "apply_batches": server.webhook_inbox.stats["batches"],
+        "ack_elapsed_s": round(ack_elapsed, 3),
+        "drain_elapsed_s": round(drain_elapsed, 3),
+        "ack_throughput_rps": round(len(deliveries) / ack_elapsed, 1) if ack_elapsed else 0,
+        "ack_latency_ms": latency_summary(latencies),
+        "ok": stored == args.events and paid == args.events and duplicates == len(deliveries) - args.events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--copies", type=int, default=3, help="Deliveries per event")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mongomock", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    raise SystemExit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
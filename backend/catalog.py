@@ -0,0 +1,281 @@
+"""
+Bulk catalog import and export for products and surfboards.
+
+Imports stream in as CSV (header row with the field names), JSON Lines or a
+JSON array. Each row is validated with a compiled ``TypeAdapter`` of the
+import model, and valid rows are written in unordered ``bulk_write`` batches
+of ``batch_size``:
+
+* a row with an ``id`` updates that item, or creates it with that id. Only
+  the fields the row has are written: empty CSV cells and missing JSON keys
+  keep the item's current values, and fall back to the model's defaults only
+  when the item is created. To change prices without resetting stock (which
+  sales and holds keep changing), leave the stock column out or empty;
+* a row without one creates a new item.
+
+A dry run validates everything and writes nothing. The report counts rows,
+inserts and updates, and lists row-level errors (row 1 is the first data
+row), up to ``max_errors`` of them.
+
+Exports stream the same fields back out as CSV, JSON Lines or a JSON array,
+so an export can be edited and imported again.
+
+From the command line, against MONGO_URL/DB_NAME (running workers pick the
+changes up within LOCAL_CACHE_TTL and PRICE_BOOK_REFRESH_INTERVAL):
+
+    cd backend && python -m catalog import products shop.csv --dry-run
+    cd backend && python -m catalog export products --format csv > products.csv
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+FORMATS = ("csv", "jsonl", "json")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson", "json": "application/json"}
+
+
+class RowError(ValueError):
+    pass
+
+
+async def _records(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a CSV byte stream into records, keeping newlines inside quoted fields"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        start = search = 0
+        while True:
+            end = pending.find("\n", search)
+            if end == -1:
+                break
+            # A record ends at a newline outside quotes: an even number of quotes before it
+            if pending.count('"', start, end) % 2 == 0:
+                yield pending[start:end + 1]
+                start = end + 1
+            search = end + 1
+        pending = pending[start:]
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending
+
+
+async def read_rows(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield ``(row number, row)``; malformed rows are yielded as RowError"""
+    if format == "csv":
+        header = None
+        number = 0
+        async for record in _records(chunks):
+            values = next(csv.reader([record]), [])
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if not any(value.strip() for value in values):
+                continue
+            number += 1
+            if len(values) > len(header):
+                yield number, RowError(f"{len(values)} columns, header has {len(header)}")
+                continue
+            # Empty cells are left out: the current value on update, the model's default on create
+            yield number, {name: value for name, value in zip(header, values) if value != ""}
+    elif format == "jsonl":
+        number = 0
+        async for record in _records(chunks):
+            if not record.strip():
+                continue
+            number += 1
+            try:
+                yield number, json.loads(record)
+            except ValueError as e:
+                yield number, RowError(f"invalid JSON: {e}")
+    else:
+        # A JSON array is parsed whole; use jsonl for very large files
+        body = b"".join([chunk async for chunk in chunks])
+        try:
+            rows = json.loads(body or b"[]")
+        except ValueError as e:
+            raise RowError(f"invalid JSON: {e}")
+        if not isinstance(rows, list):
+            raise RowError("expected a JSON array of rows")
+        for number, row in enumerate(rows, 1):
+            yield number, row
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors())
+
+
+class Catalog:
+    """Import and export of one catalog collection.
+
+    ``model`` has the importable fields plus an optional id; ``defaults`` are
+    the other fields a newly created item gets, e.g. a surfboard's status.
+    """
+
+    def __init__(self, collection, model: Type[BaseModel], defaults: Optional[Dict] = None, batch_size: int = 1000):
+        self.collection = collection
+        self.model = model
+        self.defaults = defaults or {}
+        self.adapter = TypeAdapter(model)
+        self.fields = list(model.model_fields)
+        self.batch_size = batch_size
+
+    async def _write(self, batch: List[Tuple[int, object]], report: Dict, max_errors: int) -> None:
+        try:
+            result = await self.collection.bulk_write([request for _, request in batch], ordered=False)
+            counts = {"nInserted": result.inserted_count, "nUpserted": result.upserted_count,
+                      "nMatched": result.matched_count}
+        except BulkWriteError as e:
+            counts = e.details
+            for error in e.details.get("writeErrors", []):
+                report["valid"] -= 1
+                self._error(report, batch[error["index"]][0], error.get("errmsg", "write failed"), max_errors)
+        report["inserted"] += counts.get("nInserted", 0) + counts.get("nUpserted", 0)
+        report["updated"] += counts.get("nMatched", 0)
+
+    @staticmethod
+    def _error(report: Dict, row: int, message: str, max_errors: int) -> None:
+        report["invalid"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"row": row, "error": message})
+
+    async def import_rows(self, rows: AsyncIterator[Tuple[int, object]], dry_run: bool = False,
+                          max_errors: int = 100) -> Dict:
+        started = time.perf_counter()
+        report = {"dry_run": dry_run, "rows": 0, "valid": 0, "invalid": 0, "inserted": 0, "updated": 0, "errors": []}
+        on_insert = {**self.defaults, "created_at": datetime.now(timezone.utc).isoformat()}
+        batch: List[Tuple[int, object]] = []
+        async for number, row in rows:
+            report["rows"] += 1
+            if isinstance(row, RowError):
+                self._error(report, number, str(row), max_errors)
+                continue
+            try:
+                item = self.adapter.validate_python(row)
+            except ValidationError as e:
+                self._error(report, number, _describe(e), max_errors)
+                continue
+            report["valid"] += 1
+            if dry_run:
+                continue
+
+            fields = item.model_dump(exclude={"id"})
+            if item.id:
+                given = item.model_dump(exclude_unset=True, exclude={"id"})
+                defaults = {key: value for key, value in {**fields, **on_insert}.items() if key not in given}
+                request = UpdateOne({"id": item.id}, {"$set": given, "$setOnInsert": defaults}, upsert=True)
+            else:
+                request = InsertOne({"id": str(uuid.uuid4()), **fields, **on_insert})
+            batch.append((number, request))
+            if len(batch) >= self.batch_size:
+                await self._write(batch, report, max_errors)
+                batch = []
+        if batch:
+            await self._write(batch, report, max_errors)
+        report["errors_truncated"] = report["invalid"] > len(report["errors"])
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return report
+
+    async def export(self, format: str) -> AsyncIterator[bytes]:
+        cursor = self.collection.find({}, {"_id": 0, **{field: 1 for field in self.fields}}).batch_size(self.batch_size)
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=self.fields, extrasaction="ignore", lineterminator="\n")
+            writer.writeheader()
+            count = 0
+            async for doc in cursor:
+                writer.writerow(doc)
+                count += 1
+                if count % self.batch_size == 0:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode("utf-8")
+        elif format == "jsonl":
+            lines = []
+            async for doc in cursor:
+                lines.append(json.dumps(doc, ensure_ascii=False))
+                if len(lines) >= self.batch_size:
+                    yield ("\n".join(lines) + "\n").encode("utf-8")
+                    lines = []
+            if lines:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+        else:
+            separator = "["
+            async for doc in cursor:
+                yield (separator + json.dumps(doc, ensure_ascii=False)).encode("utf-8")
+                separator = ","
+            yield b"[]" if separator == "[" else b"]"
+
+
+async def file_chunks(path: str, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with (sys.stdin.buffer if path == "-" else open(path, "rb")) as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def guess_format(path: str) -> str:
+    for format in FORMATS:
+        if path.endswith(f".{format}"):
+            return format
+    return "csv"
+
+
+async def run(args) -> Optional[Dict]:
+    import server
+
+    server.connect_database()
+    try:
+        catalog = server.CATALOGS[args.kind]
+        if args.command == "import":
+            format = args.format or guess_format(args.path)
+            return await catalog.import_rows(read_rows(file_chunks(args.path), format), dry_run=args.dry_run,
+                                             max_errors=args.max_errors)
+        async for chunk in catalog.export(args.format or "csv"):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return None
+    finally:
+        server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Validate and upsert rows from a file (- for stdin)")
+    import_parser.add_argument("kind", choices=["products", "surfboards"])
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension, else csv")
+    import_parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+    import_parser.add_argument("--max-errors", type=int, default=100, help="Row errors to list in the report")
+    export_parser = commands.add_parser("export", help="Write the catalog to stdout")
+    export_parser.add_argument("kind", choices=["products", "surfboards"])
+    export_parser.add_argument("--format", choices=FORMATS, default="csv")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args))
+    except RowError as e:
+        raise SystemExit(str(e))
+    if report is not None:
+        print(json.dumps(report, indent=2))
+        raise SystemExit(1 if report["invalid"] else 0)
+
+
+if __name__ == "__main__":
+    main()
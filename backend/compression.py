@@ -0,0 +1,195 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` compresses response bodies of at least
+``minimum_size`` bytes with Brotli or gzip, whichever the client ranks higher
+in Accept-Encoding (Brotli on a tie). It only touches text-like content types
+(JSON, HTML, CSS, JavaScript, XML, SVG): JPEG, PNG and WebP uploads are
+already compressed, and so are PDF receipts. Responses that already carry a
+Content-Encoding, and partial content, pass through unchanged.
+
+``EncodedBody`` is for responses served from a cache: the body is serialized
+once and each encoding is compressed the first time a client asks for it, at
+a higher level than the middleware can afford per request. The response it
+builds already carries Content-Encoding, so the middleware leaves it alone.
+
+Brotli is used when the ``brotli`` package is installed; without it, gzip only.
+"""
+import gzip
+import json
+import zlib
+from typing import Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# In order of preference when the client ranks them equally
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    ranks: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        ranks[coding.strip()] = q
+    wildcard = ranks.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = ranks.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.split(";")[0].endswith(("+json", "+xml"))
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compress with ``level`` (gzip 1-9, Brotli quality 0-11)"""
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            self._gzip = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data)
+        return self._gzip.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._gzip.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text-like responses of at least ``minimum_size`` bytes"""
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        compressor: Optional[_StreamCompressor] = None
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough, compressor
+            if passthrough or message["type"] not in ("http.response.start", "http.response.body"):
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if ("content-encoding" in headers or "content-range" in headers
+                        or not compressible(headers.get("content-type", ""))):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the first body chunk shows whether the body is worth compressing
+                    start = message
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < max(self.minimum_size, 1):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _StreamCompressor(encoding, self.levels[encoding])
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            body = compressor.compress(body)
+            if not more_body:
+                body += compressor.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class EncodedBody:
+    """A response body kept in a cache, compressed at most once per encoding"""
+
+    def __init__(self, content: bytes, media_type: str = "application/json", gzip_level: int = 9,
+                 brotli_quality: int = 9):
+        self.content = content
+        self.media_type = media_type
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        self._encoded: Dict[str, bytes] = {}
+
+    @classmethod
+    def json(cls, data, **kwargs) -> "EncodedBody":
+        # Serialized the way FastAPI's JSONResponse does it
+        content = json.dumps(jsonable_encoder(data), ensure_ascii=False, allow_nan=False,
+                             separators=(",", ":")).encode("utf-8")
+        return cls(content, **kwargs)
+
+    def encoded(self, encoding: str) -> bytes:
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.content, encoding, self.levels[encoding])
+        return body
+
+    def response(self, accept_encoding: str, minimum_size: int = 500) -> Response:
+        if len(self.content) < minimum_size:
+            return Response(self.content, media_type=self.media_type)
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            response = Response(self.content, media_type=self.media_type)
+        else:
+            response = Response(self.encoded(encoding), media_type=self.media_type)
+            response.headers["Content-Encoding"] = encoding
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
@@ -0,0 +1,61 @@
+"""
+Production launcher: gunicorn supervising uvicorn workers.
+
+    cd backend && gunicorn -c gunicorn.conf.py
+
+* WEB_CONCURRENCY workers (default: one per CPU), each running one event loop
+  on uvloop with the httptools parser;
+* server.py is imported once in the master and the workers are forked from
+  it. Each worker then runs the lifespan: it opens its own Mongo client,
+  starts the background workers and warms the caches (settings, products,
+  weather, tides, news) before it accepts connections;
+* MONGO_POOL_BUDGET, when set, is the number of Mongo connections the whole
+  deployment may open, split evenly between workers. MONGO_MAX_POOL_SIZE
+  sets the per-worker pool size directly (see server.py for the other
+  MONGO_* pool, timeout and read preference settings);
+* ``kill -HUP <master pid>`` replaces the workers gracefully: new workers
+  start, old ones stop accepting connections and get GRACEFUL_TIMEOUT seconds
+  to finish in-flight requests and shut down. Because the app is preloaded,
+  HUP does not load new code; deploy that with ``kill -USR2`` (start a new
+  master) followed by ``kill -TERM`` of the old one;
+* each worker is also replaced after MAX_REQUESTS requests (with jitter),
+  the same graceful way.
+
+The webhook inbox drain, the payment reconciler and rental alerts run in one
+worker at a time, whichever holds SINGLETON_LOCK_FILE; when it exits another
+worker takes them over. Everything else runs in every worker.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+
+logger = logging.getLogger("gunicorn.error")
+
+wsgi_app = "server:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8001')}"
+preload_app = True
+
+# Startup includes warming the caches (WARM_CACHES_TIMEOUT, 10 s by default)
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("KEEPALIVE", "5"))
+max_requests = int(os.environ.get("MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+# Set before server.py is preloaded, so every worker inherits them
+os.environ.setdefault("SINGLETON_LOCK_FILE", os.path.join(tempfile.gettempdir(), f"tabatinga2surf-{bind.rsplit(':', 1)[-1]}.lock"))
+if os.environ.get("MONGO_POOL_BUDGET") and not os.environ.get("MONGO_MAX_POOL_SIZE"):
+    os.environ["MONGO_MAX_POOL_SIZE"] = str(max(1, int(os.environ["MONGO_POOL_BUDGET"]) // workers))
+
+
+def when_ready(server):
+    for module in ("uvloop", "httptools"):
+        try:
+            __import__(module)
+        except ImportError:
+            logger.warning(f"{module} is not installed; uvicorn falls back to the pure-Python implementation")
+    logger.info(f"Serving with {workers} workers, Mongo pool of "
+                f"{os.environ.get('MONGO_MAX_POOL_SIZE', '100')} connections per worker")
@@ -0,0 +1,62 @@
+"""
+Readiness probing for ``/readyz``.
+
+``ReadinessProbe`` runs named async checks side by side, each bounded by
+``timeout``, and records how long each took. The report is reused for
+``min_interval`` seconds, and probes arriving while a round is running wait
+for that round instead of starting another, so a burst of load balancer
+probes costs at most one round of checks per interval.
+
+A check returns a dict with at least ``ok``. The process is ready when every
+check is ok, except those listed in ``informational``, which are reported
+but never fail readiness.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+
+class ReadinessProbe:
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[Dict]]], min_interval: float = 1.0,
+                 timeout: float = 2.0, informational: Iterable[str] = ()):
+        self.checks = checks
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.informational = set(informational)
+        self._report: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._round: Optional[asyncio.Future] = None
+        self.stats = {"rounds": 0, "served_cached": 0}
+
+    async def _check(self, check: Callable[[], Awaitable[Dict]]) -> Dict:
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(check(), self.timeout)
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"timed out after {self.timeout:g}s"}
+        except Exception as e:
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+        return {**result, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    async def _run(self) -> Dict:
+        results = await asyncio.gather(*(self._check(check) for check in self.checks.values()))
+        checks = dict(zip(self.checks, results))
+        report = {
+            "ready": all(result["ok"] for name, result in checks.items() if name not in self.informational),
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "checks": checks,
+        }
+        self._report = report
+        self._checked_at = time.monotonic()
+        self.stats["rounds"] += 1
+        return report
+
+    async def report(self) -> Dict:
+        if self._report is not None and time.monotonic() - self._checked_at < self.min_interval:
+            self.stats["served_cached"] += 1
+            return self._report
+        if self._round is None or self._round.done():
+            self._round = asyncio.ensure_future(self._run())
+        # Shielded: a probe that disconnects must not cancel the round others wait on
+        return await asyncio.shield(self._round)
@@ -0,0 +1,330 @@
+"""
+Process metrics in the Prometheus text format.
+
+Counters, gauges and histograms keep one shard of series per thread, so
+recording is a dict lookup plus a few list increments with no locks (Motor
+runs pymongo, and therefore the command listener below, in executor
+threads). Shards are summed when ``/metrics`` is scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple, list]] = []
+
+    def _shard(self) -> Dict[Tuple, list]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            self._shards.append(shard)
+            return shard
+
+    def _merged(self) -> Dict[Tuple, list]:
+        merged: Dict[Tuple, list] = {}
+        for shard in list(self._shards):
+            for labels, series in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(series)
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return merged
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self._merged().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_format(series[0])}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            shard[labels] = [amount]
+        else:
+            series[0] += amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # One slot per bucket plus +Inf, then sum and count
+            series = shard[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="%s"' % _format(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format(float(series[-2]))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class CallbackGauge:
+    """Series computed at scrape time, e.g. cache sizes and hit counts"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple, float]], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_format(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+HTTP_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ("method",)))
+MONGO_DURATION = REGISTRY.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")))
+MONGO_FAILURES = REGISTRY.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")))
+MONGO_POOL_WAIT = REGISTRY.register(Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time waiting for a pooled MongoDB connection", ("outcome",)))
+MONGO_POOL_CHECKED_OUT = REGISTRY.register(Gauge(
+    "mongo_pool_connections_checked_out", "MongoDB connections in use"))
+MONGO_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "mongo_pool_connections", "Open MongoDB connections"))
+OUTBOUND_DURATION = REGISTRY.register(Histogram(
+    "outbound_request_duration_seconds", "Outbound HTTP latency by upstream", ("target", "outcome")))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def register_caches(caches: Dict[str, object]) -> None:
+    """Export LRUCache stats; hits and misses are counters, size a gauge"""
+    def counts(field):
+        return lambda: {(name,): cache.stats()[field] for name, cache in caches.items()}
+
+    REGISTRY.register(CallbackGauge("cache_hits_total", "Cache hits", ("cache",), counts("hits"), kind="counter"))
+    REGISTRY.register(CallbackGauge("cache_misses_total", "Cache misses", ("cache",), counts("misses"), kind="counter"))
+    REGISTRY.register(CallbackGauge("cache_entries", "Entries held in the cache", ("cache",), counts("size")))
+
+
+# Latest outcome per upstream, reported by /readyz
+OUTBOUND_STATUS: Dict[str, Dict] = {}
+
+
+@contextmanager
+def track_outbound(target: str):
+    """Time a call to an upstream service, labelled ok or error"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        duration = time.perf_counter() - started
+        OUTBOUND_DURATION.observe(duration, target, outcome)
+        status = OUTBOUND_STATUS.setdefault(target, {"consecutive_failures": 0})
+        status["last_outcome"] = outcome
+        status["last_ms"] = round(duration * 1000, 1)
+        status["consecutive_failures"] = 0 if outcome == "ok" else status["consecutive_failures"] + 1
+
+
+def _collection(event) -> str:
+    if event.command_name == "getMore":
+        return event.command.get("collection", "")
+    value = event.command.get(event.command_name)
+    return value if isinstance(value, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Command latency by collection; pass in ``event_listeners`` when creating the client"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, object], str] = {}
+
+    def started(self, event) -> None:
+        self._pending[(event.request_id, event.connection_id)] = _collection(event)
+
+    def succeeded(self, event) -> None:
+        collection = self._pending.pop((event.request_id, event.connection_id), "")
+        MONGO_DURATION.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+
+    def failed(self, event) -> None:
+        collection = self._pending.pop((event.request_id, event.connection_id), "")
+        MONGO_DURATION.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+        MONGO_FAILURES.inc(collection, event.command_name)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool waits and usage; pass in ``event_listeners`` when creating the client
+
+    A checkout starts and ends on the same thread, so its start time is kept
+    in a thread local. The outcome of a failed checkout is pymongo's reason:
+    ``timeout`` when waitQueueTimeoutMS ran out, ``poolClosed`` or
+    ``connectionError``.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _waited(self, outcome: str) -> None:
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            self._local.started = None
+            MONGO_POOL_WAIT.observe(time.perf_counter() - started, outcome)
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        self._waited("ok")
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_check_out_failed(self, event) -> None:
+        self._waited(event.reason)
+
+    def connection_checked_in(self, event) -> None:
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    def connection_created(self, event) -> None:
+        MONGO_POOL_CONNECTIONS.inc()
+
+    def connection_closed(self, event) -> None:
+        MONGO_POOL_CONNECTIONS.dec()
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight requests per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(method)
+            # The router stores the matched route in the scope; the template keeps label cardinality bounded
+            route = scope.get("route")
+            label = getattr(route, "path", None) or scope.get("root_path") or "unmatched"
+            HTTP_DURATION.observe(elapsed, method, label)
+            HTTP_REQUESTS.inc(method, label, str(status))
@@ -0,0 +1,104 @@
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+# Stripe payment_status values that will never change again
+TERMINAL_PAYMENT_STATUSES = ("paid", "no_payment_required")
+
+# Webhook event types mapped to the checkout session status they imply
+EVENT_SESSION_STATUS = {
+    "checkout.session.completed": "complete",
+    "checkout.session.async_payment_succeeded": "complete",
+    "checkout.session.async_payment_failed": "complete",
+    "checkout.session.expired": "expired",
+}
+
+# None means the real StripeCheckout; the Stripe SDK is only imported on first use
+_checkout_factory: Optional[Callable[..., "StripeCheckout"]] = None
+_clients: Dict[str, "StripeCheckout"] = {}
+
+
+def set_checkout_factory(factory: Optional[Callable[..., "StripeCheckout"]]) -> None:
+    """Swap the Stripe client class, e.g. for the local stand-in in bench/; None restores Stripe"""
+    global _checkout_factory
+    _checkout_factory = factory
+    _clients.clear()
+
+
+def get_checkout_client(api_key: str, webhook_url: str) -> "StripeCheckout":
+    """Return a long-lived client per webhook URL instead of one per request"""
+    client = _clients.get(webhook_url)
+    if client is None:
+        factory = _checkout_factory
+        if factory is None:
+            from emergentintegrations.payments.stripe.checkout import StripeCheckout
+            factory = StripeCheckout
+        client = factory(api_key=api_key, webhook_url=webhook_url)
+        _clients[webhook_url] = client
+    return client
+
+
+def checkout_session_request(**fields):
+    """Build the Stripe integration's CheckoutSessionRequest without importing it at startup"""
+    from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
+    return CheckoutSessionRequest(**fields)
+
+
+def is_terminal(status: Dict) -> bool:
+    return status.get("payment_status") in TERMINAL_PAYMENT_STATUSES or status.get("status") == "expired"
+
+
+def is_paid(transaction: Dict) -> bool:
+    return transaction.get("payment_status") in TERMINAL_PAYMENT_STATUSES
+
+
+async def settle_orders(orders, transactions: List[Dict]) -> None:
+    """Mark the orders of paid sessions paid and those of expired sessions expired"""
+    paid = [t["session_id"] for t in transactions if is_paid(t)]
+    expired = [t["session_id"] for t in transactions if t.get("status") == "expired" and not is_paid(t)]
+    if paid:
+        await orders.update_many({"session_id": {"$in": paid}}, {"$set": {"status": "paid"}})
+    if expired:
+        await orders.update_many({"session_id": {"$in": expired}}, {"$set": {"status": "expired"}})
+
+
+def status_from_transaction(transaction: Dict) -> Dict:
+    """Build a CheckoutStatusResponse-shaped dict from a stored transaction"""
+    amount_total = transaction.get("amount_total")
+    if amount_total is None:
+        amount_total = int(round(float(transaction.get("amount", 0)) * 100))
+    return {
+        "status": transaction.get("status", "open"),
+        "payment_status": transaction.get("payment_status", "pending"),
+        "amount_total": amount_total,
+        "currency": transaction.get("currency", "brl"),
+        "metadata": transaction.get("metadata", {}),
+    }
+
+
+class PollBackoff:
+    """Spaces out Stripe lookups for sessions that are still pending"""
+
+    def __init__(self, base: float = 1.0, maximum: float = 30.0, max_entries: int = 10000):
+        self.base = base
+        self.maximum = maximum
+        self.max_entries = max_entries
+        self._state: Dict[str, tuple] = {}
+
+    def should_poll(self, session_id: str, now: Optional[float] = None) -> bool:
+        state = self._state.get(session_id)
+        if state is None:
+            return True
+        return (now or time.monotonic()) >= state[1]
+
+    def record(self, session_id: str, now: Optional[float] = None) -> None:
+        attempts = self._state.get(session_id, (0, 0.0))[0]
+        delay = min(self.base * (2 ** attempts), self.maximum)
+        if len(self._state) >= self.max_entries and session_id not in self._state:
+            self._state.pop(next(iter(self._state)))
+        self._state[session_id] = (attempts + 1, (now or time.monotonic()) + delay)
+
+    def forget(self, session_id: str) -> None:
+        self._state.pop(session_id, None)
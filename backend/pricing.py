@@ -0,0 +1,80 @@
+from typing import Dict, List, Optional
+
+
+class PricingError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class PriceBook:
+    """In-memory map of product id -> name, price and stock used to price carts.
+
+    Loaded once from Mongo and kept fresh by the product write endpoints, so
+    pricing a cart costs one dict lookup per line instead of a query per item.
+    """
+
+    PROJECTION = {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1}
+
+    def __init__(self):
+        self._products: Dict[str, Dict] = {}
+        self.loaded = False
+
+    async def load(self, collection) -> None:
+        products = {}
+        async for doc in collection.find({}, self.PROJECTION):
+            products[doc["id"]] = self._entry(doc)
+        self._products = products
+        self.loaded = True
+
+    @staticmethod
+    def _entry(doc: Dict) -> Dict:
+        return {"name": doc["name"], "price": float(doc["price"]), "stock": int(doc.get("stock", 0))}
+
+    def update(self, product_id: str, doc: Dict) -> None:
+        self._products[product_id] = self._entry(doc)
+
+    def adjust_stock(self, product_id: str, delta: int) -> None:
+        entry = self._products.get(product_id)
+        if entry is not None:
+            entry["stock"] += delta
+
+    def remove(self, product_id: str) -> None:
+        self._products.pop(product_id, None)
+
+    def get(self, product_id: str) -> Optional[Dict]:
+        return self._products.get(product_id)
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def price_cart(self, items: List[Dict]) -> Dict:
+        """Price cart lines ({product_id, quantity}) and validate stock"""
+        if not items:
+            raise PricingError("Cart is empty")
+
+        quantities: Dict[str, int] = {}
+        for item in items:
+            if item["quantity"] <= 0:
+                raise PricingError("Invalid quantity")
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+
+        lines = []
+        total = 0.0
+        for product_id, quantity in quantities.items():
+            product = self._products.get(product_id)
+            if product is None:
+                raise PricingError(f"Product {product_id} not found", 404)
+            if product["stock"] < quantity:
+                raise PricingError(f"Insufficient stock for {product['name']}", 409)
+            subtotal = round(product["price"] * quantity, 2)
+            lines.append({
+                "product_id": product_id,
+                "name": product["name"],
+                "quantity": quantity,
+                "unit_price": product["price"],
+                "subtotal": subtotal,
+            })
+            total += subtotal
+        return {"items": lines, "total": round(total, 2)}
@@ -0,0 +1,172 @@
+"""
+On-demand profiling of single requests.
+
+An admin adds ``X-Profile: store|html|text`` (or ``?profile=store|html|text``)
+to any request. That request alone runs under a profiler:
+
+* ``store`` serves the normal response, keeps the report and returns its id
+  in ``X-Profile-Id`` (fetch it from ``/api/profiles/{id}``);
+* ``html`` / ``text`` replace the response body with the report.
+
+pyinstrument is an optional dependency: listed in requirements.txt, but the
+app runs without it. When installed, its async mode follows the request's
+task across awaits, so time spent in Mongo awaits, ``model_dump`` or feed
+parsing is attributed to the right frames. Without it, cProfile is used,
+which also counts other requests served meanwhile.
+
+Requests without the flag only pay for a header scan.
+"""
+import cProfile
+import io
+import pstats
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+MODES = ("store", "html", "text")
+
+
+def _requested_mode(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode("latin-1").strip().lower() or "store"
+    if b"profile=" in scope["query_string"]:
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+        if values:
+            return values[0].lower()
+    return None
+
+
+class _Session:
+    """Wraps whichever profiler is available"""
+
+    def __init__(self):
+        self.engine = "pyinstrument" if Profiler is not None else "cProfile"
+        self._profiler = Profiler(async_mode="enabled") if Profiler is not None else cProfile.Profile()
+
+    def start(self) -> None:
+        if Profiler is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> None:
+        if Profiler is not None:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def text(self) -> str:
+        if Profiler is not None:
+            return self._profiler.output_text(unicode=True, color=False)
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(60)
+        return out.getvalue()
+
+    def html(self) -> str:
+        if Profiler is not None:
+            return self._profiler.output_html()
+        escaped = self.text().replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        return f"<!DOCTYPE html><html><body><pre>{escaped}</pre></body></html>"
+
+
+class ProfileStore:
+    """The most recent ``maxsize`` reports"""
+
+    def __init__(self, maxsize: int = 20):
+        self.maxsize = maxsize
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def add(self, report: Dict) -> None:
+        self._profiles[report["id"]] = report
+        while len(self._profiles) > self.maxsize:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        return [{key: value for key, value in report.items() if key not in ("text", "html")}
+                for report in reversed(self._profiles.values())]
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, store: ProfileStore, authorize: Callable[[Optional[str]], bool]):
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        # cProfile hooks the whole thread, so only one such session can run at a time
+        self._cprofile_busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        authorization = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"authorization"), None)
+        exclusive = Profiler is None
+        if mode not in MODES or not self.authorize(authorization) or (exclusive and self._cprofile_busy):
+            # Not for us, or the profiler is taken: serve the request unprofiled
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if mode == "store":
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            if mode == "store":
+                await send(message)
+
+        session = _Session()
+        self._cprofile_busy = exclusive
+        started = time.perf_counter()
+        session.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session.stop()
+            self._cprofile_busy = False
+            duration_ms = (time.perf_counter() - started) * 1000
+            report = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "engine": session.engine,
+                "duration_ms": round(duration_ms, 1),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "text": session.text(),
+            }
+            report["html"] = session.html() if session.engine == "pyinstrument" else None
+            self.store.add(report)
+
+        if mode != "store":
+            body = (report["html"] or session.html()) if mode == "html" else report["text"]
+            content_type = b"text/html; charset=utf-8" if mode == "html" else b"text/plain; charset=utf-8"
+            payload = body.encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", content_type),
+                    (b"content-length", str(len(payload)).encode()),
+                    (b"x-profile-id", profile_id.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,280 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.hmac import HMAC
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses meaning the subscription is gone for good
+GONE_STATUSES = (404, 410)
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64_decode(value: str) -> bytes:
+    """Decode standard or URL-safe base64, with or without padding"""
+    value = value.replace("-", "+").replace("_", "/")
+    return base64.b64decode(value + "=" * (-len(value) % 4))
+
+
+def _hkdf_extract(salt: bytes, ikm: bytes) -> bytes:
+    mac = HMAC(salt, hashes.SHA256())
+    mac.update(ikm)
+    return mac.finalize()
+
+
+def _hkdf_expand(prk: bytes, info: bytes, length: int) -> bytes:
+    # Every key in RFC 8291 fits in a single SHA-256 block
+    mac = HMAC(prk, hashes.SHA256())
+    mac.update(info + b"\x01")
+    return mac.finalize()[:length]
+
+
+def encrypt_payload(payload: bytes, p256dh: str, auth: str, record_size: int = 4096) -> bytes:
+    """Encrypt a push message body with aes128gcm (RFC 8188 / RFC 8291)"""
+    ua_public = b64_decode(p256dh)
+    auth_secret = b64_decode(auth)
+
+    as_private = ec.generate_private_key(ec.SECP256R1())
+    as_public = as_private.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    ua_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), ua_public)
+    ecdh_secret = as_private.exchange(ec.ECDH(), ua_key)
+
+    prk_key = _hkdf_extract(auth_secret, ecdh_secret)
+    ikm = _hkdf_expand(prk_key, b"WebPush: info\x00" + ua_public + as_public, 32)
+
+    salt = os.urandom(16)
+    prk = _hkdf_extract(salt, ikm)
+    cek = _hkdf_expand(prk, b"Content-Encoding: aes128gcm\x00", 16)
+    nonce = _hkdf_expand(prk, b"Content-Encoding: nonce\x00", 12)
+
+    ciphertext = AESGCM(cek).encrypt(nonce, payload + b"\x02", None)
+    header = salt + struct.pack("!IB", record_size, len(as_public)) + as_public
+    return header + ciphertext
+
+
+class VapidSigner:
+    """Signs VAPID JWTs (ES256) with the application server key"""
+
+    def __init__(self, private_key: str, subject: str, ttl: int = 12 * 3600):
+        raw = b64_decode(private_key)
+        self.key = ec.derive_private_key(int.from_bytes(raw, "big"), ec.SECP256R1())
+        self.public_key = b64url_encode(self.key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        ))
+        self.subject = subject
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> Optional["VapidSigner"]:
+        private_key = os.environ.get('VAPID_PRIVATE_KEY')
+        if not private_key:
+            return None
+        return cls(private_key, os.environ.get('VAPID_SUBJECT', 'mailto:admin@tabatinga2surf.com'))
+
+    def sign(self, audience: str) -> str:
+        header = b64url_encode(json.dumps({"typ": "JWT", "alg": "ES256"}).encode())
+        claims = b64url_encode(json.dumps({
+            "aud": audience,
+            "exp": int(time.time()) + self.ttl,
+            "sub": self.subject,
+        }).encode())
+        signing_input = f"{header}.{claims}".encode("ascii")
+        r, s = decode_dss_signature(self.key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+        signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        return f"{header}.{claims}.{b64url_encode(signature)}"
+
+    def authorization(self, audience: str) -> str:
+        return f"vapid t={self.sign(audience)}, k={self.public_key}"
+
+
+async def ensure_subscription_indexes(collection, ttl: int) -> None:
+    """Unique ``endpoint`` index and ``last_seen_at`` TTL index on push_subscriptions.
+
+    Subscriptions stored before these indexes existed may repeat an endpoint
+    (only the most recently seen is kept) or lack ``last_seen_at`` (backfilled
+    with now, so they expire ``ttl`` seconds from here unless the browser
+    subscribes again). Each step is attempted on its own and logs its failure.
+    """
+    try:
+        duplicates = collection.aggregate([
+            {"$sort": {"last_seen_at": -1}},
+            {"$group": {"_id": "$endpoint", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ])
+        removed = 0
+        async for group in duplicates:
+            result = await collection.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        if removed:
+            logger.info(f"Removed {removed} duplicate push subscriptions")
+    except Exception as e:
+        logger.warning(f"Error removing duplicate push subscriptions: {e}")
+    try:
+        result = await collection.update_many(
+            {"last_seen_at": {"$exists": False}},
+            {"$set": {"last_seen_at": datetime.now(timezone.utc)}}
+        )
+        if result.modified_count:
+            logger.info(f"Backfilled last_seen_at on {result.modified_count} push subscriptions")
+    except Exception as e:
+        logger.warning(f"Error backfilling push subscription last_seen_at: {e}")
+    try:
+        await collection.create_index("endpoint", unique=True)
+    except Exception as e:
+        logger.error(f"Could not build the unique push subscription endpoint index; "
+                     f"subscribing twice may store duplicates: {e}")
+    try:
+        await collection.create_index("last_seen_at", expireAfterSeconds=ttl)
+    except Exception as e:
+        logger.error(f"Could not build the push subscription TTL index; stale subscriptions won't expire: {e}")
+
+
+@dataclass
+class PushJob:
+    title: str
+    body: str
+    data: Dict = field(default_factory=dict)
+    ttl: int = 3600
+
+
+class PushSender:
+    """Queue of notification jobs fanned out to every stored subscription.
+
+    Each job walks the subscriptions collection in batches. Per batch, one
+    VAPID token is signed per push service origin, messages are sent
+    concurrently (bounded by ``concurrency``) and subscriptions the push
+    service reports as gone are removed with a single ``delete_many``.
+    """
+
+    def __init__(self, collection, signer: Optional[VapidSigner] = None,
+                 http_client: Optional[httpx.AsyncClient] = None,
+                 workers: int = 2, concurrency: int = 50, batch_size: int = 500):
+        self.collection = collection
+        self.signer = signer
+        self.http_client = http_client
+        self.workers = workers
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.queue: "asyncio.Queue[PushJob]" = asyncio.Queue()
+        self.stats = {"jobs": 0, "sent": 0, "failed": 0, "pruned": 0}
+        self._tasks: List[asyncio.Task] = []
+        self._owns_client = http_client is None
+
+    def enqueue(self, job: PushJob) -> None:
+        if self.signer is None:
+            return
+        self.queue.put_nowait(job)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    async def start(self) -> None:
+        if self.signer is None:
+            logger.info("VAPID_PRIVATE_KEY not set, push sender disabled")
+            return
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(timeout=10)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_client and self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                logger.exception(f"Push job failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def process(self, job: PushJob) -> None:
+        payload = json.dumps({"title": job.title, "body": job.body, "data": job.data}).encode("utf-8")
+        cursor = self.collection.find({}, {"_id": 0, "endpoint": 1, "keys": 1}).batch_size(self.batch_size)
+        batch = []
+        async for sub in cursor:
+            batch.append(sub)
+            if len(batch) >= self.batch_size:
+                await self._send_batch(batch, payload, job.ttl)
+                batch = []
+        if batch:
+            await self._send_batch(batch, payload, job.ttl)
+        self.stats["jobs"] += 1
+
+    async def _send_batch(self, subscriptions: List[Dict], payload: bytes, ttl: int) -> None:
+        authorizations = {}
+        for sub in subscriptions:
+            audience = _audience(sub["endpoint"])
+            if audience not in authorizations:
+                authorizations[audience] = self.signer.authorization(audience)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(sub: Dict) -> Optional[str]:
+            async with semaphore:
+                return await self._send_one(sub, payload, ttl, authorizations[_audience(sub["endpoint"])])
+
+        results = await asyncio.gather(*(send(sub) for sub in subscriptions))
+        gone = [endpoint for endpoint in results if endpoint]
+        if gone:
+            result = await self.collection.delete_many({"endpoint": {"$in": gone}})
+            self.stats["pruned"] += result.deleted_count
+
+    async def _send_one(self, sub: Dict, payload: bytes, ttl: int, authorization: str) -> Optional[str]:
+        """Send one message, returning the endpoint if the subscription is gone"""
+        try:
+            keys = sub.get("keys") or {}
+            body = encrypt_payload(payload, keys["p256dh"], keys["auth"])
+            with metrics.track_outbound("webpush"):
+                response = await self.http_client.post(sub["endpoint"], content=body, headers={
+                    "Authorization": authorization,
+                    "Content-Encoding": "aes128gcm",
+                    "Content-Type": "application/octet-stream",
+                    "TTL": str(ttl),
+                })
+        except Exception as e:
+            logger.warning(f"Push to {sub.get('endpoint')} failed: {e}")
+            self.stats["failed"] += 1
+            return None
+        if response.status_code in GONE_STATUSES:
+            return sub["endpoint"]
+        if response.status_code >= 400:
+            logger.warning(f"Push to {sub['endpoint']} returned {response.status_code}")
+            self.stats["failed"] += 1
+            return None
+        self.stats["sent"] += 1
+        return None
+
+
+def _audience(endpoint: str) -> str:
+    parts = urlsplit(endpoint)
+    return f"{parts.scheme}://{parts.netloc}"
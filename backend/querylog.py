@@ -0,0 +1,163 @@
+"""
+MongoDB query profiler.
+
+A pymongo ``CommandListener`` that groups commands by shape (collection,
+command, filter with values replaced by ``?``, sort keys) and keeps per shape
+the call count, latency and documents returned or written. Commands slower
+than ``slow_ms`` are logged with their shape. Cursor ``getMore`` batches are
+credited to the query that opened the cursor, so ``to_list(1000)`` transfers
+show up in full.
+
+Listeners run in Motor's executor threads, hence the lock.
+"""
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Where each command keeps its filter
+FILTER_FIELDS = {"find": "filter", "count": "query", "distinct": "query", "findAndModify": "query"}
+MAX_OPEN_CURSORS = 10000
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "saslStart", "saslContinue", "endSessions",
+                    "buildInfo", "getLastError", "killCursors"}
+
+
+def shape_of(value):
+    """Replace literal values with ``?``, keeping keys and operators"""
+    if isinstance(value, dict):
+        return {key: shape_of(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in/$and lists: the shape of the first element stands for all of them
+        return [shape_of(value[0])] if value else []
+    return "?"
+
+
+def _filter(command_name: str, command: Dict) -> Optional[Dict]:
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name]) or {}
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q", {})
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q", {})
+    if command_name == "aggregate":
+        for stage in command.get("pipeline", []):
+            if "$match" in stage:
+                return stage["$match"]
+        return {}
+    return None
+
+
+def _documents(command_name: str, reply: Dict) -> int:
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name in ("insert", "update", "delete"):
+        return reply.get("n", 0)
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+
+class QueryProfiler(monitoring.CommandListener):
+    def __init__(self, slow_ms: float = 100, max_shapes: int = 500):
+        self.slow_ms = slow_ms
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, Tuple] = {}
+        self._cursors: Dict[int, Tuple] = {}
+        self._shapes: Dict[Tuple, Dict] = {}
+        self.dropped = 0
+
+    def started(self, event) -> None:
+        name = event.command_name
+        if name in IGNORED_COMMANDS:
+            return
+        cursor_id = None
+        if name == "getMore":
+            # Batches of an open cursor are credited to the query that opened it
+            cursor_id = event.command.get("getMore")
+            key = self._cursors.get(cursor_id)
+            if key is None:
+                key = (event.command.get("collection", ""), "getMore", "", "")
+        else:
+            collection = event.command.get(name)
+            query = _filter(name, event.command)
+            sort = event.command.get("sort")
+            key = (
+                collection if isinstance(collection, str) else "",
+                name,
+                json.dumps(shape_of(query), sort_keys=True, default=str) if query is not None else "",
+                json.dumps(list(sort.keys())) if isinstance(sort, dict) else "",
+            )
+        self._pending[(event.request_id, event.connection_id)] = (key, cursor_id)
+
+    def _record(self, event, documents: int) -> Optional[Tuple]:
+        key, cursor_id = self._pending.pop((event.request_id, event.connection_id), (None, None))
+        if cursor_id is not None:
+            self._cursors.pop(cursor_id, None)
+        if key is None:
+            return None
+        duration_ms = event.duration_micros / 1000
+        with self._lock:
+            stats = self._shapes.get(key)
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    self.dropped += 1
+                    return None
+                stats = self._shapes[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "documents": 0, "failures": 0}
+            stats["calls"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["documents"] += documents
+        if duration_ms >= self.slow_ms:
+            collection, command, query, sort = key
+            logger.warning(f"Slow query {duration_ms:.1f} ms: {collection}.{command} filter={query or '-'} "
+                           f"sort={sort or '-'} documents={documents}")
+        return key
+
+    def succeeded(self, event) -> None:
+        reply = event.reply or {}
+        key = self._record(event, _documents(event.command_name, reply))
+        cursor = reply.get("cursor")
+        if key is not None and cursor is not None and cursor.get("id"):
+            if len(self._cursors) >= MAX_OPEN_CURSORS:
+                # Cursors abandoned without being exhausted; forget them
+                self._cursors.clear()
+            self._cursors[cursor["id"]] = key
+
+    def failed(self, event) -> None:
+        key = self._record(event, 0)
+        if key is not None:
+            with self._lock:
+                if key in self._shapes:
+                    self._shapes[key]["failures"] += 1
+
+    def top(self, limit: int = 10, sort: str = "total_ms") -> List[Dict]:
+        with self._lock:
+            rows = [
+                {
+                    "collection": collection,
+                    "command": command,
+                    "filter": query,
+                    "sort": sort_keys,
+                    **stats,
+                    "mean_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0,
+                }
+                for (collection, command, query, sort_keys), stats in self._shapes.items()
+            ]
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        for row in rows:
+            for field in ("total_ms", "max_ms", "mean_ms"):
+                row[field] = round(row[field], 2)
+        return rows[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+            self.dropped = 0
@@ -0,0 +1,182 @@
+"""
+Rate limiting for abuse-prone endpoints.
+
+Each rule is a token bucket (``capacity`` requests of burst, refilled at
+``rate`` per second) keyed either per client IP or for the whole route.
+Buckets live in a dict of ``key -> [tokens, updated_at]``; a bucket idle long
+enough to be full again is indistinguishable from a missing one, so stale
+entries are dropped by an amortised sweep instead of timers.
+
+A request is only counted against its buckets when it passes all of them.
+With a Mongo collection configured, requests that pass the local buckets are
+also counted in a shared fixed window (``capacity`` per ``capacity / rate``
+seconds) so the limit holds across uvicorn workers.
+"""
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Rule:
+    method: str
+    path: str
+    capacity: int
+    rate: float
+    scope: str = "ip"  # "ip" or "route"
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path} [{self.scope}]"
+
+    @property
+    def window(self) -> float:
+        return self.capacity / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rules: List[Rule], collection=None, sweep_interval: float = 60):
+        self.rules: Dict[Tuple[str, str], List[Rule]] = {}
+        for rule in rules:
+            self.rules.setdefault((rule.method, rule.path), []).append(rule)
+        self.collection = collection
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Tuple, List[float]] = {}
+        self._last_sweep = time.monotonic()
+        self.stats = {"checked": 0, "limited": 0, "shared_errors": 0, "overhead_ns": 0, "max_overhead_ns": 0}
+
+    async def ensure_indexes(self) -> None:
+        if self.collection is not None:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _tokens(self, rule: Rule, key: Tuple, now: float) -> float:
+        """Tokens in the local bucket after refilling up to ``now``"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return rule.capacity
+        return min(rule.capacity, bucket[0] + (now - bucket[1]) * rule.rate)
+
+    async def _take_shared(self, rule: Rule, key: Tuple) -> float:
+        now = time.time()
+        window_start = math.floor(now / rule.window) * rule.window
+        window_end = window_start + rule.window
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": f"{'|'.join(key)}|{int(window_start)}"},
+                {"$inc": {"count": 1},
+                 "$setOnInsert": {"expires_at": datetime.fromtimestamp(window_end, timezone.utc) + timedelta(seconds=60)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Fail open: the local bucket still applies
+            self.stats["shared_errors"] += 1
+            logger.warning(f"Shared rate limit check failed: {e}")
+            return 0
+        return 0 if doc["count"] <= rule.capacity else window_end - now
+
+    def _sweep(self, now: float) -> None:
+        rules = {rule.name: rule for rules in self.rules.values() for rule in rules}
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated >= rules[key[0]].window]
+        for key in stale:
+            del self._buckets[key]
+        self._last_sweep = now
+
+    async def check(self, method: str, path: str, client_ip: str) -> Optional[float]:
+        """Returns None if the request may proceed, else the Retry-After in seconds"""
+        rules = self.rules.get((method, path))
+        if rules is None:
+            return None
+        started = time.perf_counter_ns()
+        now = time.monotonic()
+        if now - self._last_sweep > self.sweep_interval:
+            self._sweep(now)
+
+        # Every bucket is checked before any is drawn from, so a request
+        # refused by one rule does not use up the others
+        keys = [(rule, (rule.name, client_ip) if rule.scope == "ip" else (rule.name, "*")) for rule in rules]
+        tokens = [self._tokens(rule, key, now) for rule, key in keys]
+        retry_after = max([(1 - available) / rule.rate for (rule, _), available in zip(keys, tokens) if available < 1],
+                          default=0.0)
+        if not retry_after:
+            for (_, key), available in zip(keys, tokens):
+                self._buckets[key] = [available - 1, now]
+            if self.collection is not None:
+                for rule, key in keys:
+                    retry_after = await self._take_shared(rule, key)
+                    if retry_after:
+                        break
+
+        elapsed = time.perf_counter_ns() - started
+        self.stats["checked"] += 1
+        self.stats["overhead_ns"] += elapsed
+        self.stats["max_overhead_ns"] = max(self.stats["max_overhead_ns"], elapsed)
+        if retry_after:
+            self.stats["limited"] += 1
+            return retry_after
+        return None
+
+    def summary(self) -> Dict:
+        checked = self.stats["checked"]
+        return {
+            "rules": [rule.name for rules in self.rules.values() for rule in rules],
+            "shared": self.collection is not None,
+            "buckets": len(self._buckets),
+            "checked": checked,
+            "limited": self.stats["limited"],
+            "shared_errors": self.stats["shared_errors"],
+            "mean_overhead_us": round(self.stats["overhead_ns"] / checked / 1000, 2) if checked else 0,
+            "max_overhead_us": round(self.stats["max_overhead_ns"] / 1000, 2),
+        }
+
+
+def client_ip(scope, proxy_hops: int) -> str:
+    """Client address, taken ``proxy_hops`` entries from the right of X-Forwarded-For.
+
+    Only entries appended by our own proxies can be trusted; the leftmost
+    ones are whatever the client chose to send. With ``proxy_hops`` 0 the
+    header is ignored and the socket peer is used.
+    """
+    if proxy_hops > 0:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                return hops[max(0, len(hops) - proxy_hops)]
+    peer = scope.get("client")
+    return peer[0] if peer else "unknown"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After when a rule is exhausted"""
+
+    def __init__(self, app, limiter: RateLimiter, proxy_hops: int = 0):
+        self.app = app
+        self.limiter = limiter
+        self.proxy_hops = proxy_hops
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.limiter.rules:
+            await self.app(scope, receive, send)
+            return
+        retry_after = await self.limiter.check(scope["method"], scope["path"], client_ip(scope, self.proxy_hops))
+        if retry_after is None:
+            await self.app(scope, receive, send)
+            return
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
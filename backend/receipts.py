@@ -0,0 +1,184 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+# Paraíba does not observe DST, so a fixed offset is enough
+LOCAL_TZ = timezone(timedelta(hours=-3))
+
+RECEIPT_HTML = """<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>Comprovante de Locação - {{ rental.renter_name }}</title>
+<style>
+  body { font-family: Arial, Helvetica, sans-serif; max-width: 480px; margin: 24px auto; color: #111; }
+  .header { text-align: center; border-bottom: 2px solid #0ea5e9; padding-bottom: 12px; }
+  .logo { height: 64px; }
+  .row { display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid #eee; }
+  .label { color: #666; }
+  .total { text-align: center; font-size: 28px; font-weight: bold; color: #16a34a; margin: 20px 0; }
+  .pix { text-align: center; }
+  .pix img { width: 192px; height: 192px; object-fit: contain; }
+  .footer { text-align: center; color: #666; font-size: 12px; margin-top: 24px; }
+  @media print { body { margin: 0; } }
+</style>
+</head>
+<body>
+  <div class="header">
+    {% if settings.logo_url %}<img class="logo" src="{{ settings.logo_url }}" alt="Logo">{% endif %}
+    <h1>Comprovante de Locação</h1>
+    <strong>Tabatinga2Surf</strong><br>
+    <span class="label">Tabatinga, Paraíba</span>
+  </div>
+  <div class="row"><span class="label">Locatário</span><span>{{ rental.renter_name }}</span></div>
+  <div class="row"><span class="label">Prancha</span><span>{{ rental.surfboard_name }}</span></div>
+  <div class="row"><span class="label">Início</span><span>{{ start }}</span></div>
+  <div class="row"><span class="label">Término</span><span>{{ end }}</span></div>
+  <div class="row"><span class="label">Duração Total</span><span>{{ duration }}</span></div>
+  <div class="total">R$ {{ "%.2f"|format(amount) }}</div>
+  {% if settings.pix_qr_url %}
+  <div class="pix">
+    <p class="label">Pague via PIX</p>
+    <img src="{{ settings.pix_qr_url }}" alt="QR Code PIX">
+  </div>
+  {% endif %}
+  <div class="footer">
+    Obrigado pela preferência!{% if settings.instagram_handle %} Siga-nos: @{{ settings.instagram_handle }}{% endif %}
+  </div>
+</body>
+</html>
+"""
+
+# Compiled once, on the first receipt (jinja2 is not needed before that);
+# rendering only fills in the values
+_template = None
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def format_date(value) -> str:
+    parsed = _parse_time(value)
+    if not parsed:
+        return ""
+    return parsed.astimezone(LOCAL_TZ).strftime("%d/%m/%Y %H:%M")
+
+
+def format_duration(start_value, end_value) -> str:
+    start, end = _parse_time(start_value), _parse_time(end_value)
+    if not start or not end:
+        return "0min"
+    minutes = int((end - start).total_seconds() // 60)
+    hours, mins = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}h {mins}min"
+    return f"{mins}min"
+
+
+def _context(rental: Dict, settings: Dict) -> Dict:
+    return {
+        "rental": rental,
+        "settings": settings or {},
+        "start": format_date(rental.get("start_time")),
+        "end": format_date(rental.get("end_time")),
+        "duration": format_duration(rental.get("start_time"), rental.get("end_time")),
+        "amount": rental.get("final_amount") or 0,
+    }
+
+
+def receipt_template():
+    global _template
+    if _template is None:
+        from jinja2 import Environment, select_autoescape
+        env = Environment(autoescape=select_autoescape(default=True, default_for_string=True))
+        _template = env.from_string(RECEIPT_HTML)
+    return _template
+
+
+def render_html(rental: Dict, settings: Dict) -> str:
+    return receipt_template().render(**_context(rental, settings))
+
+
+def receipt_lines(rental: Dict, settings: Dict) -> List[str]:
+    ctx = _context(rental, settings)
+    lines = [
+        "Comprovante de Locação",
+        "Tabatinga2Surf - Tabatinga, Paraíba",
+        "",
+        f"Locatário: {rental.get('renter_name', '')}",
+        f"Prancha: {rental.get('surfboard_name', '')}",
+        f"Início: {ctx['start']}",
+        f"Término: {ctx['end']}",
+        f"Duração Total: {ctx['duration']}",
+        "",
+        f"VALOR TOTAL: R$ {ctx['amount']:.2f}",
+        "",
+        "Obrigado pela preferência!",
+    ]
+    if ctx["settings"].get("instagram_handle"):
+        lines.append(f"Siga-nos: @{ctx['settings']['instagram_handle']}")
+    return lines
+
+
+def _pdf_escape(text: str) -> bytes:
+    raw = text.encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def build_pdf(lines: List[str]) -> bytes:
+    """Build a single-page text PDF (Helvetica, WinAnsi) without external libraries"""
+    stream = [b"BT /F1 20 Tf 56 780 Td 24 TL"]
+    for index, line in enumerate(lines):
+        if index == 1:
+            stream.append(b"/F1 12 Tf 18 TL")
+        stream.append(b"(" + _pdf_escape(line) + b") Tj T*")
+    stream.append(b"ET")
+    content = b"\n".join(stream)
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+    ]
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+async def render_pdf(rental: Dict, settings: Dict) -> bytes:
+    """Render the receipt PDF in the worker pool so the event loop stays free"""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=int(os.environ.get('RECEIPT_PDF_WORKERS', '2')))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pdf_executor, build_pdf, receipt_lines(rental, settings))
+
+
+def shutdown():
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False)
+        _pdf_executor = None
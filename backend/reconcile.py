@@ -0,0 +1,176 @@
+"""
+Payment reconciliation.
+
+Finds payment_transactions still pending after ``min_age`` minutes, asks
+Stripe for their status with bounded concurrency and writes the results back
+in a single bulk_write. Every transaction checked is stamped with
+``last_checked_at`` and each run takes the least recently checked first, so
+sessions Stripe keeps failing on, or that stay open, do not starve newer ones.
+
+Runs on a schedule inside the app, or once from the command line:
+
+    cd backend && python reconcile.py --min-age 30 --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Complete but unpaid sessions (delayed payment methods) are settled by the
+# async_payment webhooks, not by polling
+PENDING_FILTER = {"payment_status": {"$in": ["pending", "unpaid"]}, "status": {"$nin": ["expired", "complete"]}}
+
+
+class PaymentReconciler:
+    def __init__(self, transactions, get_client: Callable, min_age: int = 30,
+                 concurrency: int = 8, batch_size: int = 500, interval: int = 600):
+        self.transactions = transactions
+        self.get_client = get_client
+        self.min_age = min_age
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_applied: List[Callable[[List[Dict]], Awaitable[None]]] = []
+        self.last_run: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self) -> None:
+        await self.transactions.create_index([("payment_status", 1), ("created_at", 1)])
+        await self.transactions.create_index([("payment_status", 1), ("last_checked_at", 1)])
+
+    async def run_once(self) -> Dict:
+        started = time.perf_counter()
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=self.min_age)).isoformat()
+        pending = await self.transactions.find(
+            {**PENDING_FILTER, "created_at": {"$lt": cutoff}},
+            {"_id": 0}
+        ).sort([("last_checked_at", 1), ("created_at", 1)]).limit(self.batch_size).to_list(self.batch_size)
+        scan_ms = (time.perf_counter() - started) * 1000
+
+        client = self.get_client()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = 0
+
+        async def check(transaction: Dict) -> Optional[Dict]:
+            nonlocal errors
+            async with semaphore:
+                try:
+                    return (await client.get_checkout_status(transaction["session_id"])).model_dump()
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Error reconciling {transaction['session_id']}: {e}")
+                    return None
+
+        stripe_started = time.perf_counter()
+        statuses = await asyncio.gather(*(check(t) for t in pending))
+        stripe_ms = (time.perf_counter() - stripe_started) * 1000
+
+        checked_at = datetime.now(timezone.utc).isoformat()
+        operations = []
+        changed = []
+        for transaction, status in zip(pending, statuses):
+            update = {"last_checked_at": checked_at}
+            if status is not None and (status["payment_status"] != transaction["payment_status"]
+                                       or status["status"] != transaction.get("status")):
+                update.update({
+                    "payment_status": status["payment_status"],
+                    "status": status["status"],
+                    "amount_total": status.get("amount_total"),
+                    "reconciled_at": checked_at,
+                })
+                changed.append({**transaction, **update})
+            operations.append(UpdateOne({"session_id": transaction["session_id"]}, {"$set": update}))
+
+        write_started = time.perf_counter()
+        if operations:
+            await self.transactions.bulk_write(operations, ordered=False)
+        write_ms = (time.perf_counter() - write_started) * 1000
+
+        for callback in self.on_applied:
+            await callback(changed)
+
+        self.last_run = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "scanned": len(pending),
+            "updated": len(changed),
+            "errors": errors,
+            "scan_ms": round(scan_ms, 1),
+            "stripe_ms": round(stripe_ms, 1),
+            "write_ms": round(write_ms, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        logger.info(f"Payment reconciliation: {self.last_run}")
+        return self.last_run
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning(f"Error reconciling payments: {e}")
+
+
+async def _cli(args) -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import payments
+    import stock
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    host_url = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+    reconciler = PaymentReconciler(
+        db.payment_transactions,
+        lambda: payments.get_checkout_client(os.environ.get('STRIPE_API_KEY'), f"{host_url}/api/webhook/stripe"),
+        min_age=args.min_age,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+    )
+    reservations = stock.StockReservations(db.products, db.stock_holds)
+
+    # The same settlement the app runs; the payment status caches live in the app's workers
+    async def settle(transactions: List[Dict]) -> None:
+        await payments.settle_orders(db.orders, transactions)
+        await reservations.settle(transactions, payments.is_paid)
+
+    reconciler.on_applied.append(settle)
+    try:
+        await reconciler.ensure_indexes()
+        await reconciler.run_once()
+    finally:
+        client.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-age", type=int, default=30, help="Minutes a transaction must have been pending")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
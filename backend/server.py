@@ -1,39 +1,251 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Header, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import read_preferences
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, WaitQueueTimeoutError
 import os
+import asyncio
 import logging
+import math
+import random
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict
+from typing import List, Literal, Optional, Dict
 import uuid
+import hashlib
+import html
+import json
 from datetime import datetime, timezone
 import httpx
-import feedparser
 import shutil
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from cache import LRUCache
+import receipts
+import push
+import payments
+import webhooks
+import pricing
+import stock
+import reconcile
+import auth
+import ratelimit
+import metrics
+import querylog
+import profiling
+import health
+import compression
+import batch
+import catalog
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Configured before anything else logs, so import-time warnings keep the format
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# MongoDB connection, opened by the lifespan (see connect_database) so each worker
+# process creates its own client; every command is timed and grouped by query shape
+query_profiler = querylog.QueryProfiler(slow_ms=float(os.environ.get('MONGO_SLOW_QUERY_MS', '100')))
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client: Optional[AsyncIOMotorClient] = None
+db = None
+# Read-only reporting queries (rental history) go through analytics_db, which
+# can be pointed at secondaries (MONGO_ANALYTICS_READ_PREFERENCE); everything else uses the primary
+analytics_db = None
+
+# Per process; gunicorn.conf.py splits MONGO_POOL_BUDGET between workers
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+# A request that cannot get a connection within this time gets a 503 instead of queueing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# Comma-separated, in order of preference, e.g. "zstd,snappy,zlib"; zstd and
+# snappy need the zstandard and python-snappy packages. Off by default: on a
+# local network compression costs more CPU than it saves in transfer
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+# Rental history and analytics read from the primary, so an admin sees a rental
+# right after completing it. Replica set deployments can opt into
+# "secondaryPreferred" to move these reads off the primary, at the cost of lag
+MONGO_ANALYTICS_READ_PREFERENCE = os.environ.get('MONGO_ANALYTICS_READ_PREFERENCE', 'primary')
+# Skip secondaries lagging further behind than this; -1 for no limit, otherwise at least 90
+MONGO_ANALYTICS_MAX_STALENESS_S = int(os.environ.get('MONGO_ANALYTICS_MAX_STALENESS_S', '-1'))
 
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
+# Routes served outside /api
+root_router = APIRouter()
 
 # Stripe setup
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
 
-# Upload directory
+# Terminal checkout statuses, fed by the webhook and by polls that reach a final state
+payment_status_cache = LRUCache(maxsize=int(os.environ.get('PAYMENT_STATUS_CACHE_SIZE', '2048')))
+payment_poll_backoff = payments.PollBackoff(
+    base=float(os.environ.get('PAYMENT_POLL_BACKOFF_BASE', '1')),
+    maximum=float(os.environ.get('PAYMENT_POLL_BACKOFF_MAX', '30'))
+)
+
+# Upstream services; overridable so benchmarks can point them at local stand-ins.
+# Requests share one connection pool, created on first use and closed by the
+# lifespan; tests swap it for a client on an httpx.MockTransport
+http_client: Optional[httpx.AsyncClient] = None
+
+def outbound_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=10)
+    return http_client
+
+OPENWEATHER_URL = os.environ.get('OPENWEATHER_URL', 'https://api.openweathermap.org/data/2.5/weather')
+TIDES_URL = os.environ.get('TIDES_URL', 'https://tabuademares.com/api/br/paraiba/joao-pessoa')
+
+# Lista de feeds RSS de surf, bodyboard e mergulho
+NEWS_FEEDS = [
+    # Surf Internacional
+    {"url": "https://www.surfertoday.com/rss.xml", "category": "Surf"},
+    {"url": "https://stabmag.com/feed/", "category": "Surf"},
+    {"url": "https://www.surfersvillage.com/rss/surfing-news.xml", "category": "Surf"},
+    # Bodyboard
+    {"url": "https://www.bodyboard.com/rss/feed", "category": "Bodyboard"},
+    # Mergulho
+    {"url": "https://www.scubadiving.com/rss.xml", "category": "Mergulho"},
+    {"url": "https://divemagazine.com/feed", "category": "Mergulho"},
+    # Surf Brasil
+    {"url": "https://www.waves.com.br/feed/", "category": "Surf Brasil"},
+]
+if os.environ.get('NEWS_FEEDS'):
+    NEWS_FEEDS = json.loads(os.environ['NEWS_FEEDS'])
+
+# Upload directory, created at startup
 UPLOAD_DIR = Path("/app/uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+
+# bcrypt runs in a bounded thread pool so logins never block the event loop
+password_hasher = auth.PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    max_workers=int(os.environ.get('AUTH_HASH_WORKERS', '4'))
+)
+
+# Signed admin session tokens, verified in memory; revocations synced from Mongo
+session_tokens = auth.TokenSigner.from_env()
+revoked_sessions = auth.RevocationList(
+    None,
+    sync_interval=int(os.environ.get('SESSION_REVOCATION_SYNC_INTERVAL', '30'))
+)
+
+async def require_admin(authorization: Optional[str] = Header(None)) -> Dict:
+    return admin_claims(authorization)
+
+def admin_claims(authorization: Optional[str]) -> Dict:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(401, "Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = session_tokens.verify(token)
+    except auth.InvalidToken as e:
+        raise HTTPException(401, str(e), headers={"WWW-Authenticate": "Bearer"})
+    if revoked_sessions.is_revoked(claims["jti"]):
+        raise HTTPException(401, "Session revoked", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+admin_only = [Depends(require_admin)]
+
+def is_admin(authorization: Optional[str]) -> bool:
+    try:
+        admin_claims(authorization)
+    except HTTPException:
+        return False
+    return True
+
+# With several workers a write only invalidates the caches of the worker that
+# served it; the others serve the old copy for at most LOCAL_CACHE_TTL seconds
+LOCAL_CACHE_TTL = int(os.environ.get('LOCAL_CACHE_TTL', '30')) or None
+
+# Read-through cache for single product lookups
+product_cache = LRUCache(maxsize=int(os.environ.get('PRODUCT_CACHE_SIZE', '512')), ttl=LOCAL_CACHE_TTL)
+
+# Homepage reads served from memory: the settings document and the product
+# list, invalidated on writes, and upstream weather, tides and news, refreshed
+# after UPSTREAM_CACHE_TTL seconds. Filled at startup by warm_caches()
+page_cache = LRUCache(maxsize=8, ttl=LOCAL_CACHE_TTL)
+upstream_cache = LRUCache(maxsize=8, ttl=int(os.environ.get('UPSTREAM_CACHE_TTL', '600')))
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes are sent with Brotli or gzip.
+# page_cache holds its entries serialized, so they are compressed once per
+# encoding rather than on every request
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '500'))
+
+def cached_response(request: Request, body: compression.EncodedBody) -> Response:
+    accept_encoding = request.headers.get("accept-encoding", "") if COMPRESSION_ENABLED else ""
+    return body.response(accept_encoding, COMPRESSION_MIN_SIZE)
+
+# Subsystems below are created without collections; bind_database() supplies them
+
+# Stripe webhook inbox, applied to payment_transactions by a background worker
+webhook_inbox = webhooks.WebhookInbox(None, None)
+
+# Web Push fan-out; disabled unless VAPID_PRIVATE_KEY is set
+push_sender = push.PushSender(
+    None,
+    signer=push.VapidSigner.from_env(),
+    workers=int(os.environ.get('PUSH_WORKERS', '2')),
+    concurrency=int(os.environ.get('PUSH_CONCURRENCY', '50')),
+)
+ALERT_SCAN_INTERVAL = int(os.environ.get('ALERT_SCAN_INTERVAL', '60'))
+# Subscriptions not refreshed by a dashboard visit within this window expire
+PUSH_SUBSCRIPTION_TTL = int(os.environ.get('PUSH_SUBSCRIPTION_TTL', str(60 * 24 * 3600)))
+
+# Product prices and stock for server-side cart pricing; reloaded periodically
+# so edits made through other workers are picked up
+price_book = pricing.PriceBook()
+PRICE_BOOK_REFRESH_INTERVAL = int(os.environ.get('PRICE_BOOK_REFRESH_INTERVAL', '60'))
+
+async def price_book_refresh_loop():
+    while True:
+        await asyncio.sleep(PRICE_BOOK_REFRESH_INTERVAL)
+        try:
+            await price_book.load(db.products)
+        except Exception as e:
+            logger.warning(f"Error refreshing price book: {e}")
+
+# Checkout sessions stay payable for Stripe's default 24 hours: the checkout
+# integration has no expires_at to shorten them
+CHECKOUT_SESSION_LIFETIME = 24 * 3600
+
+# Stock held for open Stripe sessions; expired holds are released by a sweeper.
+# A hold must outlive its session, or a late payment takes stock already sold again
+STOCK_HOLD_TTL = int(os.environ.get('STOCK_HOLD_TTL', str(CHECKOUT_SESSION_LIFETIME + 600)))
+if STOCK_HOLD_TTL < CHECKOUT_SESSION_LIFETIME:
+    raise RuntimeError(f"STOCK_HOLD_TTL must be at least the checkout session lifetime "
+                       f"({CHECKOUT_SESSION_LIFETIME} s), got {STOCK_HOLD_TTL}")
+stock_reservations = stock.StockReservations(
+    None,
+    None,
+    ttl=STOCK_HOLD_TTL,
+    sweep_interval=int(os.environ.get('STOCK_SWEEP_INTERVAL', '60'))
+)
+
+def refresh_product_stock(deltas: Dict[str, int]):
+    for product_id, delta in deltas.items():
+        price_book.adjust_stock(product_id, delta)
+        product_cache.invalidate(product_id)
+    page_cache.invalidate("products")
+
+stock_reservations.on_change.append(refresh_product_stock)
+
+# Rendered receipts keyed by (rental_id, format); dropped when the rental or
+# the settings printed on them change
+receipt_cache = LRUCache(maxsize=int(os.environ.get('RECEIPT_CACHE_SIZE', '256')))
 
 # Models
 class User(BaseModel):
@@ -59,6 +271,9 @@ class SurfboardCreate(BaseModel):
     hourly_rate: float
     image_url: Optional[str] = None
 
+class SurfboardImport(SurfboardCreate):
+    id: Optional[str] = None
+
 class Rental(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     surfboard_id: str
@@ -73,6 +288,8 @@ class Rental(BaseModel):
     status: str = "active"
     final_amount: Optional[float] = None
     notification_sent: bool = False
+    push_alert_sent: bool = False
+    push_overdue_sent: bool = False
 
 class RentalStart(BaseModel):
     surfboard_id: str
@@ -101,13 +318,26 @@ class ProductCreate(BaseModel):
     stock: int = 0
     image_url: Optional[str] = None
 
+class ProductImport(ProductCreate):
+    id: Optional[str] = None
+
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     items: List[Dict]
     total: float
     status: str = "pending"
+    session_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class CartItem(BaseModel):
+    product_id: str
+    quantity: int
+
+class CheckoutRequest(BaseModel):
+    items: List[CartItem]
+    origin_url: Optional[str] = None
+    metadata: Dict = Field(default_factory=dict)
+
 class GalleryImage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     image_url: str
@@ -120,6 +350,9 @@ class GalleryImageCreate(BaseModel):
     title: Optional[str] = None
     order: int = 0
 
+class GalleryOrder(BaseModel):
+    ids: List[str] = Field(max_length=batch.MAX_OPERATIONS)
+
 class Settings(BaseModel):
     id: str = "global_settings"
     logo_url: Optional[str] = None
@@ -132,27 +365,56 @@ class PushSubscription(BaseModel):
     endpoint: str
     keys: Dict
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_seen_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 # Auth endpoints
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"username": credentials.username}, {"_id": 0})
-    if not user or user["password_hash"] != credentials.password:
+    if not user:
+        # Same bcrypt cost as a wrong password, so unknown usernames are not faster
+        await password_hasher.verify_unknown(credentials.password)
         raise HTTPException(401, "Invalid credentials")
-    return {"success": True, "username": user["username"]}
+    valid, needs_rehash = await password_hasher.verify(user["username"], credentials.password, user["password_hash"])
+    if not valid:
+        raise HTTPException(401, "Invalid credentials")
+    if needs_rehash:
+        # Transparently migrate accounts created before passwords were hashed
+        new_hash = await password_hasher.hash(credentials.password)
+        await db.users.update_one(
+            {"username": user["username"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    token, claims = session_tokens.issue(user["username"])
+    return {"success": True, "username": user["username"], "token": token, "expires_at": claims["exp"]}
+
+@api_router.post("/auth/logout")
+async def logout(claims: Dict = Depends(require_admin)):
+    await revoked_sessions.revoke(claims)
+    return {"success": True}
 
 @api_router.post("/auth/setup")
-async def setup_admin(credentials: UserLogin):
+async def setup_admin(credentials: UserLogin, authorization: Optional[str] = Header(None)):
+    # Open only until the first account exists; after that only admins add users
+    if not is_admin(authorization) and await db.users.find_one({}, {"_id": 1}):
+        raise HTTPException(403, "Setup already completed")
     existing = await db.users.find_one({"username": credentials.username}, {"_id": 0})
     if existing:
         raise HTTPException(400, "User already exists")
     
-    user = User(username=credentials.username, password_hash=credentials.password)
+    password_hash = await password_hasher.hash(credentials.password)
+    user = User(username=credentials.username, password_hash=password_hash)
     doc = user.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.users.insert_one(doc)
     return {"success": True}
 
+def stored_document(model: BaseModel) -> Dict:
+    """A new catalog item as stored in Mongo, with created_at as an ISO string"""
+    doc = model.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    return doc
+
 # Surfboard endpoints
 @api_router.get("/surfboards")
 async def get_surfboards():
@@ -162,7 +424,7 @@ async def get_surfboards():
             board['created_at'] = datetime.fromisoformat(board['created_at'])
     return boards
 
-@api_router.post("/surfboards")
+@api_router.post("/surfboards", dependencies=admin_only)
 async def create_surfboard(board: SurfboardCreate):
     surfboard = Surfboard(**board.model_dump())
     doc = surfboard.model_dump()
@@ -170,7 +432,7 @@ async def create_surfboard(board: SurfboardCreate):
     await db.surfboards.insert_one(doc)
     return surfboard
 
-@api_router.put("/surfboards/{board_id}")
+@api_router.put("/surfboards/{board_id}", dependencies=admin_only)
 async def update_surfboard(board_id: str, board: SurfboardCreate):
     update_data = board.model_dump()
     result = await db.surfboards.update_one(
@@ -181,7 +443,12 @@ async def update_surfboard(board_id: str, board: SurfboardCreate):
         raise HTTPException(404, "Surfboard not found")
     return {"success": True}
 
-@api_router.delete("/surfboards/{board_id}")
+@api_router.post("/surfboards/batch", dependencies=admin_only)
+async def batch_surfboards(operations: batch.BatchRequest):
+    return await batch.apply(db.surfboards, operations, SurfboardCreate,
+                             lambda board: stored_document(Surfboard(**board.model_dump())))
+
+@api_router.delete("/surfboards/{board_id}", dependencies=admin_only)
 async def delete_surfboard(board_id: str):
     result = await db.surfboards.delete_one({"id": board_id})
     if result.deleted_count == 0:
@@ -189,7 +456,7 @@ async def delete_surfboard(board_id: str):
     return {"success": True}
 
 # Rental endpoints
-@api_router.post("/rentals/start")
+@api_router.post("/rentals/start", dependencies=admin_only)
 async def start_rental(rental_data: RentalStart):
     board = await db.surfboards.find_one({"id": rental_data.surfboard_id}, {"_id": 0})
     if not board:
@@ -216,7 +483,7 @@ async def start_rental(rental_data: RentalStart):
     
     return rental
 
-@api_router.get("/rentals/active")
+@api_router.get("/rentals/active", dependencies=admin_only)
 async def get_active_rentals():
     rentals = await db.rentals.find({"status": {"$in": ["active", "paused"]}}, {"_id": 0}).to_list(100)
     for rental in rentals:
@@ -226,7 +493,7 @@ async def get_active_rentals():
             rental['pause_time'] = datetime.fromisoformat(rental['pause_time'])
     return rentals
 
-@api_router.get("/rentals/check-alerts")
+@api_router.get("/rentals/check-alerts", dependencies=admin_only)
 async def check_rental_alerts():
     """Check for rentals that need alerts (80% of estimated time)"""
     rentals = await db.rentals.find({"status": "active", "notification_sent": False}, {"_id": 0}).to_list(100)
@@ -256,7 +523,52 @@ async def check_rental_alerts():
     
     return alerts
 
-@api_router.put("/rentals/{rental_id}")
+async def push_rental_alerts():
+    """Send push notifications for rentals at 80% and 100% of their estimated time"""
+    rentals = await db.rentals.find(
+        {"status": "active", "push_overdue_sent": {"$ne": True}},
+        {"_id": 0, "id": 1, "surfboard_name": 1, "renter_name": 1, "start_time": 1,
+         "estimated_time": 1, "total_paused_duration": 1, "push_alert_sent": 1}
+    ).to_list(100)
+    now = datetime.now(timezone.utc)
+    alert_ids, overdue_ids = [], []
+    
+    for rental in rentals:
+        start_time = datetime.fromisoformat(rental['start_time']) if isinstance(rental['start_time'], str) else rental['start_time']
+        elapsed = (now - start_time).total_seconds() / 60 - rental.get('total_paused_duration', 0)
+        
+        if elapsed >= rental['estimated_time']:
+            overdue_ids.append(rental['id'])
+            push_sender.enqueue(push.PushJob(
+                title=f"Prancha {rental['surfboard_name']}",
+                body=f"Tempo estimado atingido! Locatário: {rental['renter_name']}",
+                data={"rental_id": rental['id'], "type": "overdue"}
+            ))
+        elif elapsed >= rental['estimated_time'] * 0.8 and not rental.get('push_alert_sent'):
+            alert_ids.append(rental['id'])
+            push_sender.enqueue(push.PushJob(
+                title=f"Atenção: {rental['surfboard_name']}",
+                body=f"Locação de {rental['renter_name']} atingiu 80% do tempo estimado!",
+                data={"rental_id": rental['id'], "type": "alert"}
+            ))
+    
+    if alert_ids:
+        await db.rentals.update_many({"id": {"$in": alert_ids}}, {"$set": {"push_alert_sent": True}})
+    if overdue_ids:
+        await db.rentals.update_many(
+            {"id": {"$in": overdue_ids}},
+            {"$set": {"push_alert_sent": True, "push_overdue_sent": True}}
+        )
+
+async def rental_alert_loop():
+    while True:
+        try:
+            await push_rental_alerts()
+        except Exception as e:
+            logger.warning(f"Error scanning rental alerts: {e}")
+        await asyncio.sleep(ALERT_SCAN_INTERVAL)
+
+@api_router.put("/rentals/{rental_id}", dependencies=admin_only)
 async def update_rental(rental_id: str, update: RentalUpdate):
     rental = await db.rentals.find_one({"id": rental_id}, {"_id": 0})
     if not rental:
@@ -275,7 +587,14 @@ async def update_rental(rental_id: str, update: RentalUpdate):
             pause_time = datetime.fromisoformat(rental["pause_time"])
             paused_duration = (datetime.now(timezone.utc) - pause_time).total_seconds() / 60
             total_paused = rental.get("total_paused_duration", 0) + paused_duration
-            update_data = {"status": "active", "pause_time": None, "total_paused_duration": total_paused, "notification_sent": False}
+            update_data = {
+                "status": "active",
+                "pause_time": None,
+                "total_paused_duration": total_paused,
+                "notification_sent": False,
+                "push_alert_sent": False,
+                "push_overdue_sent": False
+            }
         await db.surfboards.update_one(
             {"id": rental["surfboard_id"]},
             {"$set": {"status": "rented"}}
@@ -292,6 +611,8 @@ async def update_rental(rental_id: str, update: RentalUpdate):
         )
     
     await db.rentals.update_one({"id": rental_id}, {"$set": update_data})
+    for format in ("html", "pdf"):
+        receipt_cache.invalidate((rental_id, format))
     
     # Return the updated rental data for the receipt
     if update.action == "complete":
@@ -300,51 +621,115 @@ async def update_rental(rental_id: str, update: RentalUpdate):
     
     return {"success": True}
 
-@api_router.get("/rentals/history")
+@api_router.get("/rentals/history", dependencies=admin_only)
 async def get_rental_history(date: Optional[str] = None):
     query = {"status": "completed"}
     if date:
-        rentals = await db.rentals.find(query, {"_id": 0}).to_list(1000)
+        rentals = await analytics_db.rentals.find(query, {"_id": 0}).to_list(1000)
         filtered = [r for r in rentals if r.get('start_time', '').startswith(date)]
         return filtered
     
-    rentals = await db.rentals.find(query, {"_id": 0}).sort("start_time", -1).limit(100).to_list(100)
+    rentals = await analytics_db.rentals.find(query, {"_id": 0}).sort("start_time", -1).limit(100).to_list(100)
     return rentals
 
-@api_router.get("/rentals/{rental_id}")
+@api_router.get("/rentals/{rental_id}", dependencies=admin_only)
 async def get_rental(rental_id: str):
     rental = await db.rentals.find_one({"id": rental_id}, {"_id": 0})
     if not rental:
         raise HTTPException(404, "Rental not found")
     return rental
 
+@api_router.get("/rentals/{rental_id}/receipt", dependencies=admin_only)
+async def get_rental_receipt(rental_id: str, format: str = "html"):
+    if format not in ("html", "pdf"):
+        raise HTTPException(400, "Invalid format")
+    media_type = "application/pdf" if format == "pdf" else "text/html; charset=utf-8"
+    
+    cached = receipt_cache.get((rental_id, format))
+    if cached is not None:
+        return Response(content=cached, media_type=media_type)
+    
+    rental = await db.rentals.find_one({"id": rental_id}, {"_id": 0})
+    if not rental:
+        raise HTTPException(404, "Rental not found")
+    if rental["status"] != "completed":
+        raise HTTPException(400, "Rental not completed")
+    settings = await db.settings.find_one({"id": "global_settings"}, {"_id": 0}) or {}
+    
+    if format == "pdf":
+        content = await receipts.render_pdf(rental, settings)
+    else:
+        content = receipts.render_html(rental, settings).encode("utf-8")
+    receipt_cache.set((rental_id, format), content)
+    return Response(content=content, media_type=media_type)
+
 # Product endpoints
-@api_router.get("/products")
-async def get_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
+async def load_products() -> compression.EncodedBody:
+    products = page_cache.get("products")
+    if products is None:
+        products = compression.EncodedBody.json(
+            await db.products.find({}, {"_id": 0, "reservations": 0}).to_list(1000))
+        page_cache.set("products", products)
     return products
 
-@api_router.post("/products")
+@api_router.get("/products")
+async def get_products(request: Request):
+    return cached_response(request, await load_products())
+
+@api_router.get("/products/{product_id}")
+async def get_product(product_id: str):
+    product = product_cache.get(product_id)
+    if product is None:
+        product = await db.products.find_one({"id": product_id}, {"_id": 0, "reservations": 0})
+        if not product:
+            raise HTTPException(404, "Product not found")
+        product_cache.set(product_id, product)
+    return product
+
+@api_router.post("/products", dependencies=admin_only)
 async def create_product(product: ProductCreate):
     prod = Product(**product.model_dump())
     doc = prod.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.products.insert_one(doc)
+    price_book.update(prod.id, doc)
+    page_cache.invalidate("products")
     return prod
 
-@api_router.put("/products/{product_id}")
+@api_router.put("/products/{product_id}", dependencies=admin_only)
 async def update_product(product_id: str, product: ProductCreate):
     result = await db.products.update_one(
         {"id": product_id},
         {"$set": product.model_dump()}
     )
+    product_cache.invalidate(product_id)
+    page_cache.invalidate("products")
     if result.matched_count == 0:
         raise HTTPException(404, "Product not found")
+    price_book.update(product_id, product.model_dump())
     return {"success": True}
 
-@api_router.delete("/products/{product_id}")
+def product_written(op: str, product_id: str, doc: Optional[Dict]):
+    product_cache.invalidate(product_id)
+    if doc is None:
+        price_book.remove(product_id)
+    else:
+        price_book.update(product_id, doc)
+
+@api_router.post("/products/batch", dependencies=admin_only)
+async def batch_products(operations: batch.BatchRequest):
+    report = await batch.apply(db.products, operations, ProductCreate,
+                               lambda product: stored_document(Product(**product.model_dump())),
+                               on_applied=product_written)
+    page_cache.invalidate("products")
+    return report
+
+@api_router.delete("/products/{product_id}", dependencies=admin_only)
 async def delete_product(product_id: str):
     result = await db.products.delete_one({"id": product_id})
+    product_cache.invalidate(product_id)
+    page_cache.invalidate("products")
+    price_book.remove(product_id)
     if result.deleted_count == 0:
         raise HTTPException(404, "Product not found")
     return {"success": True}
@@ -355,7 +740,7 @@ async def get_gallery():
     images = await db.gallery.find({}, {"_id": 0}).sort("order", 1).to_list(100)
     return images
 
-@api_router.post("/gallery")
+@api_router.post("/gallery", dependencies=admin_only)
 async def create_gallery_image(image: GalleryImageCreate):
     gallery_img = GalleryImage(**image.model_dump())
     doc = gallery_img.model_dump()
@@ -363,14 +748,33 @@ async def create_gallery_image(image: GalleryImageCreate):
     await db.gallery.insert_one(doc)
     return gallery_img
 
-@api_router.delete("/gallery/{image_id}")
+@api_router.post("/gallery/batch", dependencies=admin_only)
+async def batch_gallery(operations: batch.BatchRequest):
+    return await batch.apply(db.gallery, operations, GalleryImageCreate,
+                             lambda image: stored_document(GalleryImage(**image.model_dump())))
+
+@api_router.post("/gallery/reorder", dependencies=admin_only)
+async def reorder_gallery(order: GalleryOrder):
+    """Give each image the position of its id in ``ids``, in one bulk_write"""
+    if len(set(order.ids)) != len(order.ids):
+        raise HTTPException(400, "Duplicate image ids")
+    if not order.ids:
+        return {"success": True, "updated": 0, "missing": 0}
+    result = await db.gallery.bulk_write(
+        [UpdateOne({"id": image_id}, {"$set": {"order": position}}) for position, image_id in enumerate(order.ids)],
+        ordered=False
+    )
+    missing = len(order.ids) - result.matched_count
+    return {"success": missing == 0, "updated": result.modified_count, "missing": missing}
+
+@api_router.delete("/gallery/{image_id}", dependencies=admin_only)
 async def delete_gallery_image(image_id: str):
     result = await db.gallery.delete_one({"id": image_id})
     if result.deleted_count == 0:
         raise HTTPException(404, "Image not found")
     return {"success": True}
 
-@api_router.put("/gallery/{image_id}")
+@api_router.put("/gallery/{image_id}", dependencies=admin_only)
 async def update_gallery_image(image_id: str, image: GalleryImageCreate):
     result = await db.gallery.update_one(
         {"id": image_id},
@@ -380,57 +784,148 @@ async def update_gallery_image(image_id: str, image: GalleryImageCreate):
         raise HTTPException(404, "Image not found")
     return {"success": True}
 
+# Catalog import/export for onboarding a shop's products and boards; see catalog.py
+CATALOG_BATCH_SIZE = int(os.environ.get('CATALOG_BATCH_SIZE', '1000'))
+product_catalog = catalog.Catalog(None, ProductImport, batch_size=CATALOG_BATCH_SIZE)
+surfboard_catalog = catalog.Catalog(None, SurfboardImport, defaults={"status": "available"}, batch_size=CATALOG_BATCH_SIZE)
+CATALOGS = {"products": product_catalog, "surfboards": surfboard_catalog}
+CATALOG_CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "jsonl", "application/json": "json"}
+
+@api_router.post("/catalog/{kind}/import", dependencies=admin_only)
+async def import_catalog(kind: Literal["products", "surfboards"], request: Request,
+                         format: Optional[Literal["csv", "jsonl", "json"]] = None, dry_run: bool = False):
+    """Stream rows from the request body; the format defaults to the one named by Content-Type, else CSV"""
+    if format is None:
+        format = CATALOG_CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip(), "csv")
+    try:
+        report = await CATALOGS[kind].import_rows(catalog.read_rows(request.stream(), format), dry_run=dry_run)
+    except catalog.RowError as e:
+        raise HTTPException(400, str(e))
+    if kind == "products" and (report["inserted"] or report["updated"]):
+        product_cache.clear()
+        page_cache.invalidate("products")
+        await price_book.load(db.products)
+    return report
+
+@api_router.get("/catalog/{kind}/export", dependencies=admin_only)
+async def export_catalog(kind: Literal["products", "surfboards"], format: Literal["csv", "jsonl", "json"] = "csv"):
+    return StreamingResponse(
+        CATALOGS[kind].export(format),
+        media_type=catalog.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    )
+
 # Payment endpoints
+def status_checkout_client():
+    host_url = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
+    return payments.get_checkout_client(STRIPE_API_KEY, f"{host_url}/api/webhook/stripe")
+
+async def price_cart(items: List[CartItem]) -> Dict:
+    if not price_book.loaded:
+        await price_book.load(db.products)
+    try:
+        return price_book.price_cart([item.model_dump() for item in items])
+    except pricing.PricingError as e:
+        raise HTTPException(e.status_code, e.message)
+
+@api_router.post("/cart/quote")
+async def quote_cart(cart: CheckoutRequest):
+    return await price_cart(cart.items)
+
 @api_router.post("/payments/checkout")
-async def create_checkout(request: Request, package_data: Dict):
+async def create_checkout(request: Request, checkout: CheckoutRequest):
+    quote = await price_cart(checkout.items)
+    
     host_url = str(request.base_url)
-    origin_url = package_data.get('origin_url', host_url)
+    origin_url = checkout.origin_url or host_url
     
     success_url = f"{origin_url}/success?session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{origin_url}/carrinho"
     
     webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = payments.get_checkout_client(STRIPE_API_KEY, webhook_url)
     
-    checkout_request = CheckoutSessionRequest(
-        amount=package_data['amount'],
+    order = Order(items=quote["items"], total=quote["total"])
+    metadata = {**checkout.metadata, "order_id": order.id}
+    
+    try:
+        hold_id = await stock_reservations.reserve(quote["items"])
+    except stock.InsufficientStock:
+        raise HTTPException(409, "Insufficient stock")
+    
+    checkout_request = payments.checkout_session_request(
+        amount=order.total,
         currency="brl",
         success_url=success_url,
         cancel_url=cancel_url,
-        metadata=package_data.get('metadata', {})
+        metadata=metadata
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    try:
+        with metrics.track_outbound("stripe"):
+            session = await stripe_checkout.create_checkout_session(checkout_request)
+    except Exception:
+        await stock_reservations.release(hold_id)
+        raise
+    
+    order.session_id = session.session_id
+    order_doc = order.model_dump()
+    order_doc['created_at'] = order_doc['created_at'].isoformat()
+    await db.orders.insert_one(order_doc)
     
     transaction = {
         "id": str(uuid.uuid4()),
         "session_id": session.session_id,
-        "amount": package_data['amount'],
+        "order_id": order.id,
+        "hold_id": hold_id,
+        "amount": order.total,
         "currency": "brl",
         "payment_status": "pending",
         "created_at": datetime.now(timezone.utc).isoformat(),
-        "metadata": package_data.get('metadata', {})
+        "metadata": metadata
     }
     await db.payment_transactions.insert_one(transaction)
     
-    return {"url": session.url, "session_id": session.session_id}
+    return {"url": session.url, "session_id": session.session_id, "order_id": order.id, "total": order.total}
 
 @api_router.get("/payments/status/{session_id}")
 async def get_payment_status(session_id: str):
-    host_url = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
-    webhook_url = f"{host_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-    
-    status = await stripe_checkout.get_checkout_status(session_id)
+    cached = payment_status_cache.get(session_id)
+    if cached is not None:
+        return cached
     
     transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-    if transaction and transaction['payment_status'] != status.payment_status:
+    if not transaction:
+        # Only our own checkouts are polled; unknown ids never reach Stripe
+        raise HTTPException(404, "Payment session not found")
+    if payments.is_terminal(transaction):
+        status = payments.status_from_transaction(transaction)
+        payment_status_cache.set(session_id, status)
+        return status
+    # Still pending: only ask Stripe again once the backoff window has passed
+    if not payment_poll_backoff.should_poll(session_id):
+        return payments.status_from_transaction(transaction)
+    
+    with metrics.track_outbound("stripe"):
+        status = (await status_checkout_client().get_checkout_status(session_id)).model_dump()
+    payment_poll_backoff.record(session_id)
+    
+    if transaction['payment_status'] != status['payment_status'] or transaction.get('status') != status['status']:
         await db.payment_transactions.update_one(
             {"session_id": session_id},
-            {"$set": {"payment_status": status.payment_status, "status": status.status}}
+            {"$set": {
+                "payment_status": status['payment_status'],
+                "status": status['status'],
+                "amount_total": status.get('amount_total')
+            }}
         )
     
-    return status.model_dump()
+    if payments.is_terminal(status):
+        payment_status_cache.set(session_id, status)
+        payment_poll_backoff.forget(session_id)
+        await settle_payments([{**transaction, **status}])
+    
+    return status
 
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
@@ -439,21 +934,63 @@ async def stripe_webhook(request: Request):
     
     host_url = str(request.base_url)
     webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = payments.get_checkout_client(STRIPE_API_KEY, webhook_url)
     
     webhook_response = await stripe_checkout.handle_webhook(body, signature)
+    if not getattr(webhook_response, "event_id", None):
+        webhook_response.event_id = f"body_{hashlib.sha256(body).hexdigest()}"
     
-    await db.payment_transactions.update_one(
-        {"session_id": webhook_response.session_id},
-        {"$set": {"payment_status": webhook_response.payment_status, "event_type": webhook_response.event_type}}
-    )
-    
-    return {"success": True}
+    # Acknowledge right away; the inbox worker applies the event
+    stored = await webhook_inbox.record(webhook_response)
+    return {"success": True, "duplicate": not stored}
+
+async def cache_settled_payments(transactions: List[Dict]):
+    for transaction in transactions:
+        if payments.is_terminal(transaction):
+            payment_status_cache.set(transaction["session_id"], payments.status_from_transaction(transaction))
+            payment_poll_backoff.forget(transaction["session_id"])
+
+async def settle_orders(transactions: List[Dict]):
+    await payments.settle_orders(db.orders, transactions)
+
+async def settle_stock(transactions: List[Dict]):
+    await stock_reservations.settle(transactions, payments.is_paid)
+
+# Run by every path that learns a session's final status: the webhook inbox,
+# the reconciler and client status polls
+payment_settled_callbacks = [cache_settled_payments, settle_orders, settle_stock]
+
+async def settle_payments(transactions: List[Dict]):
+    for callback in payment_settled_callbacks:
+        await callback(transactions)
+
+webhook_inbox.on_applied.extend(payment_settled_callbacks)
+
+# Catches transactions left pending by a missed webhook
+payment_reconciler = reconcile.PaymentReconciler(
+    None,
+    status_checkout_client,
+    min_age=int(os.environ.get('RECONCILE_MIN_AGE', '30')),
+    concurrency=int(os.environ.get('RECONCILE_CONCURRENCY', '8')),
+    interval=int(os.environ.get('RECONCILE_INTERVAL', '600'))
+)
+payment_reconciler.on_applied.extend(payment_settled_callbacks)
+
+@api_router.post("/payments/reconcile", dependencies=admin_only)
+async def reconcile_payments():
+    return await payment_reconciler.run_once()
+
+@api_router.get("/payments/reconcile", dependencies=admin_only)
+async def get_last_reconciliation():
+    return payment_reconciler.last_run or {}
 
 # Weather endpoint - using Brazilian public APIs
 @api_router.get("/weather")
 async def get_weather():
     """Get weather from INMET (Brazilian National Institute of Meteorology)"""
+    weather = upstream_cache.get("weather")
+    if weather is not None:
+        return weather
     try:
         # João Pessoa coordinates (closest to Tabatinga, PB)
         lat, lon = -7.1195, -34.8450
@@ -479,37 +1016,39 @@ async def get_weather():
                 "source": "estimado"
             }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.openweathermap.org/data/2.5/weather",
+        with metrics.track_outbound("openweathermap"):
+            response = await outbound_client().get(
+                OPENWEATHER_URL,
                 params={"lat": lat, "lon": lon, "appid": api_key, "units": "metric", "lang": "pt_br"},
                 timeout=10
             )
             response.raise_for_status()
-            data = response.json()
-            
-            # Convert wind direction from degrees to compass
-            wind_deg = data.get("wind", {}).get("deg", 0)
-            directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
-            wind_direction = directions[int((wind_deg + 11.25) / 22.5) % 16]
-            
-            return {
-                "temp": data["main"]["temp"],
-                "feels_like": data["main"]["feels_like"],
-                "temp_min": data["main"].get("temp_min", data["main"]["temp"]),
-                "temp_max": data["main"].get("temp_max", data["main"]["temp"]),
-                "description": data["weather"][0]["description"],
-                "humidity": data["main"]["humidity"],
-                "wind_speed": round(data["wind"]["speed"] * 3.6),  # m/s to km/h
-                "wind_direction": wind_direction,
-                "pressure": data["main"].get("pressure", 1013),
-                "rain_chance": 0,
-                "rain_mm": data.get("rain", {}).get("1h", 0),
-                "uv_index": 8,
-                "sunrise": "05:18",
-                "sunset": "17:45",
-                "source": "openweathermap"
-            }
+        data = response.json()
+        
+        # Convert wind direction from degrees to compass
+        wind_deg = data.get("wind", {}).get("deg", 0)
+        directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+        wind_direction = directions[int((wind_deg + 11.25) / 22.5) % 16]
+        
+        weather = {
+            "temp": data["main"]["temp"],
+            "feels_like": data["main"]["feels_like"],
+            "temp_min": data["main"].get("temp_min", data["main"]["temp"]),
+            "temp_max": data["main"].get("temp_max", data["main"]["temp"]),
+            "description": data["weather"][0]["description"],
+            "humidity": data["main"]["humidity"],
+            "wind_speed": round(data["wind"]["speed"] * 3.6),  # m/s to km/h
+            "wind_direction": wind_direction,
+            "pressure": data["main"].get("pressure", 1013),
+            "rain_chance": 0,
+            "rain_mm": data.get("rain", {}).get("1h", 0),
+            "uv_index": 8,
+            "sunrise": "05:18",
+            "sunset": "17:45",
+            "source": "openweathermap"
+        }
+        upstream_cache.set("weather", weather)
+        return weather
     except Exception as e:
         return {
             "temp": 26,
@@ -534,9 +1073,6 @@ async def get_weather():
 @api_router.get("/waves")
 async def get_waves():
     """Get wave conditions for Tabatinga beach"""
-    import math
-    from datetime import datetime
-    
     # Simulated wave data based on typical conditions for Tabatinga, PB
     # In production, this would come from a surf forecast API
     hour = datetime.now().hour
@@ -569,15 +1105,20 @@ async def get_waves():
 @api_router.get("/tides")
 async def get_tides():
     """Get tides information for Tabatinga region"""
+    tides = upstream_cache.get("tides")
+    if tides is not None:
+        return tides
     try:
         # Using public tide API
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://tabuademares.com/api/br/paraiba/joao-pessoa",
+        with metrics.track_outbound("tides"):
+            response = await outbound_client().get(
+                TIDES_URL,
                 timeout=10
             )
-            if response.status_code == 200:
-                return response.json()
+        if response.status_code == 200:
+            tides = response.json()
+            upstream_cache.set("tides", tides)
+            return tides
     except:
         pass
     
@@ -592,36 +1133,43 @@ async def get_tides():
         "source": "estimado"
     }
 
+HTML_TAG = re.compile(r'<[^>]+>')
+
 # News endpoint
 @api_router.get("/news")
 async def get_surf_news():
     """Get news from multiple surf, bodyboard and diving sources"""
-    news = []
+    news = upstream_cache.get("news")
+    if news is None:
+        news = await fetch_news()
+        upstream_cache.set("news", news)
     
-    # Lista de feeds RSS de surf, bodyboard e mergulho
-    feeds = [
-        # Surf Internacional
-        {"url": "https://www.surfertoday.com/rss.xml", "category": "Surf"},
-        {"url": "https://stabmag.com/feed/", "category": "Surf"},
-        {"url": "https://www.surfersvillage.com/rss/surfing-news.xml", "category": "Surf"},
-        # Bodyboard
-        {"url": "https://www.bodyboard.com/rss/feed", "category": "Bodyboard"},
-        # Mergulho
-        {"url": "https://www.scubadiving.com/rss.xml", "category": "Mergulho"},
-        {"url": "https://divemagazine.com/feed", "category": "Mergulho"},
-        # Surf Brasil
-        {"url": "https://www.waves.com.br/feed/", "category": "Surf Brasil"},
-    ]
+    # Embaralhar e retornar as mais recentes
+    news = list(news)
+    random.shuffle(news)
+    return news[:9]
+
+async def fetch_news() -> List[Dict]:
+    # Only news parses feeds; keep feedparser out of startup
+    import feedparser
+    
+    async def fetch(feed_info):
+        # feedparser blocks, so feeds are fetched side by side in threads
+        with metrics.track_outbound("rss"):
+            return await asyncio.to_thread(feedparser.parse, feed_info["url"])
+    
+    feeds = await asyncio.gather(*(fetch(feed_info) for feed_info in NEWS_FEEDS), return_exceptions=True)
+    news = []
     
-    for feed_info in feeds:
+    for feed_info, feed in zip(NEWS_FEEDS, feeds):
         try:
-            feed = feedparser.parse(feed_info["url"])
+            if isinstance(feed, Exception):
+                raise feed
             for entry in feed.entries[:3]:
                 # Limpar HTML do summary
                 summary = entry.get('summary', entry.get('description', ''))
                 # Remover tags HTML básicas
-                import re
-                summary = re.sub(r'<[^>]+>', '', summary)
+                summary = HTML_TAG.sub('', summary)
                 summary = summary[:200] + '...' if len(summary) > 200 else summary
                 
                 news.append({
@@ -683,47 +1231,77 @@ async def get_surf_news():
             }
         ]
     
-    # Embaralhar e retornar as mais recentes
-    import random
-    random.shuffle(news)
-    return news[:9]
+    return news
 
 # Push notification subscription
-@api_router.post("/push/subscribe")
+@api_router.post("/push/subscribe", dependencies=admin_only)
 async def subscribe_push(subscription: Dict):
     sub = PushSubscription(
         endpoint=subscription['endpoint'],
         keys=subscription['keys']
     )
-    doc = sub.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
-    # Check if already exists
-    existing = await db.push_subscriptions.find_one({"endpoint": subscription['endpoint']}, {"_id": 0})
-    if existing:
+    # Single upsert on the unique endpoint index; last_seen_at (a BSON date) drives the TTL
+    try:
+        result = await db.push_subscriptions.update_one(
+            {"endpoint": sub.endpoint},
+            {
+                "$set": {"keys": sub.keys, "last_seen_at": sub.last_seen_at},
+                "$setOnInsert": {"id": sub.id, "created_at": sub.created_at.isoformat()}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent subscribe from the same browser won the insert
         return {"success": True, "message": "Already subscribed"}
     
-    await db.push_subscriptions.insert_one(doc)
+    if result.upserted_id is None:
+        return {"success": True, "message": "Already subscribed"}
     return {"success": True}
 
-@api_router.get("/push/subscriptions")
-async def get_push_subscriptions():
-    subs = await db.push_subscriptions.find({}, {"_id": 0}).to_list(1000)
-    return subs
+@api_router.post("/push/send", dependencies=admin_only)
+async def send_push(notification: Dict):
+    if push_sender.signer is None:
+        raise HTTPException(503, "Push notifications not configured")
+    push_sender.enqueue(push.PushJob(
+        title=notification.get('title', 'tabatinga2surf'),
+        body=notification.get('body', ''),
+        data=notification.get('data', {})
+    ))
+    return {"success": True, "queued": push_sender.queue.qsize()}
+
+@api_router.get("/push/subscriptions", dependencies=admin_only)
+async def get_push_subscriptions(skip: int = 0, limit: int = 50):
+    limit = max(1, min(limit, 200))
+    skip = max(0, skip)
+    subs = await db.push_subscriptions.find(
+        {},
+        {"_id": 0, "id": 1, "endpoint": 1, "created_at": 1, "last_seen_at": 1}
+    ).sort("created_at", 1).skip(skip).limit(limit).to_list(limit)
+    total = await db.push_subscriptions.estimated_document_count()
+    return {"items": subs, "total": total, "skip": skip, "limit": limit}
 
 # Settings endpoints
-@api_router.get("/settings")
-async def get_settings():
-    settings = await db.settings.find_one({"id": "global_settings"}, {"_id": 0})
-    if not settings:
+async def load_settings() -> compression.EncodedBody:
+    settings = page_cache.get("settings")
+    if settings is not None:
+        return settings
+    document = await db.settings.find_one({"id": "global_settings"}, {"_id": 0})
+    if not document:
         default_settings = Settings()
         doc = default_settings.model_dump()
         doc['updated_at'] = doc['updated_at'].isoformat()
         await db.settings.insert_one(doc)
-        return default_settings.model_dump()
+        document = default_settings.model_dump()
+    settings = compression.EncodedBody.json(document)
+    page_cache.set("settings", settings)
     return settings
 
-@api_router.put("/settings")
+@api_router.get("/settings")
+async def get_settings(request: Request):
+    return cached_response(request, await load_settings())
+
+@api_router.put("/settings", dependencies=admin_only)
 async def update_settings(settings: Dict):
     settings['updated_at'] = datetime.now(timezone.utc).isoformat()
     await db.settings.update_one(
@@ -731,10 +1309,67 @@ async def update_settings(settings: Dict):
         {"$set": settings},
         upsert=True
     )
+    page_cache.invalidate("settings")
+    # Receipts embed the logo, PIX QR code and Instagram handle
+    receipt_cache.clear()
     return {"success": True}
 
+CACHES = {
+    "products": product_cache,
+    "pages": page_cache,
+    "upstream": upstream_cache,
+    "receipts": receipt_cache,
+    "payment_status": payment_status_cache,
+}
+
+# Cache stats
+@api_router.get("/cache/stats", dependencies=admin_only)
+async def get_cache_stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+# Prometheus metrics
+metrics.register_caches(CACHES)
+
+@root_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+QUERY_SORT_FIELDS = ("total_ms", "max_ms", "mean_ms", "calls", "documents")
+
+@api_router.get("/mongo/queries", dependencies=admin_only)
+async def get_slowest_queries(limit: int = 10, sort: str = "total_ms"):
+    if sort not in QUERY_SORT_FIELDS:
+        raise HTTPException(400, f"sort must be one of {', '.join(QUERY_SORT_FIELDS)}")
+    return {
+        "slow_ms": query_profiler.slow_ms,
+        "dropped": query_profiler.dropped,
+        "queries": query_profiler.top(max(1, min(limit, 100)), sort)
+    }
+
+@api_router.delete("/mongo/queries", dependencies=admin_only)
+async def reset_query_stats():
+    query_profiler.reset()
+    return {"success": True}
+
+@api_router.get("/profiles", dependencies=admin_only)
+async def list_profiles():
+    return profile_store.list()
+
+@api_router.get("/profiles/{profile_id}", dependencies=admin_only)
+async def get_profile(profile_id: str, format: str = "html"):
+    report = profile_store.get(profile_id)
+    if not report:
+        raise HTTPException(404, "Profile not found")
+    if format == "html":
+        return Response(report["html"] or f"<pre>{html.escape(report['text'])}</pre>", media_type="text/html")
+    return Response(report["text"], media_type="text/plain")
+
+@api_router.get("/ratelimit/stats", dependencies=admin_only)
+async def get_rate_limit_stats():
+    return rate_limiter.summary()
+
 # Upload endpoint
-@api_router.post("/upload")
+@api_router.post("/upload", dependencies=admin_only)
 async def upload_file(file: UploadFile = File(...)):
     file_ext = Path(file.filename).suffix
     file_id = str(uuid.uuid4())
@@ -750,25 +1385,353 @@ async def upload_file(file: UploadFile = File(...)):
     
     return {"url": full_url}
 
-app.include_router(api_router)
+# Throttle endpoints a bot could use to exhaust the worker, the Stripe quota or the disk
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED', '0') == '1'
+rate_limiter = ratelimit.RateLimiter(
+    [
+        ratelimit.Rule("POST", "/api/auth/login", capacity=5, rate=5 / 60),
+        ratelimit.Rule("POST", "/api/upload", capacity=10, rate=10 / 60),
+        ratelimit.Rule("POST", "/api/push/subscribe", capacity=10, rate=10 / 60),
+        ratelimit.Rule("POST", "/api/payments/checkout", capacity=10, rate=10 / 60),
+        ratelimit.Rule("POST", "/api/payments/checkout", capacity=50, rate=20, scope="route"),
+    ]
+)
+
+# Admin-triggered profiling of single requests (X-Profile header or ?profile=)
+profile_store = profiling.ProfileStore(maxsize=int(os.environ.get('PROFILE_STORE_SIZE', '20')))
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
+background_tasks = []
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Milliseconds spent in each startup step of the last lifespan, for bench/startup.py
+startup_timings: Dict[str, float] = {}
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+def bind_database(database, analytics=None):
+    """Point the app and its subsystems at another database, e.g. a per-test one"""
+    global db, analytics_db
+    db = database
+    analytics_db = analytics if analytics is not None else database
+    webhook_inbox.events = database.stripe_events
+    webhook_inbox.transactions = database.payment_transactions
+    push_sender.collection = database.push_subscriptions
+    stock_reservations.products = database.products
+    stock_reservations.holds = database.stock_holds
+    payment_reconciler.transactions = database.payment_transactions
+    revoked_sessions.collection = database.revoked_sessions
+    if RATE_LIMIT_SHARED:
+        rate_limiter.collection = database.rate_limits
+    product_catalog.collection = database.products
+    surfboard_catalog.collection = database.surfboards
+
+def connect_database():
+    """Open the Mongo client and bind its database; no connection is made until the first command"""
+    global client
+    options = {}
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    client = AsyncIOMotorClient(
+        mongo_url,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[metrics.MongoCommandMetrics(), metrics.MongoPoolMetrics(), query_profiler],
+        **options
+    )
+    analytics_read_preference = read_preferences.make_read_preference(
+        read_preferences.read_pref_mode_from_name(MONGO_ANALYTICS_READ_PREFERENCE),
+        tag_sets=None,
+        max_staleness=MONGO_ANALYTICS_MAX_STALENESS_S
+    )
+    bind_database(
+        client[os.environ['DB_NAME']],
+        analytics=client.get_database(os.environ['DB_NAME'], read_preference=analytics_read_preference)
+    )
+
+async def ensure_indexes():
+    # Dedupes and backfills older subscriptions first; logs its own failures
+    await push.ensure_subscription_indexes(db.push_subscriptions, PUSH_SUBSCRIPTION_TTL)
+    try:
+        # Every catalog read, write and batch looks items up by id
+        for collection in (db.surfboards, db.products, db.gallery):
+            await collection.create_index("id", unique=True)
+    except Exception as e:
+        logger.warning(f"Error creating catalog id indexes: {e}")
+    try:
+        await webhook_inbox.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Error creating webhook inbox indexes: {e}")
+    try:
+        await stock_reservations.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Error creating stock hold indexes: {e}")
+    try:
+        await payment_reconciler.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Error creating payment transaction indexes: {e}")
+    try:
+        await rate_limiter.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Error creating rate limit indexes: {e}")
+    try:
+        await revoked_sessions.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Error creating revoked session indexes: {e}")
+
+# The webhook inbox drain, the reconciler and rental alerts must run in one
+# process only. Under gunicorn, workers compete for SINGLETON_LOCK_FILE: the
+# holder runs them, the others retry so a replacement takes over when it exits
+SINGLETON_LOCK_FILE = os.environ.get('SINGLETON_LOCK_FILE')
+SINGLETON_RETRY_INTERVAL = int(os.environ.get('SINGLETON_RETRY_INTERVAL', '5'))
+singleton_lock = None
+runs_singletons = False
+
+def acquire_singleton_lock() -> bool:
+    global singleton_lock
+    if not SINGLETON_LOCK_FILE:
+        return True
+    import fcntl
+    handle = open(SINGLETON_LOCK_FILE, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    singleton_lock = handle
+    return True
+
+def release_singleton_lock():
+    global singleton_lock
+    if singleton_lock is not None:
+        singleton_lock.close()
+        singleton_lock = None
+
+async def start_singleton_workers():
+    global runs_singletons
+    runs_singletons = True
+    await webhook_inbox.start()
+    if payment_reconciler.interval > 0:
+        await payment_reconciler.start()
+    if push_sender.signer is not None:
+        background_tasks.append(asyncio.create_task(rental_alert_loop(), name="rental_alerts"))
+
+async def singleton_takeover_loop():
+    while not acquire_singleton_lock():
+        await asyncio.sleep(SINGLETON_RETRY_INTERVAL)
+    logger.info(f"Worker {os.getpid()} took over the webhook inbox, reconciler and rental alerts")
+    await start_singleton_workers()
+
+WARM_CACHES = os.environ.get('WARM_CACHES', '1') == '1'
+WARM_CACHES_TIMEOUT = float(os.environ.get('WARM_CACHES_TIMEOUT', '10'))
+warmup_status: Dict = {"status": "pending" if WARM_CACHES else "disabled"}
+
+async def warm_caches():
+    """Fill the homepage caches so the first visitors after a (re)start hit memory"""
+    warmup_status.update(status="running", failed=[])
+    loaders = {
+        "settings": load_settings,
+        "products": load_products,
+        "weather": get_weather,
+        "tides": get_tides,
+        "news": get_surf_news,
+    }
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*(load() for load in loaders.values()), return_exceptions=True),
+            timeout=WARM_CACHES_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Warming caches took over {WARM_CACHES_TIMEOUT:.0f}s; serving with what is loaded")
+        warmup_status["status"] = "timed_out"
+        return
+    for name, result in zip(loaders, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Error warming {name} cache: {result}")
+            warmup_status["failed"].append(name)
+    warmup_status["status"] = "done"
+
+# Health: /healthz answers without I/O as long as the event loop runs;
+# /readyz reports the dependencies a load balancer should route on
+async def check_mongo() -> Dict:
+    await db.command("ping")
+    return {"ok": True}
+
+async def check_cache_warmup() -> Dict:
+    # A timed-out or partly failed warmup still serves, from fallbacks
+    return {"ok": warmup_status["status"] not in ("pending", "running"), **warmup_status}
+
+async def check_workers() -> Dict:
+    workers = {
+        "stock_sweeper": stock_reservations.running,
+        "revocation_sync": revoked_sessions.running,
+    }
+    if push_sender.signer is not None:
+        workers["push_sender"] = push_sender.running
+    if runs_singletons:
+        workers["webhook_inbox"] = webhook_inbox.running
+        if payment_reconciler.interval > 0:
+            workers["payment_reconciler"] = payment_reconciler.running
+    for task in background_tasks:
+        # The takeover loop ends once this worker holds the lock
+        workers[task.get_name()] = not task.done() or (not task.cancelled() and task.exception() is None)
+    return {
+        "ok": all(workers.values()),
+        "stopped": [name for name, running in workers.items() if not running],
+        "singletons": "active" if runs_singletons else "standby",
+        # Still retrying the first load if False; the sync loop keeps running either way
+        "revocations_synced": revoked_sessions.synced,
+    }
+
+async def check_upstreams() -> Dict:
+    # Informational: weather, tides and news have fallbacks
+    return {
+        "ok": all(status["last_outcome"] == "ok" for status in metrics.OUTBOUND_STATUS.values()),
+        "targets": {target: dict(status) for target, status in metrics.OUTBOUND_STATUS.items()},
+    }
+
+readiness = health.ReadinessProbe(
+    {
+        "mongo": check_mongo,
+        "cache_warmup": check_cache_warmup,
+        "workers": check_workers,
+        "upstreams": check_upstreams,
+    },
+    min_interval=float(os.environ.get('READY_CACHE_SECONDS', '1')),
+    timeout=float(os.environ.get('READY_CHECK_TIMEOUT', '2')),
+    informational=("upstreams",)
 )
-logger = logging.getLogger(__name__)
+process_started = time.monotonic()
+
+@root_router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok", "pid": os.getpid(), "uptime_s": round(time.monotonic() - process_started)}
+
+@root_router.get("/readyz", include_in_schema=False)
+async def readyz():
+    report = await readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+async def mongo_pool_exhausted(request: Request, exc: WaitQueueTimeoutError):
+    # Every pooled connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS; shed the request
+    logger.warning(f"Mongo pool exhausted on {request.url.path}: {exc}")
+    return JSONResponse({"detail": "Service busy, try again"}, status_code=503, headers={"Retry-After": "1"})
+
+@contextmanager
+def startup_step(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+async def start_resources():
+    startup_timings.clear()
+    warmup_status.clear()
+    warmup_status["status"] = "pending" if WARM_CACHES else "disabled"
+    started = time.perf_counter()
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    # Tests bind their own database beforehand
+    if db is None:
+        with startup_step("mongo_client"):
+            connect_database()
+    with startup_step("indexes"):
+        await ensure_indexes()
+    with startup_step("price_book"):
+        try:
+            await price_book.load(db.products)
+        except Exception as e:
+            logger.warning(f"Error loading price book: {e}")
+    with startup_step("revoked_sessions"):
+        # Never raises: a failed first sync is retried by its loop
+        await revoked_sessions.start()
+    with startup_step("workers"):
+        await stock_reservations.start()
+        await push_sender.start()
+        if acquire_singleton_lock():
+            await start_singleton_workers()
+        else:
+            background_tasks.append(asyncio.create_task(singleton_takeover_loop(), name="singleton_takeover"))
+        if PRICE_BOOK_REFRESH_INTERVAL > 0:
+            background_tasks.append(asyncio.create_task(price_book_refresh_loop(), name="price_book_refresh"))
+    if WARM_CACHES:
+        with startup_step("warm_caches"):
+            await warm_caches()
+    startup_timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Startup took " + ", ".join(f"{name} {ms} ms" for name, ms in startup_timings.items()))
+
+async def stop_resources():
+    global client, db, http_client, runs_singletons
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await push_sender.stop()
+    await webhook_inbox.stop()
+    await stock_reservations.stop()
+    await payment_reconciler.stop()
+    await revoked_sessions.stop()
+    release_singleton_lock()
+    runs_singletons = False
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    if client is not None:
+        client.close()
+        client = db = None
+    for cache in CACHES.values():
+        cache.clear()
+    receipts.shutdown()
+    password_hasher.shutdown()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Owns the Mongo client, the outbound HTTP pool, the caches and the background workers"""
+    await start_resources()
+    try:
+        yield
+    finally:
+        await stop_resources()
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    app.include_router(root_router)
+    app.add_exception_handler(WaitQueueTimeoutError, mongo_pool_exhausted)
+
+    # Mount static files for uploads; the directory is created at startup
+    app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
+
+    # Added before CORS so 429 responses still carry CORS headers. Clients are
+    # keyed by the socket peer; behind known reverse proxies set
+    # RATE_LIMIT_PROXY_HOPS to their number so X-Forwarded-For is read instead
+    # (without proxies it's whatever the client sends, and limits are bypassed)
+    if os.environ.get('RATE_LIMIT_ENABLED', '1') == '1':
+        app.add_middleware(
+            ratelimit.RateLimitMiddleware,
+            limiter=rate_limiter,
+            proxy_hops=int(os.environ.get('RATE_LIMIT_PROXY_HOPS', '0'))
+        )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(profiling.ProfilingMiddleware, store=profile_store, authorize=is_admin)
+
+    # Outside profiling, which may replace the body with its report
+    if COMPRESSION_ENABLED:
+        app.add_middleware(
+            compression.CompressionMiddleware,
+            minimum_size=COMPRESSION_MIN_SIZE,
+            gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+            brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+        )
+
+    # Outermost, so throttled and CORS preflight responses are timed too
+    app.add_middleware(metrics.MetricsMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = create_app()
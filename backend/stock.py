@@ -0,0 +1,166 @@
+"""
+Stock reservations for storefront orders.
+
+A checkout reserves every cart line with one ``bulk_write`` of conditional
+``$inc`` updates (``stock >= quantity``). Each successful update also tags the
+product with the hold id in ``reservations``, so a partially failed cart can
+be rolled back exactly, and commits/releases are idempotent: a release only
+gives stock back to products that still carry the tag.
+
+Holds live in ``stock_holds`` until the Stripe session is paid (commit),
+expires (release) or outlives ``ttl`` (released by the sweeper).
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class StockReservations:
+    def __init__(self, products, holds, ttl: int = 3600, sweep_interval: int = 60):
+        self.products = products
+        self.holds = holds
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        # Called with {product_id: delta} after stock changes, to refresh in-memory copies
+        self.on_change: List[Callable[[Dict[str, int]], None]] = []
+        self.stats = {"reserved": 0, "rejected": 0, "committed": 0, "released": 0, "swept": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self) -> None:
+        await self.holds.create_index("id", unique=True)
+        await self.holds.create_index([("status", 1), ("expires_at", 1)])
+
+    def _notify(self, lines: List[Dict], sign: int) -> None:
+        deltas = {line["product_id"]: sign * line["quantity"] for line in lines}
+        for callback in self.on_change:
+            callback(deltas)
+
+    async def reserve(self, lines: List[Dict]) -> str:
+        """Reserve all lines or none; returns the hold id"""
+        hold_id = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        # The hold is written first so the sweeper can clean up after a crash mid-reservation
+        await self.holds.insert_one({
+            "id": hold_id,
+            "items": [{"product_id": line["product_id"], "quantity": line["quantity"]} for line in lines],
+            "status": "held",
+            "created_at": now.isoformat(),
+            "expires_at": now + timedelta(seconds=self.ttl),
+        })
+        result = await self.products.bulk_write([
+            UpdateOne(
+                {"id": line["product_id"], "stock": {"$gte": line["quantity"]}},
+                {"$inc": {"stock": -line["quantity"]}, "$addToSet": {"reservations": hold_id}}
+            )
+            for line in lines
+        ], ordered=False)
+        if result.modified_count != len(lines):
+            await self._give_back(hold_id, lines)
+            await self.holds.update_one({"id": hold_id}, {"$set": {"status": "rejected"}})
+            self.stats["rejected"] += 1
+            raise InsufficientStock(hold_id)
+        self.stats["reserved"] += 1
+        self._notify(lines, -1)
+        return hold_id
+
+    async def _give_back(self, hold_id: str, lines: List[Dict]) -> None:
+        await self.products.bulk_write([
+            UpdateOne(
+                {"id": line["product_id"], "reservations": hold_id},
+                {"$inc": {"stock": line["quantity"]}, "$pull": {"reservations": hold_id}}
+            )
+            for line in lines
+        ], ordered=False)
+
+    async def release(self, hold_id: str) -> bool:
+        hold = await self.holds.find_one_and_update(
+            {"id": hold_id, "status": "held"},
+            {"$set": {"status": "released", "released_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0, "items": 1}
+        )
+        if not hold:
+            return False
+        await self._give_back(hold_id, hold["items"])
+        self.stats["released"] += 1
+        self._notify(hold["items"], 1)
+        return True
+
+    async def commit(self, hold_id: str) -> bool:
+        hold = await self.holds.find_one_and_update(
+            {"id": hold_id, "status": {"$in": ["held", "released"]}},
+            {"$set": {"status": "committed", "committed_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0, "items": 1, "status": 1}
+        )
+        if not hold:
+            return False
+        if hold["status"] == "released":
+            # Paid after the hold lapsed: take the stock again, even if that oversells
+            logger.warning(f"Stock hold {hold_id} was paid after being released")
+            await self.products.bulk_write([
+                UpdateOne({"id": line["product_id"]}, {"$inc": {"stock": -line["quantity"]}})
+                for line in hold["items"]
+            ], ordered=False)
+            self._notify(hold["items"], -1)
+        else:
+            await self.products.bulk_write([
+                UpdateOne({"id": line["product_id"]}, {"$pull": {"reservations": hold_id}})
+                for line in hold["items"]
+            ], ordered=False)
+        self.stats["committed"] += 1
+        return True
+
+    async def settle(self, transactions: List[Dict], is_paid: Callable[[Dict], bool]) -> None:
+        """Commit or release holds from settled payment transactions"""
+        for transaction in transactions:
+            hold_id = transaction.get("hold_id")
+            if not hold_id:
+                continue
+            if is_paid(transaction):
+                await self.commit(hold_id)
+            elif transaction.get("status") == "expired":
+                await self.release(hold_id)
+
+    async def sweep(self) -> int:
+        """Release every hold that has outlived its TTL"""
+        expired = await self.holds.find(
+            {"status": "held", "expires_at": {"$lt": datetime.now(timezone.utc)}},
+            {"_id": 0, "id": 1}
+        ).to_list(1000)
+        released = 0
+        for hold in expired:
+            released += await self.release(hold["id"])
+        self.stats["swept"] += released
+        return released
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._sweeper())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                released = await self.sweep()
+                if released:
+                    logger.info(f"Released {released} expired stock holds")
+            except Exception as e:
+                logger.warning(f"Error sweeping stock holds: {e}")
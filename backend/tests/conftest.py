@@ -0,0 +1,93 @@
+"""
+In-process test harness for the Tabatinga2Surf API.
+
+Requests go through httpx's ASGITransport straight into ``server.app``; no
+server or network is involved. Every test gets its own mongomock database,
+a fresh price book and empty caches, Stripe is replaced by the stand-in from
+bench/fake_stripe.py and the outbound HTTP client (weather, tides) by one
+on an ``httpx.MockTransport``. The lifespan does not run, so no Mongo client
+or background worker is started. Override them per test through the ``upstream``
+fixture or by monkeypatching ``server``.
+
+Tests are independent of each other, so the suite runs in parallel with
+pytest-xdist: ``pytest -n auto``.
+"""
+import os
+import sys
+import uuid
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "tabatinga_test")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Every /readyz call in a test runs the checks
+os.environ.setdefault("READY_CACHE_SECONDS", "0")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class Upstream:
+    """Canned responses for outbound HTTP, keyed by URL without the query string"""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        url = str(request.url.copy_with(query=None))
+        if url not in self.responses:
+            return httpx.Response(503)
+        return self.responses[url]
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def server(monkeypatch, upstream):
+    pytest.importorskip("emergentintegrations")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server as app_server
+    import payments
+    import pricing
+    from bench.fake_stripe import FakeStripeCheckout
+
+    app_server.bind_database(mongomock_motor.AsyncMongoMockClient()[f"test_{uuid.uuid4().hex}"])
+    monkeypatch.setattr(app_server, "price_book", pricing.PriceBook())
+    monkeypatch.setattr(app_server, "payment_poll_backoff", payments.PollBackoff(base=0, maximum=0))
+    monkeypatch.setattr(app_server, "NEWS_FEEDS", [])
+    monkeypatch.setattr(app_server, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle)))
+    monkeypatch.setattr(FakeStripeCheckout, "latency", 0)
+    monkeypatch.delenv("OPENWEATHER_API_KEY", raising=False)
+    for cache in app_server.CACHES.values():
+        cache.clear()
+    payments.set_checkout_factory(FakeStripeCheckout)
+    yield app_server
+    payments.set_checkout_factory(None)
+
+
+@pytest.fixture
+async def client(server):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def admin(client):
+    """Create admin/admin123 in the test database and return its Authorization header"""
+    credentials = {"username": "admin", "password": "admin123"}
+    await client.post("/api/auth/setup", json=credentials)
+    response = await client.post("/api/auth/login", json=credentials)
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['token']}"}
@@ -1,20 +1,36 @@
 """
 Backend API Tests for Tabatinga2Surf - Surf Board Rental System
 Tests all API endpoints: weather, tides, products, surfboards, auth, rentals
+
+Runs in-process against server.app with a fresh database per test; see conftest.py
 """
-import pytest
-import requests
+import asyncio
+import feedparser
+import httpx
 import os
+import pytest
+import subprocess
+import sys
 import uuid
+from pymongo.errors import WaitQueueTimeoutError
+
+pytestmark = pytest.mark.anyio
+
+RSS_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Surf</title>
+<item><title>Swell de leste</title><link>http://feeds.test/1</link>
+<description>&lt;p&gt;Ondas de 1,5m no fim de semana&lt;/p&gt;</description></item>
+<item><title>Campeonato em Baía Formosa</title><link>http://feeds.test/2</link>
+<description>Etapa regional</description></item>
+</channel></rss>"""
 
-BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
 class TestHealthAndWeather:
     """Test weather, waves and tides endpoints (MOCKED data)"""
     
-    def test_weather_endpoint(self):
+    async def test_weather_endpoint(self, client):
         """Test /api/weather returns weather data with new fields"""
-        response = requests.get(f"{BASE_URL}/api/weather")
+        response = await client.get("/api/weather")
         assert response.status_code == 200
         data = response.json()
         
@@ -40,9 +56,32 @@ class TestHealthAndWeather:
         print(f"✓ Weather API returns: {data['temp']}°C, wind: {data['wind_speed']} km/h {data['wind_direction']}")
         print(f"  Sunrise: {data['sunrise']}, Sunset: {data['sunset']}, Rain chance: {data['rain_chance']}%")
     
-    def test_waves_endpoint(self):
+    async def test_weather_from_openweathermap(self, client, upstream, server, monkeypatch):
+        """Test /api/weather converts the OpenWeatherMap response"""
+        monkeypatch.setenv("OPENWEATHER_API_KEY", "test-key")
+        upstream.responses[server.OPENWEATHER_URL] = httpx.Response(200, json={
+            "main": {"temp": 27.5, "feels_like": 29.1, "humidity": 74},
+            "weather": [{"description": "poucas nuvens"}],
+            "wind": {"speed": 5, "deg": 110},
+        })
+        response = await client.get("/api/weather")
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert data["source"] == "openweathermap"
+        assert data["temp"] == 27.5
+        assert data["wind_speed"] == 18
+        assert data["wind_direction"] == "ESE"
+        assert upstream.requests[0].url.params["appid"] == "test-key"
+        
+        # Served from the upstream cache until it expires
+        assert (await client.get("/api/weather")).json() == data
+        assert len(upstream.requests) == 1
+        print(f"✓ Weather API converts upstream data: {data['temp']}°C, {data['wind_speed']} km/h {data['wind_direction']}")
+    
+    async def test_waves_endpoint(self, client):
         """Test /api/waves returns wave/surf conditions data"""
-        response = requests.get(f"{BASE_URL}/api/waves")
+        response = await client.get("/api/waves")
         assert response.status_code == 200
         data = response.json()
         
@@ -67,9 +106,9 @@ class TestHealthAndWeather:
         print(f"  Direction: {data['wave_direction']}, Period: {data['swell_period']}s, Rating: {data['surf_rating']}")
         print(f"  Water temp: {data['water_temp']}°C, Best time: {data['best_time']}")
     
-    def test_tides_endpoint(self):
+    async def test_tides_endpoint(self, client):
         """Test /api/tides returns tide data"""
-        response = requests.get(f"{BASE_URL}/api/tides")
+        response = await client.get("/api/tides")
         assert response.status_code == 200
         data = response.json()
         
@@ -87,12 +126,167 @@ class TestHealthAndWeather:
         print(f"✓ Tides API returns {len(data['tides'])} tide entries for {data['location']}")
 
 
+class TestHealth:
+    """Test liveness and readiness probes"""
+    
+    async def test_healthz(self, client):
+        """Test /healthz answers without touching dependencies"""
+        response = await client.get("/healthz")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ok"
+        print("✓ Liveness probe answered")
+    
+    async def test_readyz_before_startup(self, client):
+        """Test /readyz is 503 until the lifespan has warmed caches and started workers"""
+        response = await client.get("/readyz")
+        assert response.status_code == 503
+        data = response.json()
+        
+        assert data["ready"] is False
+        assert data["checks"]["mongo"]["ok"] is True
+        assert data["checks"]["cache_warmup"]["status"] == "pending"
+        assert "stock_sweeper" in data["checks"]["workers"]["stopped"]
+        print("✓ Readiness probe reports not ready before startup")
+    
+    async def test_readyz_after_startup(self, client, server):
+        """Test /readyz is 200 with per-dependency latency once the app has started"""
+        async with server.app.router.lifespan_context(server.app):
+            response = await client.get("/readyz")
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert data["ready"] is True
+        assert data["checks"]["cache_warmup"]["status"] == "done"
+        assert data["checks"]["workers"]["singletons"] == "active"
+        for check in data["checks"].values():
+            assert "latency_ms" in check
+        print(f"✓ Ready; Mongo ping {data['checks']['mongo']['latency_ms']} ms")
+    
+    async def test_ready_after_failed_revocation_sync(self, client, server, monkeypatch):
+        """Test a Mongo blip during the first revocation sync does not leave the worker unready"""
+        sync = server.revoked_sessions.sync
+        calls = []
+        
+        async def flaky_sync():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ConnectionError("No servers found yet")
+            await sync()
+        
+        monkeypatch.setattr(server.revoked_sessions, "sync", flaky_sync)
+        monkeypatch.setattr(server.revoked_sessions, "retry_delay", 0.01)
+        monkeypatch.setattr(server.revoked_sessions, "_synced_until", None)
+        async with server.app.router.lifespan_context(server.app):
+            first = await client.get("/readyz")
+            for _ in range(100):
+                if server.revoked_sessions.synced:
+                    break
+                await asyncio.sleep(0.01)
+            recovered = await client.get("/readyz")
+        
+        assert first.status_code == 200
+        assert first.json()["checks"]["workers"]["stopped"] == []
+        assert recovered.status_code == 200
+        assert recovered.json()["checks"]["workers"]["revocations_synced"] is True
+        assert len(calls) >= 2
+        print("✓ Ready despite a failed first revocation sync, which was retried")
+    
+    async def test_stock_hold_shorter_than_session_rejected(self, server):
+        """Test the app refuses to start with stock holds that lapse before the checkout session"""
+        assert server.stock_reservations.ttl >= server.CHECKOUT_SESSION_LIFETIME
+        result = subprocess.run([sys.executable, "-c", "import server"], cwd=os.path.dirname(server.__file__),
+                                env={**os.environ, "STOCK_HOLD_TTL": "3600"}, capture_output=True, text=True)
+        assert result.returncode != 0
+        assert "STOCK_HOLD_TTL must be at least the checkout session lifetime" in result.stderr
+        print("✓ Short STOCK_HOLD_TTL rejected at startup")
+    
+    async def test_pool_exhausted_returns_503(self, client, server, monkeypatch):
+        """Test a request that times out waiting for a Mongo connection is shed with 503"""
+        class ExhaustedDatabase:
+            def __getattr__(self, name):
+                raise WaitQueueTimeoutError("Timed out while checking out a connection from connection pool")
+        
+        monkeypatch.setattr(server, "db", ExhaustedDatabase())
+        response = await client.get("/api/surfboards")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        print("✓ Pool exhaustion answered with 503")
+    
+    async def test_metrics_exposition(self, client):
+        """Test /metrics serves the Prometheus text format labelled by route template"""
+        await client.get("/api/surfboards")
+        await client.get("/api/products/does-not-exist")
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        
+        body = response.text
+        assert "# TYPE http_requests_total counter" in body
+        assert 'http_requests_total{method="GET",route="/api/surfboards",status="200"}' in body
+        assert 'http_requests_total{method="GET",route="/api/products/{product_id}",status="404"}' in body
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/api/surfboards",le="+Inf"}' in body
+        assert 'cache_entries{cache="products"}' in body
+        print("✓ /metrics exposes request counts by route template")
+
+
+class TestProfiling:
+    """Test admin-triggered request profiling"""
+    
+    async def test_flag_ignored_without_admin_token(self, client, admin):
+        """Test X-Profile from anyone but an admin serves the request unprofiled"""
+        for headers in ({"X-Profile": "text"}, {"X-Profile": "text", "Authorization": admin["Authorization"][:-2] + "xx"}):
+            response = await client.get("/api/surfboards", headers=headers)
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/json"
+            assert "x-profile-id" not in response.headers
+        
+        response = await client.get("/api/surfboards?profile=html")
+        assert response.json() == []
+        assert "x-profile-id" not in response.headers
+        print("✓ Profiling flag ignored without an admin token")
+    
+    async def test_store_mode_keeps_report(self, client, admin):
+        """Test store mode serves the normal response and keeps the report for /api/profiles"""
+        response = await client.get("/api/surfboards", headers={**admin, "X-Profile": "store"})
+        assert response.status_code == 200
+        assert response.json() == []
+        profile_id = response.headers["x-profile-id"]
+        
+        listed = (await client.get("/api/profiles", headers=admin)).json()
+        report = next(report for report in listed if report["id"] == profile_id)
+        assert (report["method"], report["path"], report["status"]) == ("GET", "/api/surfboards", 200)
+        assert "text" not in report
+        
+        response = await client.get(f"/api/profiles/{profile_id}", headers=admin)
+        assert response.headers["content-type"].startswith("text/html")
+        response = await client.get(f"/api/profiles/{profile_id}?format=text", headers=admin)
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.text
+        
+        assert (await client.get("/api/profiles/missing", headers=admin)).status_code == 404
+        assert (await client.get(f"/api/profiles/{profile_id}")).status_code == 401
+        print(f"✓ Stored profile {profile_id} served as HTML and text")
+    
+    async def test_html_and_text_modes_replace_body(self, client, admin):
+        """Test html and text modes answer with the report instead of the response"""
+        response = await client.get("/api/surfboards?profile=html", headers=admin)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "text/html; charset=utf-8"
+        assert "<html" in response.text.lower()
+        
+        response = await client.get("/api/surfboards", headers={**admin, "X-Profile": "text"})
+        assert response.headers["content-type"] == "text/plain; charset=utf-8"
+        assert "x-profile-id" in response.headers
+        assert not response.text.startswith("[")
+        print("✓ HTML and text modes return the report")
+
+
 class TestProducts:
     """Test product CRUD endpoints"""
     
-    def test_get_products(self):
+    async def test_get_products(self, client):
         """Test /api/products returns product list"""
-        response = requests.get(f"{BASE_URL}/api/products")
+        response = await client.get("/api/products")
         assert response.status_code == 200
         data = response.json()
         
@@ -107,7 +301,7 @@ class TestProducts:
             assert "category" in product
             print(f"✓ First product: {product['name']} - R$ {product['price']}")
     
-    def test_create_and_delete_product(self):
+    async def test_create_and_delete_product(self, client, admin):
         """Test product creation and deletion"""
         # Create product
         test_product = {
@@ -118,7 +312,7 @@ class TestProducts:
             "stock": 10
         }
         
-        create_response = requests.post(f"{BASE_URL}/api/products", json=test_product)
+        create_response = await client.post("/api/products", json=test_product, headers=admin)
         assert create_response.status_code == 200
         created = create_response.json()
         
@@ -127,18 +321,231 @@ class TestProducts:
         product_id = created["id"]
         print(f"✓ Created test product: {created['name']} (ID: {product_id})")
         
+        # Fetch single product
+        get_response = await client.get(f"/api/products/{product_id}")
+        assert get_response.status_code == 200
+        assert get_response.json()["name"] == test_product["name"]
+        print(f"✓ Fetched single product: {product_id}")
+        
         # Delete product
-        delete_response = requests.delete(f"{BASE_URL}/api/products/{product_id}")
+        delete_response = await client.delete(f"/api/products/{product_id}", headers=admin)
         assert delete_response.status_code == 200
         print(f"✓ Deleted test product: {product_id}")
+        
+        # Deleted product must not be served from cache
+        missing_response = await client.get(f"/api/products/{product_id}")
+        assert missing_response.status_code == 404
+        print("✓ Deleted product no longer served")
+    
+    async def test_product_list_cache_follows_writes(self, client, admin):
+        """Test the cached /api/products list is refreshed by creates and deletes"""
+        assert (await client.get("/api/products")).json() == []
+        
+        product_id = (await client.post("/api/products", json={
+            "name": "TEST_Parafina",
+            "description": "Test product for the list cache",
+            "price": 15.00,
+            "category": "test",
+            "stock": 5
+        }, headers=admin)).json()["id"]
+        assert [p["id"] for p in (await client.get("/api/products")).json()] == [product_id]
+        
+        await client.delete(f"/api/products/{product_id}", headers=admin)
+        assert (await client.get("/api/products")).json() == []
+        print("✓ Product list cache invalidated on create and delete")
+    
+    async def test_product_list_compressed(self, client, admin):
+        """Test the product list is sent gzip-compressed to clients that accept it"""
+        for i in range(10):
+            await client.post("/api/products", json={
+                "name": f"TEST_Leash_{i}",
+                "description": "Test product for response compression",
+                "price": 39.90,
+                "category": "test",
+                "stock": 5
+            }, headers=admin)
+        
+        response = await client.get("/api/products", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 10
+        
+        response = await client.get("/api/products", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert len(response.json()) == 10
+        print(f"✓ Product list sent as {response.headers['content-length']} bytes uncompressed, gzip on request")
+    
+    async def test_batch_products_refreshes_caches(self, client, admin):
+        """Test /api/products/batch updates the product list, product cache and cart prices"""
+        product = {"name": "TEST_Quilha", "description": "Test product for batches", "price": 80.0, "category": "test", "stock": 3}
+        product_id = (await client.post("/api/products", json=product, headers=admin)).json()["id"]
+        assert (await client.get(f"/api/products/{product_id}")).json()["price"] == 80.0
+        
+        response = await client.post("/api/products/batch", json={"operations": [
+            {"op": "update", "id": product_id, "data": {**product, "price": 60.0}},
+            {"op": "create", "data": {**product, "name": "TEST_Deck"}},
+        ]}, headers=admin)
+        assert response.json()["applied"] == 2
+        
+        assert (await client.get(f"/api/products/{product_id}")).json()["price"] == 60.0
+        assert sorted(p["name"] for p in (await client.get("/api/products")).json()) == ["TEST_Deck", "TEST_Quilha"]
+        quote = (await client.post("/api/cart/quote", json={"items": [{"product_id": product_id, "quantity": 1}]})).json()
+        assert quote["total"] == 60.0
+        print("✓ Batch update visible in the list, product cache and price book")
+
+
+class TestCartPricing:
+    """Test server-side cart pricing"""
+    
+    async def test_quote_prices_from_catalog(self, client, admin):
+        """Test /api/cart/quote uses catalog prices and checks stock"""
+        test_product = {
+            "name": f"TEST_Wetsuit_{uuid.uuid4().hex[:8]}",
+            "description": "Test product for cart pricing",
+            "price": 49.90,
+            "category": "test",
+            "stock": 2
+        }
+        product_id = (await client.post("/api/products", json=test_product, headers=admin)).json()["id"]
+        
+        try:
+            quote_response = await client.post("/api/cart/quote", json={
+                "items": [{"product_id": product_id, "quantity": 2}]
+            })
+            assert quote_response.status_code == 200
+            assert quote_response.json()["total"] == 99.80
+            print("✓ Cart quote priced from catalog: R$ 99.80")
+            
+            over_response = await client.post("/api/cart/quote", json={
+                "items": [{"product_id": product_id, "quantity": 3}]
+            })
+            assert over_response.status_code == 409
+            print("✓ Cart quote rejected quantity above stock")
+        finally:
+            await client.delete(f"/api/products/{product_id}", headers=admin)
+    
+    async def test_checkout_holds_stock(self, client, admin):
+        """Test /api/payments/checkout opens a session and reserves stock"""
+        product_id = (await client.post("/api/products", json={
+            "name": f"TEST_Leash_{uuid.uuid4().hex[:8]}",
+            "description": "Test product for checkout",
+            "price": 59.90,
+            "category": "test",
+            "stock": 3
+        }, headers=admin)).json()["id"]
+        
+        checkout_response = await client.post("/api/payments/checkout", json={
+            "items": [{"product_id": product_id, "quantity": 2}],
+            "origin_url": "http://test"
+        })
+        assert checkout_response.status_code == 200
+        session_id = checkout_response.json()["session_id"]
+        
+        status_response = await client.get(f"/api/payments/status/{session_id}")
+        assert status_response.status_code == 200
+        assert (await client.get(f"/api/products/{product_id}")).json()["stock"] == 1
+        print(f"✓ Checkout session {session_id[:16]}... holds 2 units")
+
+
+class TestPaymentStatus:
+    """Test the payment status cache and the Stripe poll backoff"""
+    
+    async def _checkout(self, client, admin):
+        product_id = (await client.post("/api/products", json={
+            "name": f"TEST_Lycra_{uuid.uuid4().hex[:8]}",
+            "description": "Test product for payment polls",
+            "price": 89.90,
+            "category": "test",
+            "stock": 5
+        }, headers=admin)).json()["id"]
+        response = await client.post("/api/payments/checkout", json={
+            "items": [{"product_id": product_id, "quantity": 1}],
+            "origin_url": "http://test"
+        })
+        return response.json()["session_id"]
+    
+    async def test_terminal_status_answered_locally(self, client, admin, server, monkeypatch):
+        """Test a paid session is answered from the cache, then from the stored transaction, without Stripe"""
+        from bench.fake_stripe import FakeStripeCheckout
+        monkeypatch.setattr(FakeStripeCheckout, "polls_until_paid", 1)
+        session_id = await self._checkout(client, admin)
+        
+        assert (await client.get(f"/api/payments/status/{session_id}")).json()["payment_status"] == "paid"
+        stripe_calls = FakeStripeCheckout.calls["get_checkout_status"]
+        for _ in range(3):
+            assert (await client.get(f"/api/payments/status/{session_id}")).json()["payment_status"] == "paid"
+        server.payment_status_cache.clear()
+        assert (await client.get(f"/api/payments/status/{session_id}")).json()["payment_status"] == "paid"
+        
+        assert FakeStripeCheckout.calls["get_checkout_status"] == stripe_calls
+        print("✓ Paid session answered locally after the first Stripe lookup")
+    
+    async def test_poll_to_paid_settles_order(self, client, admin, server, monkeypatch):
+        """Test a status poll that finds the session paid marks the order paid and commits the stock hold"""
+        from bench.fake_stripe import FakeStripeCheckout
+        monkeypatch.setattr(FakeStripeCheckout, "polls_until_paid", 1)
+        session_id = await self._checkout(client, admin)
+        
+        assert (await client.get(f"/api/payments/status/{session_id}")).json()["payment_status"] == "paid"
+        order = await server.db.orders.find_one({"session_id": session_id})
+        assert order["status"] == "paid"
+        transaction = await server.db.payment_transactions.find_one({"session_id": session_id})
+        hold = await server.db.stock_holds.find_one({"id": transaction["hold_id"]})
+        assert hold["status"] == "committed"
+        print("✓ Polling to paid settled the order and the stock hold")
+    
+    async def test_pending_polls_back_off(self, client, admin, server, monkeypatch):
+        """Test repeated polls of a pending session reach Stripe only once the backoff interval has passed"""
+        from bench.fake_stripe import FakeStripeCheckout
+        import payments
+        monkeypatch.setattr(FakeStripeCheckout, "polls_until_paid", 100)
+        monkeypatch.setattr(server, "payment_poll_backoff", payments.PollBackoff(base=0.2, maximum=10))
+        session_id = await self._checkout(client, admin)
+        stripe_calls = FakeStripeCheckout.calls["get_checkout_status"]
+        
+        for _ in range(3):
+            assert (await client.get(f"/api/payments/status/{session_id}")).json()["payment_status"] == "unpaid"
+        assert FakeStripeCheckout.calls["get_checkout_status"] == stripe_calls + 1
+        
+        await asyncio.sleep(0.25)
+        for _ in range(3):
+            await client.get(f"/api/payments/status/{session_id}")
+        assert FakeStripeCheckout.calls["get_checkout_status"] == stripe_calls + 2
+        print("✓ Pending session polled at Stripe twice for six client polls")
+    
+    async def test_unknown_session_not_looked_up(self, client):
+        """Test a session id with no local transaction is a 404 and never reaches Stripe"""
+        from bench.fake_stripe import FakeStripeCheckout
+        stripe_calls = FakeStripeCheckout.calls["get_checkout_status"]
+        for i in range(5):
+            response = await client.get(f"/api/payments/status/cs_test_unknown_{i}")
+            assert response.status_code == 404
+        assert FakeStripeCheckout.calls["get_checkout_status"] == stripe_calls
+        print("✓ Unknown session ids answered 404 without calling Stripe")
+    
+    def test_backoff_doubles_up_to_maximum(self):
+        """Test PollBackoff doubles the delay after each lookup and caps it"""
+        import payments
+        backoff = payments.PollBackoff(base=1, maximum=4)
+        assert backoff.should_poll("cs_1", now=100)
+        delays = []
+        now = 100.0
+        for _ in range(4):
+            backoff.record("cs_1", now=now)
+            delay = next(d for d in range(1, 10) if backoff.should_poll("cs_1", now=now + d))
+            assert not backoff.should_poll("cs_1", now=now + delay - 0.5)
+            delays.append(delay)
+            now += delay
+        assert delays == [1, 2, 4, 4]
+        backoff.forget("cs_1")
+        assert backoff.should_poll("cs_1", now=now)
 
 
 class TestSurfboards:
     """Test surfboard CRUD endpoints"""
     
-    def test_get_surfboards(self):
+    async def test_get_surfboards(self, client):
         """Test /api/surfboards returns surfboard list"""
-        response = requests.get(f"{BASE_URL}/api/surfboards")
+        response = await client.get("/api/surfboards")
         assert response.status_code == 200
         data = response.json()
         
@@ -153,7 +560,7 @@ class TestSurfboards:
             assert "status" in board
             print(f"✓ First board: {board['name']} - R$ {board['hourly_rate']}/hora")
     
-    def test_create_and_delete_surfboard(self):
+    async def test_create_and_delete_surfboard(self, client, admin):
         """Test surfboard creation and deletion"""
         # Create surfboard
         test_board = {
@@ -161,7 +568,7 @@ class TestSurfboards:
             "hourly_rate": 35.00
         }
         
-        create_response = requests.post(f"{BASE_URL}/api/surfboards", json=test_board)
+        create_response = await client.post("/api/surfboards", json=test_board, headers=admin)
         assert create_response.status_code == 200
         created = create_response.json()
         
@@ -171,17 +578,194 @@ class TestSurfboards:
         print(f"✓ Created test board: {created['name']} (ID: {board_id})")
         
         # Delete surfboard
-        delete_response = requests.delete(f"{BASE_URL}/api/surfboards/{board_id}")
+        delete_response = await client.delete(f"/api/surfboards/{board_id}", headers=admin)
         assert delete_response.status_code == 200
         print(f"✓ Deleted test board: {board_id}")
+    
+    async def test_batch_surfboards(self, client, admin):
+        """Test /api/surfboards/batch reports each operation and stops ordered batches at a failure"""
+        board_id = (await client.post("/api/surfboards", json={"name": "TEST_Board", "hourly_rate": 30.0},
+                                      headers=admin)).json()["id"]
+        operations = [
+            {"op": "create", "data": {"name": "TEST_Longboard", "hourly_rate": 40.0}},
+            {"op": "update", "id": board_id, "data": {"name": "TEST_Board", "hourly_rate": 35.0}},
+            {"op": "update", "id": "missing", "data": {"name": "TEST_Ghost", "hourly_rate": 10.0}},
+            {"op": "create", "data": {"name": "TEST_No_Rate"}},
+            {"op": "delete", "id": board_id},
+        ]
+        
+        response = await client.post("/api/surfboards/batch", json={"operations": operations}, headers=admin)
+        assert response.status_code == 200
+        report = response.json()
+        assert [r["status"] for r in report["results"]] == ["created", "updated", "not_found", "skipped", "skipped"]
+        assert report["applied"] == 2
+        
+        response = await client.post("/api/surfboards/batch", json={"operations": operations, "ordered": False},
+                                     headers=admin)
+        report = response.json()
+        assert [r["status"] for r in report["results"]] == ["created", "updated", "not_found", "invalid", "deleted"]
+        assert "hourly_rate" in report["results"][3]["error"]
+        
+        boards = (await client.get("/api/surfboards")).json()
+        assert sorted(board["name"] for board in boards) == ["TEST_Longboard", "TEST_Longboard"]
+        print("✓ Ordered batch stopped at the missing board, unordered batch applied the rest")
+
+
+class TestCatalog:
+    """Test bulk catalog import and export"""
+    
+    async def test_import_products_csv(self, client, admin):
+        """Test a CSV import validates every row, honours dry runs and reports row errors"""
+        body = (
+            "name,description,price,category,stock\n"
+            'TEST_Parafina,"Parafina para água quente,\nbase e topo",15.00,acessorios,40\n'
+            "TEST_Leash,Leash 6 pés,sem preço,acessorios,5\n"
+            "TEST_Deck,Deck antiderrapante,120,acessorios,\n"
+        )
+        headers = {**admin, "Content-Type": "text/csv"}
+        
+        response = await client.post("/api/catalog/products/import?dry_run=true", content=body, headers=headers)
+        report = response.json()
+        assert (report["rows"], report["valid"], report["inserted"]) == (3, 2, 0)
+        assert report["errors"][0]["row"] == 2 and "price" in report["errors"][0]["error"]
+        assert (await client.get("/api/products")).json() == []
+        
+        report = (await client.post("/api/catalog/products/import", content=body, headers=headers)).json()
+        assert (report["valid"], report["invalid"], report["inserted"]) == (2, 1, 2)
+        products = {p["name"]: p for p in (await client.get("/api/products")).json()}
+        assert products["TEST_Parafina"]["description"] == "Parafina para água quente,\nbase e topo"
+        assert products["TEST_Deck"]["stock"] == 0
+        quote = await client.post("/api/cart/quote", json={"items": [{"product_id": products["TEST_Parafina"]["id"], "quantity": 2}]})
+        assert quote.json()["total"] == 30.0
+        print(f"✓ Imported {report['inserted']} products, reported {report['invalid']} bad row")
+    
+    async def test_export_and_reimport(self, client, admin):
+        """Test an exported catalog imports back as updates, and JSON Lines imports create boards"""
+        body = '{"name": "TEST_Fish", "hourly_rate": 30}\n{"name": "TEST_Gun", "hourly_rate": 45}\n'
+        report = (await client.post("/api/catalog/surfboards/import", content=body,
+                                    headers={**admin, "Content-Type": "application/x-ndjson"})).json()
+        assert report["inserted"] == 2
+        boards = (await client.get("/api/surfboards")).json()
+        assert {board["status"] for board in boards} == {"available"}
+        
+        response = await client.get("/api/catalog/surfboards/export?format=csv", headers=admin)
+        assert response.headers["content-type"].startswith("text/csv")
+        exported = response.text
+        assert exported.splitlines()[0] == "name,hourly_rate,image_url,id"
+        
+        report = (await client.post("/api/catalog/surfboards/import", content=exported.replace(",30.0,", ",35.0,"),
+                                    headers={**admin, "Content-Type": "text/csv"})).json()
+        assert (report["inserted"], report["updated"]) == (0, 2)
+        rates = sorted(board["hourly_rate"] for board in (await client.get("/api/surfboards")).json())
+        assert rates == [35.0, 45.0]
+        print("✓ Exported boards imported back as updates")
+    
+    async def test_import_json_array_and_invalid_rows(self, client, admin):
+        """Test JSON arrays import, and row errors are reported with their row numbers"""
+        rows = [
+            {"name": "TEST_Fish", "hourly_rate": 30},
+            {"name": "TEST_Sem_Preco"},
+            {"name": "TEST_Gun", "hourly_rate": "caro"},
+            {"name": "TEST_Longboard", "hourly_rate": 50, "image_url": "/uploads/long.jpg"},
+        ]
+        headers = {**admin, "Content-Type": "application/json"}
+        report = (await client.post("/api/catalog/surfboards/import?dry_run=true", json=rows, headers=admin)).json()
+        assert (report["dry_run"], report["rows"], report["valid"], report["invalid"]) == (True, 4, 2, 2)
+        assert [error["row"] for error in report["errors"]] == [2, 3]
+        assert (await client.get("/api/surfboards")).json() == []
+        
+        report = (await client.post("/api/catalog/surfboards/import", json=rows, headers=headers)).json()
+        assert (report["inserted"], report["updated"], report["errors_truncated"]) == (2, 0, False)
+        assert sorted(board["name"] for board in (await client.get("/api/surfboards")).json()) == ["TEST_Fish", "TEST_Longboard"]
+        
+        response = await client.post("/api/catalog/surfboards/import", content='{"name": "TEST_Fish"}', headers=headers)
+        assert response.status_code == 400
+        response = await client.post("/api/catalog/surfboards/import", content="[{", headers=headers)
+        assert response.status_code == 400
+        print("✓ JSON array imported, bad rows and bodies reported")
+    
+    async def test_malformed_csv_and_jsonl_rows(self, client, admin):
+        """Test extra CSV columns and broken JSON lines fail only their own row"""
+        csv_body = "name,hourly_rate\nTEST_Fish,30\nTEST_Gun,45,extra\n\nTEST_Mini,25\n"
+        report = (await client.post("/api/catalog/surfboards/import", content=csv_body,
+                                    headers={**admin, "Content-Type": "text/csv"})).json()
+        assert (report["rows"], report["inserted"]) == (3, 2)
+        assert report["errors"] == [{"row": 2, "error": "3 columns, header has 2"}]
+        
+        jsonl_body = '{"name": "TEST_Egg", "hourly_rate": 28}\n{"name": "TEST_Twin",\n{"name": "TEST_Bonzer", "hourly_rate": 33}\n'
+        report = (await client.post("/api/catalog/surfboards/import?format=jsonl", content=jsonl_body, headers=admin)).json()
+        assert (report["rows"], report["inserted"], report["invalid"]) == (3, 2, 1)
+        assert report["errors"][0]["row"] == 2 and report["errors"][0]["error"].startswith("invalid JSON")
+        print("✓ Malformed rows rejected individually")
+    
+    async def test_write_errors_counted(self, client, admin, server):
+        """Test rows the database rejects are reported as invalid, not inserted"""
+        await server.db.surfboards.create_index("name", unique=True)
+        await client.post("/api/surfboards", json={"name": "TEST_Fish", "hourly_rate": 30.0}, headers=admin)
+        
+        body = '{"name": "TEST_Gun", "hourly_rate": 45}\n{"name": "TEST_Fish", "hourly_rate": 32}\n{"name": "TEST_Egg", "hourly_rate": 28}\n'
+        report = (await client.post("/api/catalog/surfboards/import", content=body,
+                                    headers={**admin, "Content-Type": "application/x-ndjson"})).json()
+        assert (report["rows"], report["valid"], report["invalid"], report["inserted"]) == (3, 2, 1, 2)
+        assert report["errors"][0]["row"] == 2
+        assert len((await client.get("/api/surfboards")).json()) == 3
+        print("✓ Duplicate key reported as a row error")
+    
+    async def test_product_round_trip_refreshes_prices(self, client, admin):
+        """Test exported products import back unchanged, and price changes reach cart quotes"""
+        product = (await client.post("/api/products", json={
+            "name": "TEST_Quilha", "description": "Quilhas FCS II", "price": 180.0, "category": "acessorios", "stock": 8,
+        }, headers=admin)).json()
+        cart = {"items": [{"product_id": product["id"], "quantity": 1}]}
+        assert (await client.post("/api/cart/quote", json=cart)).json()["total"] == 180.0
+        
+        for format in ("jsonl", "json"):
+            exported = (await client.get(f"/api/catalog/products/export?format={format}", headers=admin)).content
+            report = (await client.post(f"/api/catalog/products/import?format={format}", content=exported, headers=admin)).json()
+            assert (report["valid"], report["inserted"], report["updated"]) == (1, 0, 1)
+        stored = (await client.get(f"/api/products/{product['id']}")).json()
+        assert {key: stored[key] for key in product if key != "created_at"} == \
+            {key: product[key] for key in product if key != "created_at"}
+        
+        exported = (await client.get("/api/catalog/products/export?format=json", headers=admin)).json()
+        exported[0]["price"] = 150.0
+        await client.post("/api/catalog/products/import", json=exported, headers=admin)
+        assert (await client.post("/api/cart/quote", json=cart)).json()["total"] == 150.0
+        assert (await client.get(f"/api/products/{product['id']}")).json()["price"] == 150.0
+        print("✓ Products round-tripped and the price book refreshed")
+    
+    async def test_partial_rows_keep_current_values(self, client, admin):
+        """Test empty cells and missing columns leave existing fields alone, and default on create"""
+        product = (await client.post("/api/products", json={
+            "name": "TEST_Wetsuit", "description": "3/2mm", "price": 450.0, "category": "roupas", "stock": 7,
+            "image_url": "/uploads/wetsuit.jpg",
+        }, headers=admin)).json()
+        headers = {**admin, "Content-Type": "text/csv"}
+        
+        body = f"id,name,description,price,category,stock,image_url\n{product['id']},TEST_Wetsuit,3/2mm,420,roupas,,\n"
+        report = (await client.post("/api/catalog/products/import", content=body, headers=headers)).json()
+        assert (report["valid"], report["updated"]) == (1, 1)
+        stored = (await client.get(f"/api/products/{product['id']}")).json()
+        assert (stored["price"], stored["stock"], stored["image_url"]) == (420.0, 7, "/uploads/wetsuit.jpg")
+        assert stored["created_at"][:26] == product["created_at"][:26]
+        
+        body = f"id,name,description,price,category\n{product['id']},TEST_Wetsuit,3/2mm,399,roupas\nnew-1,TEST_Lycra,UV,90,roupas\n"
+        report = (await client.post("/api/catalog/products/import", content=body, headers=headers)).json()
+        assert (report["inserted"], report["updated"]) == (1, 1)
+        stored = (await client.get(f"/api/products/{product['id']}")).json()
+        assert (stored["price"], stored["stock"]) == (399.0, 7)
+        created = (await client.get("/api/products/new-1")).json()
+        assert (created["stock"], created["image_url"]) == (0, None)
+        assert "created_at" in created
+        print("✓ Partial rows kept stock and image, new ids got defaults")
 
 
 class TestAuthentication:
     """Test authentication endpoints"""
     
-    def test_login_success(self):
+    async def test_login_success(self, client, admin):
         """Test successful login with admin/admin123"""
-        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        response = await client.post("/api/auth/login", json={
             "username": "admin",
             "password": "admin123"
         })
@@ -190,44 +774,114 @@ class TestAuthentication:
         
         assert data["success"] == True
         assert data["username"] == "admin"
+        assert "token" in data
         print("✓ Login successful with admin/admin123")
     
-    def test_login_invalid_credentials(self):
+    async def test_login_invalid_credentials(self, client):
         """Test login with invalid credentials"""
-        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        response = await client.post("/api/auth/login", json={
             "username": "invalid",
             "password": "wrongpassword"
         })
         assert response.status_code == 401
         print("✓ Login correctly rejected invalid credentials")
+    
+    async def test_unknown_user_costs_a_bcrypt_check(self, client, admin, server, monkeypatch):
+        """Test an unknown username does the same bcrypt work as a wrong password"""
+        checks = []
+        check = server.password_hasher._check_sync
+        monkeypatch.setattr(server.password_hasher, "_check_sync", lambda *args: checks.append(args) or check(*args))
+        
+        response = await client.post("/api/auth/login", json={"username": "nobody", "password": "admin123"})
+        assert response.status_code == 401
+        assert (await client.post("/api/auth/login", json={"username": "admin", "password": "wrong"})).status_code == 401
+        assert len(checks) == 2
+        print("✓ Unknown username checked against a dummy hash")
+    
+    async def test_plaintext_password_migrated_to_bcrypt(self, client, server):
+        """Test a pre-bcrypt account logs in and has its password hashed"""
+        await server.db.users.insert_one({"id": str(uuid.uuid4()), "username": "legacy", "password_hash": "surf2019"})
+        
+        response = await client.post("/api/auth/login", json={"username": "legacy", "password": "surf2019"})
+        assert response.status_code == 200
+        user = await server.db.users.find_one({"username": "legacy"})
+        assert user["password_hash"].startswith("$2")
+        
+        response = await client.post("/api/auth/login", json={"username": "legacy", "password": "surf2019"})
+        assert response.status_code == 200
+        assert (await client.post("/api/auth/login", json={"username": "legacy", "password": "surf"})).status_code == 401
+        print("✓ Plaintext password rehashed with bcrypt on login")
+    
+    async def test_setup_closed_after_first_account(self, client, admin):
+        """Test only an admin can add accounts once one exists"""
+        credentials = {"username": "intruder", "password": "letmein"}
+        response = await client.post("/api/auth/setup", json=credentials)
+        assert response.status_code == 403
+        assert (await client.post("/api/auth/login", json=credentials)).status_code == 401
+        
+        response = await client.post("/api/auth/setup", json={"username": "staff", "password": "onda123"}, headers=admin)
+        assert response.status_code == 200
+        assert (await client.post("/api/auth/login", json={"username": "staff", "password": "onda123"})).status_code == 200
+        print("✓ Setup rejected anonymous callers after the first account")
+    
+    async def test_admin_endpoints_require_token(self, client, admin):
+        """Test admin endpoints reject missing and tampered tokens"""
+        response = await client.get("/api/rentals/active")
+        assert response.status_code == 401
+        
+        token = admin["Authorization"]
+        response = await client.get("/api/rentals/active", headers={"Authorization": token[:-2] + "xx"})
+        assert response.status_code == 401
+        response = await client.get("/api/rentals/active", headers={"Authorization": (token + "é").encode("latin-1")})
+        assert response.status_code == 401
+        print("✓ Admin endpoints require a valid session token")
+    
+    async def test_logout_revokes_token(self, client, admin):
+        """Test a token stops working after logout"""
+        login_response = await client.post("/api/auth/login", json={
+            "username": "admin",
+            "password": "admin123"
+        })
+        headers = {"Authorization": f"Bearer {login_response.json()['token']}"}
+        
+        assert (await client.get("/api/rentals/active", headers=headers)).status_code == 200
+        assert (await client.post("/api/auth/logout", headers=headers)).status_code == 200
+        assert (await client.get("/api/rentals/active", headers=headers)).status_code == 401
+        print("✓ Logout revoked the session token")
 
 
 class TestRentals:
     """Test rental management endpoints"""
     
-    def test_get_active_rentals(self):
+    async def test_get_active_rentals(self, client, admin):
         """Test /api/rentals/active returns active rentals"""
-        response = requests.get(f"{BASE_URL}/api/rentals/active")
+        response = await client.get("/api/rentals/active", headers=admin)
         assert response.status_code == 200
         data = response.json()
         
         assert isinstance(data, list)
         print(f"✓ Active rentals API returns {len(data)} active rentals")
     
-    def test_get_rental_history(self):
+    async def test_get_rental_history(self, client, admin):
         """Test /api/rentals/history returns rental history"""
-        response = requests.get(f"{BASE_URL}/api/rentals/history")
+        response = await client.get("/api/rentals/history", headers=admin)
         assert response.status_code == 200
         data = response.json()
         
         assert isinstance(data, list)
         print(f"✓ Rental history API returns {len(data)} completed rentals")
     
-    def test_get_rental_by_id(self):
+    async def test_get_rental_by_id(self, client, admin):
         """Test GET /api/rentals/{rental_id} returns specific rental (for receipt page)"""
-        # Use existing rental ID from test data
-        rental_id = "17546e65-7fc1-4ea0-a12f-894153c74be9"
-        response = requests.get(f"{BASE_URL}/api/rentals/{rental_id}")
+        board = (await client.post("/api/surfboards", json={"name": "TEST_ReceiptBoard", "hourly_rate": 30.0}, headers=admin)).json()
+        rental = (await client.post("/api/rentals/start", json={
+            "surfboard_id": board["id"],
+            "renter_name": "TEST_Renter",
+            "estimated_time": 60
+        }, headers=admin)).json()
+        rental_id = rental["id"]
+        await client.put(f"/api/rentals/{rental_id}", json={"action": "complete", "final_amount": 30.0}, headers=admin)
+        response = await client.get(f"/api/rentals/{rental_id}", headers=admin)
         assert response.status_code == 200
         data = response.json()
         
@@ -243,20 +897,20 @@ class TestRentals:
         print(f"✓ GET rental by ID returns: {data['renter_name']} - {data['surfboard_name']}")
         print(f"  Status: {data['status']}, Amount: R$ {data.get('final_amount', 0):.2f}")
     
-    def test_get_rental_not_found(self):
+    async def test_get_rental_not_found(self, client, admin):
         """Test GET /api/rentals/{rental_id} returns 404 for non-existent rental"""
-        response = requests.get(f"{BASE_URL}/api/rentals/non-existent-id-12345")
+        response = await client.get("/api/rentals/non-existent-id-12345", headers=admin)
         assert response.status_code == 404
         print("✓ GET rental correctly returns 404 for non-existent ID")
     
-    def test_rental_flow(self):
+    async def test_rental_flow(self, client, admin):
         """Test complete rental flow: start -> pause -> resume -> complete"""
         # First create a test surfboard
         test_board = {
             "name": f"TEST_RentalBoard_{uuid.uuid4().hex[:8]}",
             "hourly_rate": 25.00
         }
-        board_response = requests.post(f"{BASE_URL}/api/surfboards", json=test_board)
+        board_response = await client.post("/api/surfboards", json=test_board, headers=admin)
         assert board_response.status_code == 200
         board = board_response.json()
         board_id = board["id"]
@@ -269,76 +923,172 @@ class TestRentals:
                 "renter_name": "TEST_Renter",
                 "estimated_time": 60
             }
-            start_response = requests.post(f"{BASE_URL}/api/rentals/start", json=rental_data)
+            start_response = await client.post("/api/rentals/start", json=rental_data, headers=admin)
             assert start_response.status_code == 200
             rental = start_response.json()
             rental_id = rental["id"]
             print(f"✓ Started rental: {rental_id}")
             
             # Pause rental
-            pause_response = requests.put(f"{BASE_URL}/api/rentals/{rental_id}", json={"action": "pause"})
+            pause_response = await client.put(f"/api/rentals/{rental_id}", json={"action": "pause"}, headers=admin)
             assert pause_response.status_code == 200
             print("✓ Paused rental")
             
             # Resume rental
-            resume_response = requests.put(f"{BASE_URL}/api/rentals/{rental_id}", json={"action": "resume"})
+            resume_response = await client.put(f"/api/rentals/{rental_id}", json={"action": "resume"}, headers=admin)
             assert resume_response.status_code == 200
             print("✓ Resumed rental")
             
             # Complete rental
-            complete_response = requests.put(f"{BASE_URL}/api/rentals/{rental_id}", json={
+            complete_response = await client.put(f"/api/rentals/{rental_id}", json={
                 "action": "complete",
                 "final_amount": 25.00
-            })
+            }, headers=admin)
             assert complete_response.status_code == 200
             print("✓ Completed rental")
             
+            # Server-rendered receipt
+            html_response = await client.get(f"/api/rentals/{rental_id}/receipt", headers=admin)
+            assert html_response.status_code == 200
+            assert "TEST_Renter" in html_response.text
+            pdf_response = await client.get(f"/api/rentals/{rental_id}/receipt?format=pdf", headers=admin)
+            assert pdf_response.status_code == 200
+            assert pdf_response.content.startswith(b"%PDF")
+            print("✓ Rendered receipt as HTML and PDF")
+            
         finally:
             # Cleanup: delete test board
-            requests.delete(f"{BASE_URL}/api/surfboards/{board_id}")
+            await client.delete(f"/api/surfboards/{board_id}", headers=admin)
             print(f"✓ Cleaned up test board: {board_id}")
 
+    
+    async def test_receipt_follows_amount_correction(self, client, admin):
+        """Test completing a rental again with a corrected amount re-renders its cached receipt"""
+        board_id = (await client.post("/api/surfboards", json={"name": "TEST_ReceiptBoard", "hourly_rate": 25.0},
+                                      headers=admin)).json()["id"]
+        rental_id = (await client.post("/api/rentals/start", json={
+            "surfboard_id": board_id, "renter_name": "TEST_Renter", "estimated_time": 60,
+        }, headers=admin)).json()["id"]
+        
+        await client.put(f"/api/rentals/{rental_id}", json={"action": "complete", "final_amount": 25.0}, headers=admin)
+        assert "R$ 25.00" in (await client.get(f"/api/rentals/{rental_id}/receipt", headers=admin)).text
+        first_pdf = (await client.get(f"/api/rentals/{rental_id}/receipt?format=pdf", headers=admin)).content
+        
+        await client.put(f"/api/rentals/{rental_id}", json={"action": "complete", "final_amount": 40.0}, headers=admin)
+        html = (await client.get(f"/api/rentals/{rental_id}/receipt", headers=admin)).text
+        assert "R$ 40.00" in html and "R$ 25.00" not in html
+        assert (await client.get(f"/api/rentals/{rental_id}/receipt?format=pdf", headers=admin)).content != first_pdf
+        print("✓ Receipt re-rendered after the amount was corrected")
 
 class TestGallery:
     """Test gallery endpoints"""
     
-    def test_get_gallery(self):
+    async def test_get_gallery(self, client):
         """Test /api/gallery returns gallery images"""
-        response = requests.get(f"{BASE_URL}/api/gallery")
+        response = await client.get("/api/gallery")
         assert response.status_code == 200
         data = response.json()
         
         assert isinstance(data, list)
         print(f"✓ Gallery API returns {len(data)} images")
+    
+    async def test_reorder_gallery(self, client, admin):
+        """Test /api/gallery/reorder sets every image's position in one request"""
+        ids = []
+        for i in range(4):
+            response = await client.post("/api/gallery", json={"image_url": f"/uploads/test_{i}.jpg", "order": i},
+                                         headers=admin)
+            ids.append(response.json()["id"])
+        
+        response = await client.post("/api/gallery/reorder", json={"ids": ids[::-1]}, headers=admin)
+        assert response.json() == {"success": True, "updated": 4, "missing": 0}
+        assert [image["id"] for image in (await client.get("/api/gallery")).json()] == ids[::-1]
+        
+        response = await client.post("/api/gallery/reorder", json={"ids": [ids[0], ids[0]]}, headers=admin)
+        assert response.status_code == 400
+        print("✓ Gallery reordered in one request")
 
 
 class TestSettings:
     """Test settings endpoints"""
     
-    def test_get_settings(self):
+    async def test_get_settings(self, client):
         """Test /api/settings returns app settings"""
-        response = requests.get(f"{BASE_URL}/api/settings")
+        response = await client.get("/api/settings")
         assert response.status_code == 200
         data = response.json()
         
         assert "id" in data
         print(f"✓ Settings API returns configuration")
+    
+    async def test_update_settings_refreshes_cache(self, client, admin):
+        """Test PUT /api/settings is visible on the next (cached) read"""
+        await client.get("/api/settings")
+        response = await client.put("/api/settings", json={"instagram_handle": "tabatinga2surf"}, headers=admin)
+        assert response.status_code == 200
+        
+        data = (await client.get("/api/settings")).json()
+        assert data["instagram_handle"] == "tabatinga2surf"
+        print("✓ Settings cache refreshed after update")
+
+
+class TestPushSubscriptions:
+    """Test push subscription endpoints"""
+    
+    async def test_subscribe_is_idempotent(self, client, admin):
+        """Test subscribing the same endpoint twice stores it once"""
+        subscription = {
+            "endpoint": f"https://push.example.com/TEST_{uuid.uuid4().hex}",
+            "keys": {"p256dh": "test-key", "auth": "test-auth"}
+        }
+        first = await client.post("/api/push/subscribe", json=subscription, headers=admin)
+        assert first.status_code == 200
+        assert "message" not in first.json()
+        
+        second = await client.post("/api/push/subscribe", json=subscription, headers=admin)
+        assert second.status_code == 200
+        assert second.json()["message"] == "Already subscribed"
+        print("✓ Duplicate subscription was not stored twice")
+    
+    async def test_list_subscriptions_paginated(self, client, admin):
+        """Test /api/push/subscriptions pages results and hides keys"""
+        response = await client.get("/api/push/subscriptions", params={"limit": 5}, headers=admin)
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert data["limit"] == 5
+        assert len(data["items"]) <= 5
+        for sub in data["items"]:
+            assert "keys" not in sub
+        print(f"✓ Push subscriptions page returned {len(data['items'])} of {data['total']}")
 
 
 class TestNews:
     """Test news endpoint"""
     
-    def test_get_news(self):
-        """Test /api/news returns surf news"""
-        response = requests.get(f"{BASE_URL}/api/news")
+    async def test_get_news(self, client, server, monkeypatch):
+        """Test /api/news returns items from the configured feeds"""
+        monkeypatch.setattr(server, "NEWS_FEEDS", [{"url": "http://feeds.test/surf.xml", "category": "Surf"}])
+        monkeypatch.setattr(feedparser, "parse", lambda url: feedparser.api.parse(RSS_FEED))
+        response = await client.get("/api/news")
         assert response.status_code == 200
         data = response.json()
         
-        # News can be a list or error object
-        if isinstance(data, list):
-            print(f"✓ News API returns {len(data)} news items")
-        else:
-            print(f"✓ News API returned (may have error): {data}")
+        items = {item["title"]: item for item in data}
+        assert set(items) == {"Swell de leste", "Campeonato em Baía Formosa"}
+        assert items["Swell de leste"]["summary"] == "Ondas de 1,5m no fim de semana"
+        assert items["Swell de leste"]["category"] == "Surf"
+        print(f"✓ News API returns {len(data)} news items")
+    
+    async def test_news_fallback(self, client):
+        """Test /api/news falls back to static items when no feed answers"""
+        response = await client.get("/api/news")
+        assert response.status_code == 200
+        data = response.json()
+        
+        assert isinstance(data, list)
+        assert len(data) > 0
+        print(f"✓ News API falls back to {len(data)} static items")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+"""
+Session auth tests for Tabatinga2Surf
+Token verification, and revocation list sync against mongomock
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import auth  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class FlakyCollection:
+    """Wraps a collection whose first ``failures`` finds raise, like Mongo unreachable at boot"""
+
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.failures = failures
+
+    def find(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("No servers found yet")
+        return self.collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestTokenSigner:
+    """Test signed session tokens"""
+
+    def test_malformed_tokens_rejected(self):
+        """Tampered, non-ASCII and garbage tokens raise InvalidToken, never another error"""
+        signer = auth.TokenSigner(b"secret")
+        token, claims = signer.issue("admin")
+        assert signer.verify(token) == claims
+
+        payload, signature = token.split(".")
+        for bad in ("", "abc", "a.b.c", f"{payload}.{signature[:-2]}xx", f"{payload}é.{signature}",
+                    f"{payload}.{signature[:-1]}ç", "ação.token"):
+            with pytest.raises(auth.InvalidToken):
+                signer.verify(bad)
+        not_an_object = auth._b64url(b"[1]")
+        with pytest.raises(auth.InvalidToken):
+            signer.verify(f"{not_an_object}.{signer._sign(not_an_object)}")
+        print("✓ Malformed tokens rejected as invalid")
+
+
+class TestRevocationList:
+    """Test syncing revoked token ids from Mongo"""
+
+    def test_failed_first_sync_is_retried(self):
+        """start() survives a failed first sync and the loop retries it until it succeeds"""
+        async def run():
+            collection = mongomock_motor.AsyncMongoMockClient()["auth_test"].revoked_sessions
+            issued = auth.TokenSigner(b"secret").issue("admin")[1]
+            await auth.RevocationList(collection).revoke(issued)
+
+            revocations = auth.RevocationList(FlakyCollection(collection, failures=2), sync_interval=30, retry_delay=0.01)
+            await revocations.start()
+            started = (revocations.running, revocations.synced, revocations.is_revoked(issued["jti"]))
+            deadline = time.monotonic() + 2
+            while not revocations.synced and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            recovered = (revocations.running, revocations.synced, revocations.is_revoked(issued["jti"]))
+            await revocations.stop()
+            return started, recovered
+
+        started, recovered = asyncio.run(run())
+        assert started == (True, False, False)
+        assert recovered == (True, True, True)
+        print("✓ Revocations loaded on retry after a failed first sync")
@@ -0,0 +1,76 @@
+"""
+Benchmark baseline tests for Tabatinga2Surf
+Permutation p-values and the compare verdict of bench.baseline
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import baseline  # noqa: E402
+
+
+def run(rps, latency, errors=0):
+    """One bench.run report with a single scenario and endpoint"""
+    return {"scenarios": {"browse": {"throughput_rps": rps, "endpoints": {
+        "GET /api/products": {"errors": errors, "latency_ms": {"mean": latency, "p50": latency, "p95": latency, "p99": latency}},
+    }}}}
+
+
+def trials(rps, latencies, errors=0):
+    return {"name": "test", "trials": [run(r, latency, errors) for r, latency in zip(rps, latencies)]}
+
+
+class TestPermutationPValue:
+    """Test the one-sided permutation test"""
+
+    def test_separated_samples_reach_smallest_p(self):
+        """Candidate values all above the baseline give 1 / C(m + n, n)"""
+        p_value = baseline.permutation_p_value([10, 11, 12, 13], [20, 21, 22, 23], alpha=0.05)
+        assert p_value == 1 / 70
+        assert baseline.permutation_p_value([20, 21, 22, 23], [10, 11, 12, 13], alpha=0.05) == 1.0
+        print("✓ Fully separated samples give p = 1/70")
+
+    def test_too_few_trials_skipped(self):
+        """3 + 3 trials can never give p < 0.05, so no p-value is reported"""
+        assert baseline.smallest_p_value(3, 3) == 0.05
+        assert baseline.permutation_p_value([10, 11, 12], [20, 21, 22], alpha=0.05) is None
+        assert baseline.permutation_p_value([10, 11, 12], [20, 21, 22], alpha=0.1) == 0.05
+        assert baseline.permutation_p_value([10, 11, 12], [20, 21, 22, 23], alpha=0.05) == 1 / 35
+        print("✓ p-value skipped when alpha is out of reach")
+
+    def test_overlapping_samples_not_significant(self):
+        """Interleaved samples give a large p-value"""
+        p_value = baseline.permutation_p_value([10, 12, 14, 16], [11, 13, 15, 17], alpha=0.05)
+        assert p_value > 0.05
+        print(f"✓ Interleaved samples give p = {p_value:.3f}")
+
+
+class TestCompare:
+    """Test the regression verdict"""
+
+    def test_latency_regression_flagged(self):
+        """A consistent slowdown beyond the threshold regresses"""
+        result = baseline.compare(trials([100] * 4, [10, 11, 10, 11]), trials([100] * 4, [15, 16, 15, 16]),
+                                  "p95", threshold=10, alpha=0.05)
+        [row] = result["regressions"]
+        assert (row["endpoint"], row["baseline"], row["candidate"], row["p_value"]) == \
+            ("GET /api/products", 10.5, 15.5, 1 / 70)
+        print("✓ Latency regression flagged")
+
+    def test_noise_not_flagged(self):
+        """A change within the threshold, or not significant, does not regress"""
+        small = baseline.compare(trials([100] * 4, [10, 11, 10, 11]), trials([100] * 4, [10.5, 11.5, 10.5, 11.5]),
+                                 "p95", threshold=10, alpha=0.05)
+        noisy = baseline.compare(trials([100] * 4, [10, 30, 10, 30]), trials([100] * 4, [12, 31, 12, 31]),
+                                 "p95", threshold=5, alpha=0.05)
+        assert small["regressions"] == [] and noisy["regressions"] == []
+        assert noisy["results"][1]["change_pct"] > 5 and noisy["results"][1]["p_value"] > 0.05
+        print("✓ Small and noisy changes not flagged")
+
+    def test_throughput_drop_and_new_errors_flagged(self):
+        """Lower throughput and errors where there were none regress"""
+        result = baseline.compare(trials([100, 101, 102, 103], [10] * 4), trials([80, 81, 82, 83], [10] * 4, errors=1),
+                                  "p95", threshold=10, alpha=0.05)
+        flagged = {(row["metric"], row.get("new_errors")) for row in result["regressions"]}
+        assert flagged == {("throughput_rps", None), ("p95", True)}
+        print("✓ Throughput drop and new errors flagged")
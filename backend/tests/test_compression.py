@@ -0,0 +1,116 @@
+"""
+Response compression tests for Tabatinga2Surf
+Runs the middleware around small Starlette apps and checks what goes on the wire
+"""
+import gzip
+import os
+import sys
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import compression  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+TEXT = "Tabatinga, PB - ondas de 1,5m, vento terral. " * 100
+JPEG = b"\xff\xd8\xff\xe0" + os.urandom(4000)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+async def stream(request):
+    async def chunks():
+        for _ in range(10):
+            yield TEXT.encode()
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+app = compression.CompressionMiddleware(Starlette(routes=[
+    Route("/text", lambda request: PlainTextResponse(TEXT)),
+    Route("/small", lambda request: PlainTextResponse("ok")),
+    Route("/photo.jpg", lambda request: Response(JPEG, media_type="image/jpeg")),
+    Route("/stream", stream),
+]), minimum_size=500)
+
+
+async def fetch(path, accept_encoding):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            return response, raw
+
+
+class TestNegotiation:
+    """Test Accept-Encoding negotiation"""
+
+    def test_preferences(self):
+        assert compression.negotiate("") is None
+        assert compression.negotiate("gzip, deflate") == "gzip"
+        assert compression.negotiate("gzip;q=0, identity") is None
+        assert compression.negotiate("*;q=0.5") == compression.ENCODINGS[0]
+        if "br" in compression.ENCODINGS:
+            assert compression.negotiate("gzip, deflate, br") == "br"
+            assert compression.negotiate("br;q=0.5, gzip") == "gzip"
+        print("✓ Accept-Encoding negotiated")
+
+
+class TestCompressionMiddleware:
+    """Test which responses the middleware compresses"""
+
+    async def test_compresses_text(self):
+        response, raw = await fetch("/text", "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) == len(raw) < len(TEXT)
+        assert gzip.decompress(raw).decode() == TEXT
+        print(f"✓ {len(TEXT)} bytes of text sent as {len(raw)}")
+
+    async def test_skips_small_and_precompressed(self):
+        response, raw = await fetch("/small", "gzip")
+        assert "content-encoding" not in response.headers
+        assert raw == b"ok"
+
+        response, raw = await fetch("/photo.jpg", "gzip")
+        assert "content-encoding" not in response.headers
+        assert raw == JPEG
+
+        response, raw = await fetch("/text", "identity")
+        assert "content-encoding" not in response.headers
+        print("✓ Small bodies, images and identity requests left alone")
+
+    async def test_streams(self):
+        response, raw = await fetch("/stream", "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert gzip.decompress(raw).decode() == TEXT * 10
+        print("✓ Streamed response compressed chunk by chunk")
+
+
+class TestEncodedBody:
+    """Test cached bodies are compressed once per encoding"""
+
+    def test_compressed_once(self, monkeypatch):
+        calls = []
+        compress = compression.compress
+        monkeypatch.setattr(compression, "compress", lambda *args: calls.append(args[1]) or compress(*args))
+        body = compression.EncodedBody.json([{"name": "Parafina", "price": 15.0}] * 50)
+
+        for _ in range(3):
+            response = body.response("gzip", minimum_size=500)
+        assert response.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(response.body) == body.content
+        assert calls == ["gzip"]
+
+        response = body.response("", minimum_size=500)
+        assert response.body == body.content
+        assert response.headers["vary"] == "Accept-Encoding"
+        print(f"✓ {len(body.content)} bytes compressed once to {len(body.encoded('gzip'))}")
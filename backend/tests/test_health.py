@@ -0,0 +1,62 @@
+"""
+Readiness probe tests for Tabatinga2Surf
+Checks that probe bursts share one round of checks and that failures are reported
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import health  # noqa: E402
+
+
+class TestReadinessProbe:
+    """Test the /readyz probe"""
+
+    def test_concurrent_probes_share_one_round(self):
+        """A burst of probes runs the checks once per interval"""
+        calls = []
+
+        async def check():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        async def run():
+            probe = health.ReadinessProbe({"mongo": check}, min_interval=60)
+            reports = await asyncio.gather(*(probe.report() for _ in range(50)))
+            cached = await probe.report()
+            return reports, cached, probe.stats
+
+        reports, cached, stats = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(report is reports[0] for report in reports)
+        assert cached is reports[0]
+        assert stats == {"rounds": 1, "served_cached": 1}
+        print("✓ 51 probes ran the checks once")
+
+    def test_failures_and_informational_checks(self):
+        """Timeouts and errors fail readiness unless the check is informational"""
+        async def slow():
+            await asyncio.sleep(1)
+            return {"ok": True}
+
+        async def broken():
+            raise ConnectionError("connection refused")
+
+        async def upstream():
+            return {"ok": False}
+
+        async def run(checks, informational=()):
+            probe = health.ReadinessProbe(checks, min_interval=0, timeout=0.05, informational=informational)
+            return await probe.report()
+
+        report = asyncio.run(run({"mongo": slow, "feeds": broken}))
+        assert report["ready"] is False
+        assert report["checks"]["mongo"]["error"] == "timed out after 0.05s"
+        assert report["checks"]["feeds"]["error"] == "connection refused"
+
+        report = asyncio.run(run({"upstreams": upstream}, informational=("upstreams",)))
+        assert report["ready"] is True
+        assert report["checks"]["upstreams"]["ok"] is False
+        print("✓ Failing checks reported, informational ones ignored")
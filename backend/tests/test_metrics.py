@@ -0,0 +1,72 @@
+"""
+Metrics tests for Tabatinga2Surf
+Histogram buckets, label escaping and per-thread shards in the Prometheus output
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+
+
+def series(lines, prefix):
+    """Sample lines starting with ``prefix``, as {labels and name: value}"""
+    return {line.rsplit(" ", 1)[0]: line.rsplit(" ", 1)[1] for line in lines if line.startswith(prefix)}
+
+
+class TestMetrics:
+    """Test recording and exposition"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """A value on a bound counts in that bucket; larger values only in +Inf"""
+        histogram = metrics.Histogram("test_seconds", "Test latency", ("route",), buckets=(0.1, 0.5, 1.0))
+        for value in (0.05, 0.1, 0.3, 2.0):
+            histogram.observe(value, "/api/products")
+
+        lines = histogram.collect()
+        assert lines[:2] == ["# HELP test_seconds Test latency", "# TYPE test_seconds histogram"]
+        samples = series(lines, "test_seconds")
+        assert samples['test_seconds_bucket{route="/api/products",le="0.1"}'] == "2"
+        assert samples['test_seconds_bucket{route="/api/products",le="0.5"}'] == "3"
+        assert samples['test_seconds_bucket{route="/api/products",le="1.0"}'] == "3"
+        assert samples['test_seconds_bucket{route="/api/products",le="+Inf"}'] == "4"
+        assert float(samples['test_seconds_sum{route="/api/products"}']) == 2.45
+        assert samples['test_seconds_count{route="/api/products"}'] == "4"
+        print("✓ Histogram buckets cumulative with +Inf, sum and count")
+
+    def test_label_values_escaped(self):
+        """Backslashes, quotes and newlines in label values are escaped"""
+        counter = metrics.Counter("test_total", "Test counter", ("path",))
+        counter.inc('C:\\surf "board"\nquiver')
+
+        assert counter.collect()[-1] == 'test_total{path="C:\\\\surf \\"board\\"\\nquiver"} 1'
+        print("✓ Label values escaped")
+
+    def test_thread_shards_merged(self):
+        """Series recorded on several threads are summed when collected"""
+        counter = metrics.Counter("test_threads_total", "Test counter", ("status",))
+        gauge = metrics.Gauge("test_in_flight", "Test gauge")
+        histogram = metrics.Histogram("test_thread_seconds", "Test latency", buckets=(1.0,))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("200")
+                gauge.inc()
+                histogram.observe(0.5)
+            counter.inc("500")
+            gauge.dec(amount=999)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(counter._shards) == 4
+        assert series(counter.collect(), "test_threads_total") == {
+            'test_threads_total{status="200"}': "4000", 'test_threads_total{status="500"}': "4",
+        }
+        assert series(gauge.collect(), "test_in_flight") == {"test_in_flight": "4"}
+        assert series(histogram.collect(), "test_thread_seconds_count") == {"test_thread_seconds_count": "4000"}
+        print("✓ Per-thread shards merged at collection")
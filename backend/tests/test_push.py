@@ -0,0 +1,130 @@
+"""
+Push sender tests for Tabatinga2Surf
+Runs the fan-out worker against a local stand-in push service
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import struct
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import push  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def make_browser_subscription(endpoint):
+    """Create a subscription the way a browser would, keeping the private key"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public = private_key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    auth = os.urandom(16)
+    sub = {
+        "endpoint": endpoint,
+        "keys": {"p256dh": base64.b64encode(public).decode(), "auth": base64.b64encode(auth).decode()},
+    }
+    return sub, private_key, public, auth
+
+
+def decrypt(body, private_key, ua_public, auth_secret):
+    salt, (record_size, id_len) = body[:16], struct.unpack("!IB", body[16:21])
+    as_public = body[21:21 + id_len]
+    as_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), as_public)
+    ecdh_secret = private_key.exchange(ec.ECDH(), as_key)
+    prk_key = push._hkdf_extract(auth_secret, ecdh_secret)
+    ikm = push._hkdf_expand(prk_key, b"WebPush: info\x00" + ua_public + as_public, 32)
+    prk = push._hkdf_extract(salt, ikm)
+    cek = push._hkdf_expand(prk, b"Content-Encoding: aes128gcm\x00", 16)
+    nonce = push._hkdf_expand(prk, b"Content-Encoding: nonce\x00", 12)
+    plaintext = AESGCM(cek).decrypt(nonce, body[21 + id_len:], None)
+    return plaintext.rstrip(b"\x00")[:-1]
+
+
+class TestPushSender:
+    """Test batched push fan-out against a stand-in push service"""
+
+    def test_fan_out_and_prune(self):
+        """Messages decrypt on the receiving side and gone subscriptions are removed"""
+        signer = push.VapidSigner(push.b64url_encode(os.urandom(32)), "mailto:test@example.com")
+        browsers = {}
+        gone = set()
+        received = []
+
+        def push_service(request: httpx.Request):
+            assert request.headers["Content-Encoding"] == "aes128gcm"
+            assert request.headers["Authorization"].startswith("vapid t=")
+            endpoint = str(request.url)
+            if endpoint in gone:
+                return httpx.Response(410)
+            private_key, public, auth = browsers[endpoint]
+            received.append(json.loads(decrypt(request.content, private_key, public, auth)))
+            return httpx.Response(201)
+
+        async def run():
+            collection = mongomock_motor.AsyncMongoMockClient()["push_test"]["push_subscriptions"]
+            for i in range(20):
+                endpoint = f"http://push.local/send/{i}"
+                sub, private_key, public, auth = make_browser_subscription(endpoint)
+                browsers[endpoint] = (private_key, public, auth)
+                if i % 5 == 0:
+                    gone.add(endpoint)
+                await collection.insert_one(sub)
+
+            http_client = httpx.AsyncClient(transport=httpx.MockTransport(push_service))
+            sender = push.PushSender(collection, signer=signer, http_client=http_client,
+                                     concurrency=4, batch_size=8)
+            await sender.start()
+            sender.enqueue(push.PushJob(title="Atenção", body="Teste"))
+            await sender.queue.join()
+            await sender.stop()
+            await http_client.aclose()
+            return sender.stats, await collection.count_documents({})
+
+        stats, remaining = asyncio.run(run())
+        assert stats["sent"] == 16
+        assert stats["pruned"] == 4
+        assert remaining == 16
+        assert all(message["title"] == "Atenção" for message in received)
+        print(f"✓ Push fan-out sent {stats['sent']} messages and pruned {stats['pruned']} subscriptions")
+
+
+
+class TestSubscriptionIndexes:
+    """Test migrating subscriptions stored before the endpoint and TTL indexes"""
+
+    def test_duplicates_removed_and_last_seen_backfilled(self):
+        """Duplicate endpoints keep the most recently seen copy; missing last_seen_at is backfilled"""
+        async def run():
+            collection = mongomock_motor.AsyncMongoMockClient()["push_test"].push_subscriptions
+            now = datetime.now(timezone.utc)
+            await collection.insert_many([
+                {"id": "old", "endpoint": "https://push.test/a", "last_seen_at": now - timedelta(days=9)},
+                {"id": "new", "endpoint": "https://push.test/a", "last_seen_at": now - timedelta(days=1)},
+                {"id": "legacy", "endpoint": "https://push.test/b"},
+            ])
+            await push.ensure_subscription_indexes(collection, ttl=30 * 24 * 3600)
+            docs = {doc["id"]: doc async for doc in collection.find({}, {"_id": 0})}
+            indexes = await collection.index_information()
+            return docs, indexes
+
+        docs, indexes = asyncio.run(run())
+        assert set(docs) == {"new", "legacy"}
+        assert "last_seen_at" in docs["legacy"]
+        by_key = {tuple(index["key"])[0][0]: index for index in indexes.values()}
+        assert by_key["endpoint"].get("unique") is True
+        assert by_key["last_seen_at"]["expireAfterSeconds"] == 30 * 24 * 3600
+        print("✓ Duplicate subscriptions removed, last_seen_at backfilled, indexes built")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
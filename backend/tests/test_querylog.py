@@ -0,0 +1,94 @@
+"""
+Query profiler tests for Tabatinga2Surf
+Feeds synthetic command started/succeeded events to QueryProfiler
+"""
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import querylog  # noqa: E402
+
+request_ids = itertools.count(1)
+
+
+def run_command(profiler, command, reply, duration_ms=1.0, connection_id=("localhost", 27017)):
+    """Report one command to the profiler as pymongo would: started, then succeeded"""
+    started = SimpleNamespace(command_name=next(iter(command)), command=command, request_id=next(request_ids),
+                              connection_id=connection_id)
+    profiler.started(started)
+    profiler.succeeded(SimpleNamespace(command_name=started.command_name, request_id=started.request_id,
+                                       connection_id=connection_id, duration_micros=int(duration_ms * 1000),
+                                       reply=reply))
+
+
+class TestShapeOf:
+    """Test filter shapes"""
+
+    def test_values_replaced(self):
+        """Literal values become ?, keys and operators stay"""
+        assert querylog.shape_of({"session_id": "cs_123", "amount": 49.9}) == {"session_id": "?", "amount": "?"}
+        assert querylog.shape_of({}) == {}
+        print("✓ Values replaced with ?")
+
+    def test_nested_operators(self):
+        """Operators keep their structure; a list is represented by its first element"""
+        query = {
+            "payment_status": {"$in": ["pending", "unpaid"]},
+            "status": {"$nin": []},
+            "$or": [{"created_at": {"$lt": "2026-01-01"}}, {"last_checked_at": None}],
+        }
+        assert querylog.shape_of(query) == {
+            "payment_status": {"$in": ["?"]},
+            "status": {"$nin": []},
+            "$or": [{"created_at": {"$lt": "?"}}],
+        }
+        print("✓ Nested operators kept in the shape")
+
+
+class TestQueryProfiler:
+    """Test per-shape statistics"""
+
+    def test_same_shape_grouped(self):
+        """Queries differing only in values share one row"""
+        profiler = querylog.QueryProfiler()
+        for product_id, duration in (("a", 2.0), ("b", 4.0)):
+            run_command(profiler, {"find": "products", "filter": {"id": product_id}, "sort": {"name": 1}},
+                        {"cursor": {"id": 0, "firstBatch": [{"id": product_id}]}}, duration)
+
+        [row] = profiler.top()
+        assert (row["collection"], row["command"], row["filter"], row["sort"]) == \
+            ("products", "find", '{"id": "?"}', '["name"]')
+        assert (row["calls"], row["documents"], row["total_ms"], row["max_ms"], row["mean_ms"]) == (2, 2, 6.0, 4.0, 3.0)
+        print("✓ Same-shape queries grouped")
+
+    def test_get_more_credited_to_opening_query(self):
+        """getMore batches count towards the find that opened the cursor"""
+        profiler = querylog.QueryProfiler()
+        run_command(profiler, {"find": "rentals", "filter": {"status": "completed"}},
+                    {"cursor": {"id": 77, "firstBatch": [{}] * 101}})
+        run_command(profiler, {"getMore": 77, "collection": "rentals"},
+                    {"cursor": {"id": 77, "nextBatch": [{}] * 500}}, connection_id=("localhost", 27018))
+        run_command(profiler, {"getMore": 77, "collection": "rentals"},
+                    {"cursor": {"id": 0, "nextBatch": [{}] * 20}})
+        # The cursor is exhausted: another getMore with that id has no query to credit
+        run_command(profiler, {"getMore": 77, "collection": "rentals"}, {"cursor": {"id": 0, "nextBatch": []}})
+
+        rows = {row["command"]: row for row in profiler.top()}
+        assert rows["find"]["filter"] == '{"status": "?"}'
+        assert (rows["find"]["calls"], rows["find"]["documents"]) == (3, 621)
+        assert rows["getMore"]["calls"] == 1
+        print("✓ getMore batches credited to the opening find")
+
+    def test_writes_and_ignored_commands(self):
+        """Writes count documents written; handshake commands are not recorded"""
+        profiler = querylog.QueryProfiler()
+        run_command(profiler, {"update": "products", "updates": [{"q": {"id": "a", "stock": {"$gte": 2}}}]}, {"n": 1})
+        run_command(profiler, {"ping": 1}, {"ok": 1})
+
+        [row] = profiler.top()
+        assert (row["command"], row["filter"], row["documents"]) == ("update", '{"id": "?", "stock": {"$gte": "?"}}', 1)
+        profiler.reset()
+        assert profiler.top() == []
+        print("✓ Writes counted, handshakes ignored")
@@ -0,0 +1,114 @@
+"""
+Rate limiter tests for Tabatinga2Surf
+Token buckets, per-IP and route-wide rules, and the 429 response
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ratelimit  # noqa: E402
+
+
+async def ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+class TestRateLimiter:
+    """Test the token buckets"""
+
+    def test_burst_then_limited(self):
+        """Capacity requests pass, the next waits for one token"""
+        limiter = ratelimit.RateLimiter([ratelimit.Rule("POST", "/api/auth/login", capacity=3, rate=0.5)])
+
+        async def run():
+            return [await limiter.check("POST", "/api/auth/login", "10.0.0.1") for _ in range(4)]
+
+        results = asyncio.run(run())
+        assert results[:3] == [None, None, None]
+        assert 1.9 < results[3] <= 2.0
+        assert asyncio.run(limiter.check("POST", "/api/auth/login", "10.0.0.2")) is None
+        assert asyncio.run(limiter.check("GET", "/api/auth/login", "10.0.0.1")) is None
+        print("✓ Burst allowed, then limited per client IP")
+
+    def test_bucket_refills(self):
+        """Tokens come back at ``rate`` per second"""
+        limiter = ratelimit.RateLimiter([ratelimit.Rule("POST", "/api/upload", capacity=1, rate=20)])
+
+        async def run():
+            first = await limiter.check("POST", "/api/upload", "10.0.0.1")
+            second = await limiter.check("POST", "/api/upload", "10.0.0.1")
+            await asyncio.sleep(0.1)
+            return first, second, await limiter.check("POST", "/api/upload", "10.0.0.1")
+
+        first, second, refilled = asyncio.run(run())
+        assert first is None and second is not None and refilled is None
+        print("✓ Bucket refilled after waiting")
+
+    def test_rejected_request_keeps_route_tokens(self):
+        """A request refused by its per-IP rule does not use up the route-wide bucket"""
+        limiter = ratelimit.RateLimiter([
+            ratelimit.Rule("POST", "/api/payments/checkout", capacity=1, rate=0.001),
+            ratelimit.Rule("POST", "/api/payments/checkout", capacity=3, rate=0.001, scope="route"),
+        ])
+
+        async def run():
+            noisy = [await limiter.check("POST", "/api/payments/checkout", "10.0.0.1") for _ in range(10)]
+            others = [await limiter.check("POST", "/api/payments/checkout", f"10.0.1.{i}") for i in range(3)]
+            return noisy, others
+
+        noisy, others = asyncio.run(run())
+        assert noisy[0] is None and all(noisy[1:])
+        assert others[:2] == [None, None]
+        assert others[2] is not None
+        assert limiter.summary()["limited"] == 10
+        print("✓ Per-IP rejections left the route-wide tokens to other clients")
+
+
+class TestRateLimitMiddleware:
+    """Test the 429 response"""
+
+    def test_429_with_retry_after(self):
+        """An exhausted rule answers 429 with Retry-After, keyed on X-Forwarded-For"""
+        limiter = ratelimit.RateLimiter([ratelimit.Rule("POST", "/api/auth/login", capacity=1, rate=0.25)])
+        app = ratelimit.RateLimitMiddleware(ok, limiter, proxy_hops=1)
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                forwarded = {"X-Forwarded-For": "203.0.113.7"}
+                first = await client.post("/api/auth/login", headers=forwarded)
+                limited = await client.post("/api/auth/login", headers=forwarded)
+                other = await client.post("/api/auth/login", headers={"X-Forwarded-For": "203.0.113.8"})
+                unlisted = [await client.get("/api/products") for _ in range(3)]
+                return first, limited, other, unlisted
+
+        first, limited, other, unlisted = asyncio.run(run())
+        assert first.status_code == 200
+        assert limited.status_code == 429
+        assert limited.headers["retry-after"] == "4"
+        assert limited.json() == {"detail": "Too many requests"}
+        assert other.status_code == 200
+        assert all(response.status_code == 200 for response in unlisted)
+        print("✓ 429 with Retry-After for the limited client only")
+
+    def test_forwarded_for_ignored_without_proxies(self):
+        """By default clients are keyed by the socket peer, so a forged X-Forwarded-For does not help"""
+        limiter = ratelimit.RateLimiter([ratelimit.Rule("POST", "/api/auth/login", capacity=2, rate=0.01)])
+        app = ratelimit.RateLimitMiddleware(ok, limiter)
+
+        async def run():
+            transport = httpx.ASGITransport(app=app, client=("198.51.100.4", 50000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return [(await client.post("/api/auth/login", headers={"X-Forwarded-For": f"10.0.0.{i}"})).status_code
+                        for i in range(4)]
+
+        assert asyncio.run(run()) == [200, 200, 429, 429]
+        # Behind one proxy: the entry it appended, not the one the client forged
+        scope = {"headers": [(b"x-forwarded-for", b"1.2.3.4, 203.0.113.5")], "client": ("10.0.0.1", 443)}
+        assert ratelimit.client_ip(scope, 1) == "203.0.113.5"
+        assert ratelimit.client_ip(scope, 0) == "10.0.0.1"
+        print("✓ Forged X-Forwarded-For ignored without trusted proxies")
@@ -0,0 +1,112 @@
+"""
+Payment reconciler tests for Tabatinga2Surf
+Runs PaymentReconciler against mongomock with a scripted Stripe client
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reconcile  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class ScriptedStripe:
+    """Answers get_checkout_status from a dict of session id to (status, payment_status); other ids fail"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.calls = []
+
+    async def get_checkout_status(self, session_id):
+        self.calls.append(session_id)
+        if session_id not in self.sessions:
+            raise RuntimeError("Stripe unavailable")
+        status, payment_status = self.sessions[session_id]
+        return SimpleNamespace(model_dump=lambda: {
+            "status": status, "payment_status": payment_status, "amount_total": 4990, "currency": "brl", "metadata": {},
+        })
+
+
+async def make_reconciler(transactions, stripe, batch_size=500):
+    db = mongomock_motor.AsyncMongoMockClient()["reconcile_test"]
+    created_at = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    await db.payment_transactions.insert_many([
+        {"session_id": session_id, "payment_status": "pending", "status": "open", "created_at": created_at, **fields}
+        for session_id, fields in transactions.items()
+    ])
+    reconciler = reconcile.PaymentReconciler(db.payment_transactions, lambda: stripe, min_age=30, batch_size=batch_size)
+    applied = []
+
+    async def record(changed):
+        applied.append(sorted(t["session_id"] for t in changed))
+    reconciler.on_applied.append(record)
+    return db, reconciler, applied
+
+
+async def stored(db):
+    return {t["session_id"]: t async for t in db.payment_transactions.find({}, {"_id": 0})}
+
+
+class TestPaymentReconciler:
+    """Test the sweep for payments left pending by a missed webhook"""
+
+    def test_changed_unchanged_and_failed(self):
+        """Changes are written and passed to on_applied; every checked row is stamped"""
+        stripe = ScriptedStripe({"cs_paid": ("complete", "paid"), "cs_open": ("open", "pending")})
+
+        async def run():
+            db, reconciler, applied = await make_reconciler({"cs_paid": {}, "cs_open": {}, "cs_error": {}}, stripe)
+            report = await reconciler.run_once()
+            return report, applied, await stored(db)
+
+        report, applied, rows = asyncio.run(run())
+        assert (report["scanned"], report["updated"], report["errors"]) == (3, 1, 1)
+        assert applied == [["cs_paid"]]
+        assert rows["cs_paid"]["payment_status"] == "paid"
+        assert "reconciled_at" in rows["cs_paid"]
+        assert rows["cs_open"]["payment_status"] == "pending" and "reconciled_at" not in rows["cs_open"]
+        assert all("last_checked_at" in row for row in rows.values())
+        print("✓ Paid session applied, open and failed sessions stamped as checked")
+
+    def test_unsettled_rows_do_not_starve_newer_ones(self):
+        """Rows that stay pending go to the back of the queue"""
+        stripe = ScriptedStripe({"cs_new": ("complete", "paid")})
+
+        async def run():
+            db, reconciler, applied = await make_reconciler({"cs_stuck_1": {}, "cs_stuck_2": {}}, stripe, batch_size=2)
+            await reconciler.run_once()
+            await db.payment_transactions.insert_one({
+                "session_id": "cs_new", "payment_status": "pending", "status": "open",
+                "created_at": (datetime.now(timezone.utc) - timedelta(minutes=45)).isoformat(),
+            })
+            await reconciler.run_once()
+            return applied, await stored(db)
+
+        applied, rows = asyncio.run(run())
+        assert sorted(stripe.calls[:2]) == ["cs_stuck_1", "cs_stuck_2"]
+        assert "cs_new" in stripe.calls[2:]
+        assert applied[-1] == ["cs_new"]
+        assert rows["cs_new"]["payment_status"] == "paid"
+        print("✓ Newer pending payment checked ahead of ones that keep failing")
+
+    def test_complete_unpaid_and_expired_skipped(self):
+        """Sessions waiting on a delayed payment method or already expired are not polled"""
+        stripe = ScriptedStripe({})
+
+        async def run():
+            _, reconciler, _ = await make_reconciler({
+                "cs_boleto": {"status": "complete", "payment_status": "unpaid"},
+                "cs_expired": {"status": "expired"},
+            }, stripe)
+            return await reconciler.run_once()
+
+        report = asyncio.run(run())
+        assert report["scanned"] == 0
+        assert stripe.calls == []
+        print("✓ Complete/unpaid and expired sessions left to webhooks")
@@ -0,0 +1,115 @@
+"""
+Stock reservation tests for Tabatinga2Surf
+Runs StockReservations against mongomock: all-or-nothing carts, idempotent
+release and commit, and the expiry sweeper
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stock  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+async def make_reservations(**stocks):
+    db = mongomock_motor.AsyncMongoMockClient()["stock_test"]
+    await db.products.insert_many([{"id": product_id, "stock": count} for product_id, count in stocks.items()])
+    reservations = stock.StockReservations(db.products, db.stock_holds, ttl=3600)
+    changes = []
+    reservations.on_change.append(changes.append)
+    return db, reservations, changes
+
+
+async def stock_levels(db):
+    return {p["id"]: p["stock"] async for p in db.products.find({}, {"_id": 0})}
+
+
+class TestStockReservations:
+    """Test stock holds for checkout sessions"""
+
+    def test_failed_line_gives_back_the_others(self):
+        """A cart with one line short of stock reserves nothing"""
+        async def run():
+            db, reservations, changes = await make_reservations(wax=10, leash=1, fins=5)
+            with pytest.raises(stock.InsufficientStock) as error:
+                await reservations.reserve([
+                    {"product_id": "wax", "quantity": 3},
+                    {"product_id": "leash", "quantity": 2},
+                    {"product_id": "fins", "quantity": 1},
+                ])
+            hold = await db.stock_holds.find_one({"id": error.value.args[0]})
+            tagged = await db.products.count_documents({"reservations": {"$exists": True, "$ne": []}})
+            return await stock_levels(db), hold["status"], tagged, changes, reservations.stats
+
+        levels, status, tagged, changes, stats = asyncio.run(run())
+        assert levels == {"wax": 10, "leash": 1, "fins": 5}
+        assert status == "rejected"
+        assert tagged == 0
+        assert changes == []
+        assert stats["rejected"] == 1
+        print("✓ Rejected cart left every product's stock unchanged")
+
+    def test_release_is_idempotent(self):
+        """Releasing twice gives the stock back once, and a released hold can still be committed"""
+        async def run():
+            db, reservations, changes = await make_reservations(wax=10, leash=4)
+            hold_id = await reservations.reserve([
+                {"product_id": "wax", "quantity": 3},
+                {"product_id": "leash", "quantity": 1},
+            ])
+            reserved = await stock_levels(db)
+            first, second = await reservations.release(hold_id), await reservations.release(hold_id)
+            released = await stock_levels(db)
+            # Paid after the hold lapsed: the sale stands and the stock is taken again
+            committed = await reservations.commit(hold_id)
+            again = await reservations.commit(hold_id)
+            return reserved, (first, second), released, (committed, again), await stock_levels(db), changes
+
+        reserved, releases, released, commits, final, changes = asyncio.run(run())
+        assert reserved == {"wax": 7, "leash": 3}
+        assert releases == (True, False)
+        assert released == {"wax": 10, "leash": 4}
+        assert commits == (True, False)
+        assert final == {"wax": 7, "leash": 3}
+        assert changes == [{"wax": -3, "leash": -1}, {"wax": 3, "leash": 1}, {"wax": -3, "leash": -1}]
+        print("✓ Double release gave stock back once; late commit took it again")
+
+    def test_commit_then_release(self):
+        """A committed hold keeps its stock when released afterwards"""
+        async def run():
+            db, reservations, _ = await make_reservations(wax=10)
+            hold_id = await reservations.reserve([{"product_id": "wax", "quantity": 2}])
+            committed = await reservations.commit(hold_id)
+            released = await reservations.release(hold_id)
+            product = await db.products.find_one({"id": "wax"})
+            return committed, released, product
+
+        committed, released, product = asyncio.run(run())
+        assert (committed, released) == (True, False)
+        assert product["stock"] == 8
+        assert product["reservations"] == []
+        print("✓ Committed hold not released")
+
+    def test_sweep_releases_expired_holds(self):
+        """The sweeper releases holds past their TTL and leaves live ones alone"""
+        async def run():
+            db, reservations, _ = await make_reservations(wax=10)
+            expired = await reservations.reserve([{"product_id": "wax", "quantity": 2}])
+            live = await reservations.reserve([{"product_id": "wax", "quantity": 3}])
+            await db.stock_holds.update_one(
+                {"id": expired}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+            swept = await reservations.sweep()
+            swept_again = await reservations.sweep()
+            statuses = {h["id"]: h["status"] async for h in db.stock_holds.find({}, {"_id": 0})}
+            return swept, swept_again, statuses[expired], statuses[live], await stock_levels(db)
+
+        swept, swept_again, expired_status, live_status, levels = asyncio.run(run())
+        assert (swept, swept_again) == (1, 0)
+        assert (expired_status, live_status) == ("released", "held")
+        assert levels == {"wax": 7}
+        print("✓ Sweeper released the expired hold only")
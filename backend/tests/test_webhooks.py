@@ -0,0 +1,85 @@
+"""
+Webhook inbox tests for Tabatinga2Surf
+Checks deduplication of redelivered Stripe events and in-order application
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip("emergentintegrations")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+import webhooks  # noqa: E402
+
+
+def event(event_id, event_type, payment_status, session_id="cs_test_1"):
+    return SimpleNamespace(event_id=event_id, event_type=event_type, session_id=session_id,
+                           payment_status=payment_status, metadata={})
+
+
+class TestWebhookInbox:
+    """Test the Stripe webhook inbox"""
+
+    def test_duplicates_dropped_and_applied_in_order(self):
+        """Redeliveries are stored once and the latest event wins"""
+        async def run():
+            db = mongomock_motor.AsyncMongoMockClient()["webhook_test"]
+            await db.payment_transactions.insert_one({"session_id": "cs_test_1", "payment_status": "pending"})
+            inbox = webhooks.WebhookInbox(db.stripe_events, db.payment_transactions)
+            await inbox.ensure_indexes()
+
+            stored = [
+                await inbox.record(event("evt_1", "checkout.session.completed", "unpaid")),
+                await inbox.record(event("evt_1", "checkout.session.completed", "unpaid")),
+                await inbox.record(event("evt_2", "checkout.session.async_payment_succeeded", "paid")),
+            ]
+            applied = await inbox.drain_once()
+            transaction = await db.payment_transactions.find_one({"session_id": "cs_test_1"})
+            return stored, applied, transaction, await inbox.drain_once()
+
+        stored, applied, transaction, remaining = asyncio.run(run())
+        assert stored == [True, False, True]
+        assert applied == 2
+        assert remaining == 0
+        assert transaction["payment_status"] == "paid"
+        assert transaction["status"] == "complete"
+        print("✓ Duplicate webhook dropped, events applied in arrival order")
+
+
+    def test_late_events_do_not_undo_payment(self):
+        """An older or replayed non-terminal event after paid leaves the transaction paid"""
+        async def run():
+            db = mongomock_motor.AsyncMongoMockClient()["webhook_test"]
+            await db.payment_transactions.insert_many([
+                {"session_id": "cs_test_1", "payment_status": "pending"},
+                {"session_id": "cs_test_2", "payment_status": "pending"},
+            ])
+            inbox = webhooks.WebhookInbox(db.stripe_events, db.payment_transactions)
+            await inbox.ensure_indexes()
+
+            await inbox.record(event("evt_1", "checkout.session.completed", "unpaid"))
+            await inbox.record(event("evt_2", "checkout.session.async_payment_succeeded", "paid"))
+            await inbox.drain_once()
+            # evt_1 replayed, plus a retried expiry, in a later batch
+            await db.stripe_events.update_one({"event_id": "evt_1"}, {"$set": {"processed": False}})
+            await inbox.record(event("evt_3", "checkout.session.expired", "unpaid"))
+            # Out of order within one batch
+            await inbox.record(event("evt_4", "checkout.session.completed", "paid", session_id="cs_test_2"))
+            await inbox.record(event("evt_5", "checkout.session.async_payment_failed", "unpaid", session_id="cs_test_2"))
+            applied = await inbox.drain_once()
+            return applied, {t["session_id"]: t async for t in db.payment_transactions.find({}, {"_id": 0})}
+
+        applied, transactions = asyncio.run(run())
+        assert applied == 4
+        assert transactions["cs_test_1"]["payment_status"] == "paid"
+        assert transactions["cs_test_1"]["status"] == "complete"
+        assert transactions["cs_test_2"]["payment_status"] == "paid"
+        assert transactions["cs_test_2"]["event_type"] == "checkout.session.completed"
+        print("✓ Replayed and out-of-order events did not undo a payment")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,193 @@
+"""
+Stripe webhook inbox.
+
+Verified events are stored in ``stripe_events`` keyed by a unique
+``event_id`` and acknowledged straight away; redeliveries hit the unique
+index and are dropped. A background worker applies pending events to
+``payment_transactions`` in arrival order with one ``bulk_write`` per batch.
+A paid transaction stays paid: late, out-of-order or replayed events with a
+non-terminal payment status are not applied over it.
+
+Replay tool (re-applies stored events by marking them pending again):
+
+    cd backend && python webhooks.py list --pending
+    cd backend && python webhooks.py replay --session-id cs_test_123
+    cd backend && python webhooks.py replay --since 2026-01-01T00:00:00 --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import payments
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookInbox:
+    def __init__(self, events, transactions, batch_size: int = 200,
+                 poll_interval: float = 5.0, ttl: int = 30 * 24 * 3600):
+        self.events = events
+        self.transactions = transactions
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.on_applied: List[Callable[[List[Dict]], Awaitable[None]]] = []
+        self.stats = {"received": 0, "duplicates": 0, "applied": 0, "batches": 0}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self) -> None:
+        await self.events.create_index("event_id", unique=True)
+        await self.events.create_index([("processed", 1), ("received_at", 1)])
+        await self.events.create_index("received_at", name="received_at_ttl", expireAfterSeconds=self.ttl)
+
+    async def record(self, webhook_response) -> bool:
+        """Store a verified event; returns False for a redelivered event"""
+        doc = {
+            "event_id": webhook_response.event_id,
+            "event_type": webhook_response.event_type,
+            "session_id": webhook_response.session_id,
+            "payment_status": webhook_response.payment_status,
+            "metadata": getattr(webhook_response, "metadata", None) or {},
+            "received_at": datetime.now(timezone.utc),
+            "processed": False,
+        }
+        try:
+            await self.events.insert_one(doc)
+        except DuplicateKeyError:
+            self.stats["duplicates"] += 1
+            return False
+        self.stats["received"] += 1
+        self._wakeup.set()
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        # A fresh event for this loop; one waited on in an earlier loop can't be reused
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.drain_once():
+                    pass
+            except Exception as e:
+                logger.exception(f"Error applying webhook events: {e}")
+
+    async def drain_once(self) -> int:
+        """Apply one batch of pending events; returns how many were applied"""
+        events = await self.events.find(
+            {"processed": False},
+            {"_id": 0, "event_id": 1, "event_type": 1, "session_id": 1, "payment_status": 1}
+        ).sort([("received_at", 1), ("_id", 1)]).limit(self.batch_size).to_list(self.batch_size)
+        if not events:
+            return 0
+
+        # Fold events per session in arrival order; the last event wins per field,
+        # except that nothing is folded over a terminal payment status
+        updates: Dict[str, Dict] = {}
+        for event in events:
+            update = updates.setdefault(event["session_id"], {})
+            if payments.is_paid(update) and not payments.is_paid(event):
+                continue
+            update["payment_status"] = event["payment_status"]
+            update["event_type"] = event["event_type"]
+            session_status = payments.EVENT_SESSION_STATUS.get(event["event_type"])
+            if session_status:
+                update["status"] = session_status
+
+        operations = []
+        for session_id, update in updates.items():
+            query = {"session_id": session_id}
+            if not payments.is_paid(update):
+                query["payment_status"] = {"$nin": list(payments.TERMINAL_PAYMENT_STATUSES)}
+            operations.append(UpdateOne(query, {"$set": update}))
+        await self.transactions.bulk_write(operations, ordered=True)
+        await self.events.update_many(
+            {"event_id": {"$in": [event["event_id"] for event in events]}},
+            {"$set": {"processed": True, "processed_at": datetime.now(timezone.utc)}}
+        )
+        self.stats["applied"] += len(events)
+        self.stats["batches"] += 1
+
+        if self.on_applied:
+            transactions = await self.transactions.find(
+                {"session_id": {"$in": list(updates)}}, {"_id": 0}
+            ).to_list(len(updates))
+            for callback in self.on_applied:
+                await callback(transactions)
+        return len(events)
+
+
+def _replay_filter(args) -> Dict:
+    query: Dict = {}
+    if args.event_id:
+        query["event_id"] = {"$in": args.event_id}
+    if args.session_id:
+        query["session_id"] = {"$in": args.session_id}
+    if args.since:
+        since = datetime.fromisoformat(args.since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        query["received_at"] = {"$gte": since}
+    if getattr(args, "pending", False):
+        query["processed"] = False
+    return query
+
+
+async def _cli(args) -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    events = client[os.environ['DB_NAME']].stripe_events
+    query = _replay_filter(args)
+    try:
+        if args.command == "list" or args.dry_run:
+            async for event in events.find(query, {"_id": 0, "metadata": 0}).sort("received_at", 1):
+                print(f"{event['received_at']:%Y-%m-%d %H:%M:%S} {event['event_id']} {event['event_type']} "
+                      f"{event['session_id']} {event['payment_status']} processed={event['processed']}")
+            return
+        if not query:
+            raise SystemExit("Refusing to replay every event; pass --event-id, --session-id or --since")
+        result = await events.update_many(query, {"$set": {"processed": False}})
+        print(f"Marked {result.modified_count} events for replay; the running app applies them within seconds")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("--event-id", action="append")
+    parser.add_argument("--session-id", action="append")
+    parser.add_argument("--since", help="ISO timestamp (UTC if no offset)")
+    parser.add_argument("--pending", action="store_true", help="Only events not yet applied")
+    parser.add_argument("--dry-run", action="store_true", help="Show the events a replay would touch")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,15 @@
 import { createContext, useContext, useState, useEffect } from "react";
+import axios from "axios";
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+
+const setAuthHeader = (token) => {
+  if (token) {
+    axios.defaults.headers.common.Authorization = `Bearer ${token}`;
+  } else {
+    delete axios.defaults.headers.common.Authorization;
+  }
+};
 
 const AuthContext = createContext();
 
@@ -17,17 +28,44 @@ export const AuthProvider = ({ children }) => {
   useEffect(() => {
     const savedUser = localStorage.getItem("user");
     if (savedUser) {
-      setUser(JSON.parse(savedUser));
+      const parsed = JSON.parse(savedUser);
+      // Sessions from before tokens, or expired ones, need a fresh login
+      if (parsed.token && parsed.expiresAt * 1000 > Date.now()) {
+        setAuthHeader(parsed.token);
+        setUser(parsed);
+      } else {
+        localStorage.removeItem("user");
+      }
     }
     setLoading(false);
+
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      (error) => {
+        if (error.response?.status === 401 && axios.defaults.headers.common.Authorization) {
+          setAuthHeader(null);
+          setUser(null);
+          localStorage.removeItem("user");
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
   }, []);
 
   const login = (userData) => {
+    setAuthHeader(userData.token);
     setUser(userData);
     localStorage.setItem("user", JSON.stringify(userData));
   };
 
-  const logout = () => {
+  const logout = async () => {
+    try {
+      await axios.post(`${BACKEND_URL}/api/auth/logout`);
+    } catch (error) {
+      console.error("Error logging out:", error);
+    }
+    setAuthHeader(null);
     setUser(null);
     localStorage.removeItem("user");
   };
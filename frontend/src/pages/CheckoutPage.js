@@ -17,11 +17,32 @@ const CheckoutPage = () => {
   const { cart, total, clearCart } = useCart();
   const [showPixModal, setShowPixModal] = useState(false);
   const [settings, setSettings] = useState(null);
+  const [quote, setQuote] = useState(null);
 
   useEffect(() => {
     fetchSettings();
   }, []);
 
+  useEffect(() => {
+    if (cart.length > 0) {
+      fetchQuote();
+    }
+  }, [cart]);
+
+  const fetchQuote = async () => {
+    try {
+      const response = await axios.post(`${BACKEND_URL}/api/cart/quote`, {
+        items: cart.map((item) => ({ product_id: item.id, quantity: item.quantity })),
+      });
+      setQuote(response.data);
+    } catch (error) {
+      console.error("Error pricing cart:", error);
+      toast.error(error.response?.data?.detail || "Erro ao calcular o total do pedido");
+    }
+  };
+
+  const orderTotal = quote ? quote.total : total;
+
   const fetchSettings = async () => {
     try {
       const response = await axios.get(`${BACKEND_URL}/api/settings`);
@@ -37,7 +58,7 @@ const CheckoutPage = () => {
 
   const shareWhatsApp = () => {
     const items = cart.map(item => `${item.name} (${item.quantity}x) - R$ ${(item.price * item.quantity).toFixed(2)}`).join('\n');
-    const message = `*Pedido - tabatinga2surf*\n\n${items}\n\nTotal: R$ ${total.toFixed(2)}\n\nPague via PIX escaneando o QR Code!`;
+    const message = `*Pedido - tabatinga2surf*\n\n${items}\n\nTotal: R$ ${orderTotal.toFixed(2)}\n\nPague via PIX escaneando o QR Code!`;
     
     if (settings?.instagram_handle) {
       const encodedMessage = encodeURIComponent(message + `\n\nSiga-nos: @${settings.instagram_handle}`);
@@ -108,7 +129,7 @@ const CheckoutPage = () => {
                   <div className="border-t pt-4">
                     <div className="flex justify-between text-xl font-bold">
                       <span>Total</span>
-                      <span className="text-emerald-600" data-testid="checkout-total">R$ {total.toFixed(2)}</span>
+                      <span className="text-emerald-600" data-testid="checkout-total">R$ {orderTotal.toFixed(2)}</span>
                     </div>
                   </div>
                 </div>
@@ -151,7 +172,7 @@ const CheckoutPage = () => {
               <div className="text-center mb-4">
                 <p className="text-sm text-muted-foreground mb-2">Valor Total</p>
                 <p className="text-4xl font-bold text-emerald-600" data-testid="pix-total">
-                  R$ {total.toFixed(2)}
+                  R$ {orderTotal.toFixed(2)}
                 </p>
               </div>
               
@@ -29,7 +29,11 @@ const LoginPage = () => {
       });
 
       if (response.data.success) {
-        login({ username: response.data.username });
+        login({
+          username: response.data.username,
+          token: response.data.token,
+          expiresAt: response.data.expires_at,
+        });
         toast.success("Login realizado com sucesso!");
         navigate("/dashboard");
       }
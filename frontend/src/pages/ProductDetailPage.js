@@ -24,9 +24,8 @@ const ProductDetailPage = () => {
 
   const fetchProduct = async () => {
     try {
-      const response = await axios.get(`${BACKEND_URL}/api/products`);
-      const found = response.data.find((p) => p.id === id);
-      setProduct(found);
+      const response = await axios.get(`${BACKEND_URL}/api/products/${id}`);
+      setProduct(response.data);
     } catch (error) {
       console.error("Error fetching product:", error);
     } finally {
@@ -111,6 +111,22 @@ Volte sempre!
     window.print();
   };
 
+  const handleDownloadPdf = async () => {
+    // Fetched through axios so the session token is sent; window.open cannot add headers
+    try {
+      const response = await axios.get(`${BACKEND_URL}/api/rentals/${rental.id}/receipt`, {
+        params: { format: "pdf" },
+        responseType: "blob",
+      });
+      const url = URL.createObjectURL(response.data);
+      window.open(url, "_blank");
+      setTimeout(() => URL.revokeObjectURL(url), 60000);
+    } catch (error) {
+      console.error("Error downloading receipt:", error);
+      toast.error("Erro ao baixar comprovante");
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen pt-24 flex items-center justify-center">
@@ -166,6 +182,15 @@ Volte sempre!
               <Printer className="mr-2 h-4 w-4" />
               Imprimir
             </Button>
+            <Button
+              variant="outline"
+              onClick={handleDownloadPdf}
+              className="rounded-xl"
+              data-testid="download-receipt-pdf"
+            >
+              <Download className="mr-2 h-4 w-4" />
+              PDF
+            </Button>
           </div>
         </div>
 